@@ -5,6 +5,7 @@ from blockindexdirectory import *
 from blocklocalscript import *
 from blocklucasartsentertainmentcontainer import *
 from blocklucasartsfile import *
+from blockordering import *
 from blockobjectindexes import *
 from blockroom import *
 from blockroomheader import *
@@ -1,17 +1,38 @@
 import array
+import cStringIO
 import logging
 import os
-import struct
 import scummpacker_util as util
 
+class BlockSchemaCompiler(type):
+    """ Compiles each block class's "struct_data" and "xml_structure"
+    declarations once, when the class is created, so reading and writing
+    them doesn't need to interpret the declarations every time."""
+
+    def __init__(cls, name, bases, namespace):
+        super(BlockSchemaCompiler, cls).__init__(name, bases, namespace)
+        if 'struct_data' in namespace:
+            struct_data = namespace['struct_data']
+            cls._struct_codec = util.StructCodec(struct_data) if struct_data else None
+        if 'xml_structure' in namespace:
+            cls._xml_codec = util.compile_xml_structure(namespace['xml_structure'])
+
 class AbstractBlock(object):
+    __metaclass__ = BlockSchemaCompiler
     xml_structure = tuple() # placeholder
     struct_data = dict() # placeholder. Must have attributes "size", "format", and "attributes".
 
-    def __init__(self, block_name_length, crypt_value, *args, **kwds):
+    def __init__(self, block_name_length, crypt_value, context=None, *args, **kwds):
         super(AbstractBlock, self).__init__(*args, **kwds)
         self.block_name_length = block_name_length
         self.crypt_value = crypt_value
+        self.context = context # the scummpacker_control.PackContext this block belongs to
+
+    def __getstate__(self):
+        """ Blocks are pickled (e.g. by the index cache) without their context."""
+        state = self.__dict__.copy()
+        state["context"] = None
+        return state
 
     def load_from_resource(self, resource, room_start=0):
         start = resource.tell()
@@ -19,6 +40,33 @@ class AbstractBlock(object):
         #logging.debug("%s loading from room start %s" % (self.name, room_start))
         self._read_data(resource, start, True, room_start)
 
+    def stream_to_file(self, resource, path, block_writer):
+        """ Loads this block from the resource, then hands it to block_writer
+        (see scummpacker_io.BlockWriter) to be saved to path.
+
+        Containers can override this to hand over their children as soon as
+        each one has been read."""
+        self.load_from_resource(resource)
+        block_writer.save(self, path)
+
+    def stream_to_resource(self, path, resource):
+        """ Loads this block from path, then saves it to the resource.
+
+        Containers can override this to load each child only when it's about
+        to be saved."""
+        self.load_from_file(path)
+        self.save_to_resource(resource)
+
+    def read_header_from_resource(self, resource):
+        """ Reads just the name and size of this block, leaving the resource at
+        the start of the block's data."""
+        self._read_header(resource, True)
+
+    def write_header_to_resource(self, resource):
+        """ Writes just the name and size of this block, e.g. to correct the
+        size of a block already in the resource."""
+        self._write_header(resource, True)
+
     def skip_from_resource(self, resource, room_start=0):
         start = resource.tell()
         self._read_header(resource, True)
@@ -30,6 +78,35 @@ class AbstractBlock(object):
         self._write_header(resource, True)
         self._write_data(resource, True)
 
+    def compute_size(self):
+        """ Returns the number of bytes save_to_resource will write.
+
+        Containers override this to work out their size from their children
+        before writing anything, so their header can be written first."""
+        return self.size
+
+    def _get_header_size(self):
+        header = cStringIO.StringIO()
+        self._write_dummy_header(header, False)
+        return len(header.getvalue())
+
+    def _check_planned_size(self, resource, start):
+        """ Makes sure the block just written from start matches the size
+        worked out by compute_size. If it doesn't, the header is rewritten
+        with the real size, which needs a seekable resource."""
+        end = resource.tell()
+        if end - start == self.size:
+            return
+        logging.warning('Block "%s" at offset %d was planned to be %d bytes, but %d bytes were written.' %
+                        (self.name, start, self.size, end - start))
+        self.size = end - start
+        try:
+            resource.seek(start)
+        except IOError:
+            raise util.ScummPackerException('Can not correct the size of block "%s" in a resource that can not seek.' % self.name)
+        self._write_header(resource, True)
+        resource.seek(end)
+
     def _read_header(self, resource, decrypt):
         # Different in old format resources
         raise NotImplementedError("This method must be overriden by a concrete class.")
@@ -52,20 +129,27 @@ class AbstractBlock(object):
 
     def _read_raw_data(self, resource, size, decrypt):
         data = array.array('B')
-        data.fromfile(resource, size)
+        if hasattr(resource, "read_view"):
+            # Resource buffers can hand over their data without an extra copy.
+            raw = resource.read_view(size)
+        else:
+            raw = resource.read(size)
+        if len(raw) < size:
+            raise EOFError("Block \"%s\" wanted %d bytes of data but only %d were left." % (self.name, size, len(raw)))
+        data.fromstring(raw)
         if decrypt:
             data = util.crypt(data, self.crypt_value)
         return data
 
     def load_from_file(self, path):
-        block_file = file(path, 'rb')
+        block_file = self.context.storage.open_read(path)
         start = block_file.tell()
         self._read_header(block_file, False)
         self._read_data(block_file, start, False)
         block_file.close()
 
     def save_to_file(self, path):
-        outfile = file(os.path.join(path, self.generate_file_name()), 'wb')
+        outfile = self.context.storage.open_write(os.path.join(path, self.generate_file_name()))
         self._write_header(outfile, False)
         self._write_data(outfile, False)
         outfile.close()
@@ -85,7 +169,7 @@ class AbstractBlock(object):
         data_out = data
         if encrypt:
             data_out = util.crypt(data_out, self.crypt_value)
-        data_out.tofile(outfile)
+        outfile.write(data_out.tostring())
 
     def generate_file_name(self):
         return self.name + ".dmp"
@@ -99,7 +183,7 @@ class AbstractBlock(object):
         Not used by every block. To use it, the "xml_structure" property
         should be populated, and this method must be specifically called,
         either from a containing block, or from the "save_to_file" method."""
-        util.xml_helper.write(self, parent_node, self.xml_structure)
+        self._get_xml_codec().write(self, parent_node)
 
     def read_xml_node(self, parent_node):
         """ Reads data from the given root node.
@@ -107,7 +191,14 @@ class AbstractBlock(object):
         Not used by every block. To use it, the "xml_structure" property
         should be populated, and this method must be specifically called,
         either from a containing block, or from the "load_from_file" method."""
-        util.xml_helper.read(self, parent_node, self.xml_structure)
+        self._get_xml_codec().read(self, parent_node)
+
+    def _get_xml_codec(self):
+        codec = self._xml_codec
+        if codec.structure is not self.xml_structure:
+            # Overridden on the instance, so it wasn't compiled with the class.
+            codec = util.compile_xml_structure(self.xml_structure)
+        return codec
 
     def write_struct_data(self, struct_data, resource, encrypt):
         """ Saves struct-packed data to the given resource.
@@ -115,14 +206,12 @@ class AbstractBlock(object):
         Not used by every block. To use it, the "struct_data" property
         should be populated, and this method must be specifically called,
         either from a containing block, or from the "save_to_resource" method."""
-        s_size = struct_data['size']
-        s_format = struct_data['format']
-        s_attributes = struct_data['attributes']
-
-        data = struct.pack(s_format, *[getattr(self, a) for a in s_attributes])
+        codec = self._struct_codec
+        if codec is None or codec.struct_data is not struct_data:
+            codec = util.StructCodec(struct_data)
+        data = codec.pack_from(self)
         if encrypt:
             data = util.crypt(data, self.crypt_value)
-        assert len(data) == s_size
         resource.write(data)
 
     def read_struct_data(self, struct_data, resource, decrypt):
@@ -131,16 +220,11 @@ class AbstractBlock(object):
         Not used by every block. To use it, the "xml_structure" property
         should be populated, and this method must be specifically called,
         either from a containing block, or from the "load_from_resource" method."""
-        s_size = struct_data['size']
-        s_format = struct_data['format']
-        s_attributes = struct_data['attributes']
-
-        data = resource.read(s_size)
+        codec = self._struct_codec
+        if codec is None or codec.struct_data is not struct_data:
+            codec = util.StructCodec(struct_data)
+        data = resource.read(codec.size)
         if decrypt:
             data = util.crypt(data, self.crypt_value)
-        values = struct.unpack(s_format, data)
-        del data
-
-        for a, v in zip(s_attributes, values):
-            setattr(self, a, v)
+        codec.unpack_into(self, data)
 
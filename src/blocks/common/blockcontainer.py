@@ -1,24 +1,32 @@
 import xml.etree.ElementTree as et
+import bisect
 import logging
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 from abstractblock import AbstractBlock
+from blockordering import get_rank_map, OrderPositionCache
 
 class BlockContainer(AbstractBlock):
     block_ordering = [
         # To be overridden in version-specific deriving classes.
     ]
+    _size_planned = False
+    children_start = 0 # bytes of data between the header and the first child
 
     def __init__(self, *args, **kwds):
         super(BlockContainer, self).__init__(*args, **kwds)
         self.children = []
         self.order_map = {}
+        # Sort keys of the children, kept in step with self.children.
+        self._child_keys = []
+        self._keyed_children = None
+        self._keyed_order_map = None
+        self._order_positions = OrderPositionCache()
 
     def _read_data(self, resource, start, decrypt, room_start=0):
         end = start + self.size
         while resource.tell() < end:
-            block = control.block_dispatcher.dispatch_next_block(resource)
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
             block.load_from_resource(resource, room_start)
             self.append(block)
 
@@ -32,41 +40,51 @@ class BlockContainer(AbstractBlock):
         return rank_lookup_name
 
     def _find_block_rank(self, block):
-        rank_lookup_name = self._find_block_rank_lookup_name(block)
+        return self._find_rank(self._find_block_rank_lookup_name(block))
+
+    def _find_rank(self, rank_lookup_name):
         try:
-            block_rank = self.block_ordering.index(rank_lookup_name) # requires all block types are listed
-        except ValueError:
+            block_rank = get_rank_map(self.block_ordering)[rank_lookup_name] # requires all block types are listed
+        except KeyError:
             logging.error("Oops! The container block '%s' doesn't know how to order blocks of type '%s'! Get me a developer, STAT!" %
                         (self.name, rank_lookup_name))
             raise util.ScummPackerException("Unknown block wanted to be ranked/ordered: %s" % rank_lookup_name)
         return block_rank
 
     def append(self, block):
-        """Maintains sorted order for children."""
+        """Maintains sorted order for children.
+
+        Children are sorted by the rank of their block type, then by the
+        position of their index in the order map for that block type. Blocks
+        with no known order go after the ordered blocks of the same type, in
+        the order they were added."""
+        child_keys = self._get_child_keys()
+        block_key = self._block_sort_key(block)
+        i = bisect.bisect_right(child_keys, block_key)
+        child_keys.insert(i, block_key)
+        self.children.insert(i, block)
+
+    def _block_sort_key(self, block):
         rank_lookup_name = self._find_block_rank_lookup_name(block)
-        block_rank = self._find_block_rank(block)
-
-        for i, c in enumerate(self.children):
-            c_rank = self._find_block_rank(c)
-            # Same block type, so look for a specified order for this block type.
-            if c_rank == block_rank:
-                if not rank_lookup_name in self.order_map:
-                    continue # no order specified, continue iteration, appending after all existing blocks of this type
-                order_list = self.order_map[rank_lookup_name]
-                if not block.index in order_list:
-                    continue # if the order of the added block is not known, append after existing blocks
-                if not c.index in order_list:
-                    self.children.insert(i, block)
-                    return # if existing block has no order but new block done, insert new block before unordered block.
-                block_order = order_list.index(block.index)
-                c_order = order_list.index(c.index)
-                if c_order > block_order:
-                    self.children.insert(i, block)
-                    return # existing block comes after block being added
-            elif c_rank > block_rank:
-                self.children.insert(i, block)
-                return
-        self.children.append(block)
+        block_rank = self._find_rank(rank_lookup_name)
+        positions = self._order_positions.get(self.order_map, rank_lookup_name)
+        if positions is not None:
+            block_order = positions.get(getattr(block, "index", None))
+            if block_order is not None:
+                return (block_rank, 0, block_order)
+        return (block_rank, 1)
+
+    def _get_child_keys(self):
+        """ Returns the sort keys of the current children, recalculating them if
+        the children or the order map have been replaced or changed."""
+        if self._keyed_children is not self.children or \
+           self._keyed_order_map is not self.order_map or \
+           len(self._child_keys) != len(self.children):
+            self._order_positions.clear()
+            self._child_keys = [self._block_sort_key(c) for c in self.children]
+            self._keyed_children = self.children
+            self._keyed_order_map = self.order_map
+        return self._child_keys
 
     def save_to_file(self, path):
         newpath = self._create_directory(path)
@@ -75,8 +93,7 @@ class BlockContainer(AbstractBlock):
 
     def _create_directory(self, start_path):
         newpath = os.path.join(start_path, self.generate_file_name())
-        if not os.path.isdir(newpath):
-            os.mkdir(newpath) # throws an exception if can't create dir
+        self.context.storage.makedir(newpath)
         return newpath
 
     def _save_children(self, path):
@@ -103,31 +120,35 @@ class BlockContainer(AbstractBlock):
             return
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "order.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "order.xml"))
 
     def load_from_file(self, path):
         self.name = os.path.split(path)[1]
         self.children = []
         self.order_map = {}
 
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
         if "order.xml" in file_list:
             file_list.remove("order.xml")
             self._load_order_from_xml(os.path.join(path, "order.xml"))
 
         for f in file_list:
-            b = control.file_dispatcher.dispatch_next_block(f)
+            b = self.context.file_dispatcher.dispatch_next_block(f)
             if b != None:
-                b.load_from_file(os.path.join(path, f))
-                self.append(b)
+                self.append(self._load_child_from_file(b, os.path.join(path, f)))
+
+    def _load_child_from_file(self, block, path):
+        """ Returns the block to append to this container's children."""
+        block.load_from_file(path)
+        return block
 
     def _load_order_from_xml(self, path):
-        if not os.path.isfile(path):
+        if not self.context.storage.isfile(path):
             # If order.xml does not exist, use whatever order we want.
             # Should not get here...
             return
 
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         order_map = {}
@@ -141,22 +162,22 @@ class BlockContainer(AbstractBlock):
 
         self.order_map = order_map
 
+    def compute_size(self):
+        self.size = self._get_header_size() + sum([c.compute_size() for c in self.children])
+        # Saving this block straight after planning it doesn't need to plan it again.
+        self._size_planned = True
+        return self.size
+
     def save_to_resource(self, resource, room_start=0):
         start = resource.tell()
+        if not self._size_planned:
+            self.compute_size()
+        self._size_planned = False
 
-        # write dummy header
-        self._write_dummy_header(resource, True)
-        # process children
+        self._write_header(resource, True)
         for c in self.children:
             c.save_to_resource(resource, room_start)
-
-        # go back and write size of block
-        end = resource.tell()
-        self.size = end - start
-        resource.flush()
-        resource.seek(start, os.SEEK_SET)
-        self._write_header(resource, True)
-        resource.seek(end, os.SEEK_SET)
+        self._check_planned_size(resource, start)
 
     def generate_file_name(self):
         return self.name
@@ -1,6 +1,5 @@
 import logging
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 from abstractblock import AbstractBlock
 
@@ -17,27 +16,26 @@ class BlockGloballyIndexed(AbstractBlock):
     def load_from_resource(self, resource, room_start=0):
         location = resource.tell()
         super(BlockGloballyIndexed, self).load_from_resource(resource, room_start)
-        try:
-            self._lookup_index(location, room_start)
-        except util.ScummPackerUnrecognisedIndexException, suie:
+        self.index = self.lookup_index(location, room_start)
+        if self.index is None:
             logging.debug("name: %s" % self.name)
             self._handle_unknown_index(location, room_start)
 
-    def _lookup_index(self, location, room_start):
-        room_num = control.global_index_map.get_index(self.lf_name, (control.disk_spanning_counter, room_start))
-        room_offset = control.global_index_map.get_index(self.room_offset_name, room_num)
-        self.index = control.global_index_map.get_index(self.lookup_name,
-                                                         (room_num, location - room_offset))
+    def lookup_index(self, location, room_start):
+        """ Returns the index of the block at location, or None if the index
+        file has no entry for it."""
+        return self.context.global_index_map.find_block_index(self.lf_name, self.room_offset_name, self.lookup_name,
+                                                         self.context.disk_spanning_counter, room_start, location)
 
     def _handle_unknown_index(self, location, room_start):
-        room_num = control.global_index_map.get_index(self.lf_name, (control.disk_spanning_counter, room_start))
+        room_num, room_offset = self.context.global_index_map.get_room(self.lf_name, self.room_offset_name,
+                                                                  self.context.disk_spanning_counter, room_start)
         logging.debug("Unknown block at room num: %s" % room_num)
-        room_offset = control.global_index_map.get_index(self.room_offset_name, room_num)
         logging.debug("Unknown block at room offset: %s" % str(location - room_offset))
         logging.error(("Block \"%s\" at offset %s has no entry in the index file (.000). " +
                       "It can not be re-packed or used in the game.") % (self.name, location))
         self.is_unknown = True
-        self.index = control.unknown_blocks_counter.get_next_index(self.lookup_name)
+        self.index = self.context.unknown_blocks_counter.get_next_index(self.lookup_name)
 
     def save_to_resource(self, resource, room_start=0):
         # Look up the start of the current ROOM block, store
@@ -49,24 +47,30 @@ class BlockGloballyIndexed(AbstractBlock):
         super(BlockGloballyIndexed, self).save_to_resource(resource, room_start)
 
     def _map_index(self, location, room_start):
-        room_num = control.global_index_map.get_index(self.lf_name, (control.disk_spanning_counter, room_start))
-        room_offset = control.global_index_map.get_index(self.room_offset_name, room_num)
-        control.global_index_map.map_index(self.lookup_name,
+        room_num, room_offset = self.context.global_index_map.get_room(self.lf_name, self.room_offset_name,
+                                                                  self.context.disk_spanning_counter, room_start)
+        self.context.global_index_map.map_index(self.lookup_name,
                                            (room_num, location - room_offset),
                                            self.index)
 
     def load_from_file(self, path):
         """ Assumes we won't get any 'unknown' blocks, based on the regex in the file walker."""
-        if os.path.isdir(path):
-            index = os.path.split(path)[1][-3:]
+        self.load_name_from_file(path)
+        super(BlockGloballyIndexed, self).load_from_file(path)
+
+    def load_name_from_file(self, path):
+        """ Sets the name and index from the file name, without loading the
+        block. The name is read again from the block's header when it's loaded."""
+        fname = os.path.split(path)[1]
+        if self.context.storage.isdir(path):
+            index = fname[-3:]
         else:
-            fname = os.path.split(path)[1]
             index = os.path.splitext(fname)[0][-3:]
+        self.name = fname.split('_')[0]
         try:
             self.index = int(index)
         except ValueError, ve:
-            raise util.ScummPackerException(str(self.index) + " is an invalid index for resource " + path)
-        super(BlockGloballyIndexed, self).load_from_file(path)
+            raise util.ScummPackerException(str(index) + " is an invalid index for resource " + path)
 
     def generate_file_name(self):
         return (self.name
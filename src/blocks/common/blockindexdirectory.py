@@ -1,5 +1,5 @@
 import logging
-import scummpacker_control as control
+import os
 import scummpacker_util as util
 from abstractblock import AbstractBlock
 
@@ -9,8 +9,41 @@ class BlockIndexDirectory(AbstractBlock):
     MIN_ENTRIES = NotImplementedError("This property must be overridden by inheriting classes.")
 
     def _read_data(self, resource, start, decrypt, room_start=0):
+        crypt_value = (self.crypt_value if decrypt else None)
+        num_items = util.str2int(resource.read(2), crypt_val=crypt_value)
+        room_nums, offsets = self._read_table(resource, num_items, crypt_value)
+        for i, key in enumerate(zip(room_nums, offsets)):
+            self.context.global_index_map.map_index(self.DIR_TYPES[self.name], key, i)
+
+    def _read_table(self, resource, num_items, crypt_value):
+        """ Returns the room number and offset of each item."""
         raise NotImplementedError("This method must be overridden by inheriting classes.")
 
+    def shift_offsets_in_resource(self, resource, room_num, after, delta):
+        """ Used when a block has been patched in place. Reads this directory
+        from the resource, moves the items in room_num that start after
+        "after" (relative to the room) by delta, and writes it back over
+        itself."""
+        self._read_header(resource, True)
+        num_items = util.str2int(resource.read(2), crypt_val=self.crypt_value)
+        table_start = resource.tell()
+        room_nums, offsets = self._read_table(resource, num_items, self.crypt_value)
+        item_map = {}
+        for i, (item_room_num, offset) in enumerate(zip(room_nums, offsets)):
+            if item_room_num == room_num and offset > after:
+                offset += delta
+            item_map[i] = (item_room_num, offset)
+        resource.seek(table_start, os.SEEK_SET)
+        self._save_table_data(resource, num_items, item_map)
+
+    def get_limits(self):
+        """ Returns how many entries this directory has in the original
+        game, keyed by the lookup name of the resources it indexes."""
+        min_entries = self.MIN_ENTRIES.get(self.context.global_args.game, {})
+        if not self.name in min_entries:
+            return {}
+        return {self.DIR_TYPES[self.name] : min_entries[self.name]}
+
     def save_to_file(self, path):
         """This block is generated when saving to a resource."""
         return
@@ -18,21 +51,19 @@ class BlockIndexDirectory(AbstractBlock):
     def save_to_resource(self, resource, room_start=0):
         # is room_start required? nah, just there for interface compliance.
         #for i, key in enumerate()
-        items = control.global_index_map.items(self.DIR_TYPES[self.name])
+        table = self.context.global_index_map.get_table(self.DIR_TYPES[self.name])
         item_map = {}
-        if len(items) == 0:
+        if len(table) == 0:
             logging.info("No indexes found for block type \"" + self.name + "\" - are there any files of this block type?")
-            num_items = self.MIN_ENTRIES[control.global_args.game][self.name]
+            num_items = self.MIN_ENTRIES[self.context.global_args.game][self.name]
         else:
-            items.sort(cmp=lambda x, y: cmp(x[1], y[1])) # sort by resource number
+            # Map of resource number -> room number/offset
+            item_map = table.reverse_map()
             # Need to pad items out, so take last entry's number as the number of items
-            num_items = items[-1][1]
-            if self.name in self.MIN_ENTRIES[control.global_args.game] and \
-               num_items < self.MIN_ENTRIES[control.global_args.game][self.name]:
-                num_items = self.MIN_ENTRIES[control.global_args.game][self.name]
-            # Create map with reversed key/value pairs
-            for i, j in items:
-                item_map[j] = i
+            num_items = max(item_map)
+            if self.name in self.MIN_ENTRIES[self.context.global_args.game] and \
+               num_items < self.MIN_ENTRIES[self.context.global_args.game][self.name]:
+                num_items = self.MIN_ENTRIES[self.context.global_args.game][self.name]
 
         # Bleeech
         self.size = 5 * num_items + 2 + self.block_name_length + 4
@@ -42,18 +73,8 @@ class BlockIndexDirectory(AbstractBlock):
         self._save_table_data(resource, num_items, item_map)
 
     def _save_table_data(self, resource, num_items, item_map):
-        for i in xrange(num_items):
-            if not i in item_map:
-                # write dummy values for unused item numbers.
-                resource.write(util.int2str(0, 1, crypt_val=self.crypt_value))
-            else:
-                room_num, _ = item_map[i]
-                resource.write(util.int2str(room_num, 1, crypt_val=self.crypt_value))
-        for i in xrange(num_items):
-            if not i in item_map:
-                # write dummy values for unused item numbers.
-                resource.write(util.int2str(0, 4, crypt_val=self.crypt_value))
-            else:
-                _, offset = item_map[i]
-                resource.write(util.int2str(offset, 4, crypt_val=self.crypt_value))
+        # write dummy values for unused item numbers.
+        entries = [item_map.get(i, (0, 0)) for i in xrange(num_items)]
+        resource.write(util.ints2str([room_num for room_num, _ in entries], 'B', crypt_val=self.crypt_value))
+        resource.write(util.ints2str([offset for _, offset in entries], 'I', crypt_val=self.crypt_value))
 
@@ -1,44 +1,303 @@
+import cStringIO
 import os
+import scummpacker_io
+import scummpacker_util as util
 from blockcontainer import BlockContainer
+from blocklucasartsfile import BlockLucasartsFile
+
+class SavedBlockPlaceholder(object):
+    """ Stands in for a child block that has been handed to a BlockWriter,
+    keeping just enough to order it and list it in order.xml."""
+    def __init__(self, name, index=None):
+        self.name = name
+        self.index = index
+
+    def save_to_file(self, path):
+        pass # already saved
+
+    def __repr__(self):
+        return "[" + self.name + " (saved)]"
+
+class UnloadedBlockPlaceholder(object):
+    """ Stands in for an LFLF/LF block that hasn't been loaded from its
+    directory yet. The block is only loaded when it's saved to the resource,
+    and is dropped straight afterwards."""
+    def __init__(self, block, path):
+        block.load_name_from_file(path)
+        self.name = block.name
+        self.index = block.index
+        self.context = block.context
+        self.block = block
+        self.path = path
+        self._loaded = False
+
+    def compute_size(self):
+        """ Loads the block early, so it can be planned."""
+        if not self._loaded:
+            self.block.load_from_file(self.path)
+            self._loaded = True
+        return self.block.compute_size()
+
+    def map_planned_location(self, location):
+        self.block.map_planned_location(location)
+
+    def save_to_resource(self, resource, room_start=0):
+        block, self.block = self.block, None
+        if not self._loaded:
+            block.load_from_file(self.path)
+        block.save_to_resource(resource, room_start)
+
+    def __repr__(self):
+        return "[" + self.name + ":" + str(self.index).zfill(3) + " (not loaded)]"
+
+class PackedBlockPlaceholder(object):
+    """ Stands in for an LFLF/LF block that has been saved to a separate
+    buffer, starting at offset 0. When saved to the resource, it takes the next
+    (data, index_entries) pair from packed_rooms, writes the data, and maps the
+    index entries, moving the room's own offsets to where it was written.
+
+    Index entries are (map name, key, index) tuples. The only absolute offsets
+    are the LFLF/LF location and the ROOM/FO offset; everything else in a room
+    is stored relative to those."""
+    def __init__(self, block, packed_rooms, offset_class):
+        self.name = block.name
+        self.index = block.index
+        self.context = block.context
+        self.packed_rooms = packed_rooms
+        self.offset_class = offset_class
+        self._packed_room = None
+        self.location = None # where it was written, once saved
+        self.size = None
+
+    def _get_packed_room(self):
+        if self._packed_room is None:
+            self._packed_room = self.packed_rooms.next()
+        return self._packed_room
+
+    def compute_size(self):
+        """ Takes this room from packed_rooms early, so it can be planned."""
+        return len(self._get_packed_room()[0])
+
+    def map_planned_location(self, location):
+        self._map_index_entries(location)
+
+    def save_to_resource(self, resource, room_start=0):
+        location = resource.tell()
+        data = self._get_packed_room()[0]
+        resource.write(data)
+        self._map_index_entries(location)
+        self._packed_room = None
+        self.location = location
+        self.size = len(data)
+
+    def _map_index_entries(self, location):
+        for map_name, key, index in self._get_packed_room()[1]:
+            if map_name == self.offset_class.LFLF_NAME:
+                disk_number, lf_offset = key
+                key = (disk_number, lf_offset + location)
+            elif map_name == self.offset_class.ROOM_OFFSET_NAME:
+                index += location
+            self.context.global_index_map.map_index(map_name, key, index)
+
+    def __repr__(self):
+        return "[" + self.name + ":" + str(self.index).zfill(3) + " (packed)]"
 
 class BlockLucasartsEntertainmentContainer(BlockContainer):
     def __init__(self, *args, **kwds):
         super(BlockLucasartsEntertainmentContainer, self).__init__(*args, **kwds)
+        self._stream_target = None # (output path, BlockWriter) while streaming
+        self._defer_loading = False
         self._init_class_data()
 
     def _init_class_data(self):
         self.name = NotImplementedError("This property must be overridden by inheriting classes.")
         self.OFFSET_CLASS = NotImplementedError("This property must be overridden by inheriting classes.")
 
+    def stream_to_file(self, resource, path, block_writer):
+        """ Hands each child (e.g. each LFLF) to block_writer as soon as it has
+        been read, and keeps only a placeholder for it. This means only a few
+        rooms are held in memory at once, rather than the whole disk."""
+        self._stream_target = (self._create_directory(path), block_writer)
+        try:
+            self.load_from_resource(resource)
+        finally:
+            self._stream_target = None
+        # Placeholders don't save anything, so this just writes order.xml.
+        block_writer.save(self, path)
+
+    def _read_data(self, resource, start, decrypt, room_start=0):
+        if self._stream_target is None:
+            super(BlockLucasartsEntertainmentContainer, self)._read_data(resource, start, decrypt, room_start)
+            return
+        newpath, block_writer = self._stream_target
+        end = start + self.size
+        while resource.tell() < end:
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
+            block.load_from_resource(resource, room_start)
+            self.append(SavedBlockPlaceholder(block.name, getattr(block, "index", None)))
+            block_writer.save(block, newpath)
+            del block
+
+    def find_rooms_in_resource(self, resource, path):
+        """ Used to read rooms in parallel. Reads this block's header and its
+        room offsets (LOFF/FO) block, which maps the location of every room in
+        the global index map, and creates the output directory. The rooms
+        themselves are skipped over.
+
+        Returns the output directory, and the location of each room."""
+        self.children = []
+        start = resource.tell()
+        self._read_header(resource, True)
+        end = start + self.size
+        locations = []
+        while resource.tell() < end:
+            location = resource.tell()
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
+            if isinstance(block, self.OFFSET_CLASS):
+                block.load_from_resource(resource)
+                self.append(block)
+            else:
+                block.read_header_from_resource(resource)
+                resource.seek(location + block.size, os.SEEK_SET)
+                locations.append(location)
+        return self._create_directory(path), locations
+
+    def read_room_offsets(self, resource):
+        """ Used to extract single resources. Reads this block's header and
+        its room offsets (LOFF/FO) block, which maps the location of every room
+        in the global index map, without reading anything after it.
+
+        Returns the location of the room offsets block."""
+        self.children = []
+        start = resource.tell()
+        self._read_header(resource, True)
+        end = start + self.size
+        while resource.tell() < end:
+            location = resource.tell()
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
+            if isinstance(block, self.OFFSET_CLASS):
+                block.load_from_resource(resource)
+                self.append(block)
+                return location
+            block.read_header_from_resource(resource)
+            resource.seek(location + block.size, os.SEEK_SET)
+        raise util.ScummPackerException("No room offsets block found in resource: %s" % resource.name)
+
+    def add_saved_rooms(self, rooms):
+        """ Adds placeholders for rooms that have been read and saved elsewhere,
+        given as (name, index) pairs, so save_to_file can write order.xml."""
+        for name, index in rooms:
+            self.append(SavedBlockPlaceholder(name, index))
+
     def load_from_file(self, path):
         # assume input path is actually the directory containing the LECF dir
         super(BlockLucasartsEntertainmentContainer, self).load_from_file(os.path.join(path, self.name))
 
+    def stream_to_resource(self, path, resource):
+        """ Loads each room (LFLF/LF) from its directory only when it's written
+        to the resource, so only one room is held in memory at once. The rooms'
+        offsets are still mapped in the global index map as they're written."""
+        self._defer_loading = True
+        try:
+            self.load_from_file(path)
+        finally:
+            self._defer_loading = False
+        self.save_to_resource(resource)
+        self.children = []
+
+    def find_rooms_in_files(self, path):
+        """ Used to pack rooms in parallel. Finds the room (LFLF/LF) directories
+        without loading them, and returns their paths in the order they'll be
+        written."""
+        self._defer_loading = True
+        try:
+            self.load_from_file(path)
+        finally:
+            self._defer_loading = False
+        return [c.path for c in self.children if isinstance(c, UnloadedBlockPlaceholder)]
+
+    def save_packed_rooms_to_resource(self, resource, packed_rooms):
+        """ Saves this block, using rooms that were saved to separate buffers.
+        packed_rooms gives a (data, index_entries) pair for each path returned
+        by find_rooms_in_files, in the same order (see PackedBlockPlaceholder).
+
+        Returns the location and size each room was written at, in the same
+        order."""
+        packed_rooms = iter(packed_rooms)
+        self.children = [PackedBlockPlaceholder(c, packed_rooms, self.OFFSET_CLASS)
+                         if isinstance(c, UnloadedBlockPlaceholder) else c
+                         for c in self.children]
+        self.save_to_resource(resource)
+        layout = [(c.location, c.size) for c in self.children if isinstance(c, PackedBlockPlaceholder)]
+        self.children = []
+        return layout
+
+    def _load_child_from_file(self, block, path):
+        if self._defer_loading and isinstance(block, BlockLucasartsFile):
+            return UnloadedBlockPlaceholder(block, path)
+        return super(BlockLucasartsEntertainmentContainer, self)._load_child_from_file(block, path)
+
     def save_to_resource(self, resource, room_start=0):
-        start = resource.tell()
+        """ Works out the size of every room, and where it will go, before
+        writing anything, so the header and the LOFF/FO block are written
+        first and the resource is written strictly in order.
 
-        # write dummy header
-        self._write_dummy_header(resource, True)
+        Rooms that are only loaded (or packed elsewhere) when they're saved
+        would all have to be held in memory to be planned. If the resource can
+        seek, they're written first and the header and LOFF/FO block are filled
+        in afterwards instead."""
+        start = resource.tell()
+        loff_block = self.OFFSET_CLASS(self.block_name_length, self.crypt_value, self.context)
+        # Reserves space, and sets the size of the LOFF/FO block.
+        loff_block.write_dummy_block(cStringIO.StringIO(), len(self.children))
 
-        # write dummy LOFF
-        loff_start = resource.tell()
-        loff_block = self.OFFSET_CLASS(self.block_name_length, self.crypt_value)
-        num_rooms = len(self.children)
-        loff_block.write_dummy_block(resource, num_rooms)
+        if self._has_placeholders() and scummpacker_io.is_seekable(resource):
+            self._write_dummy_header(resource, True)
+            loff_block.write_dummy_block(resource, len(self.children))
+            for c in self.children:
+                c.save_to_resource(resource, room_start)
+            self.size = resource.tell() - start
+            self._rewrite_header(resource, start, loff_block)
+            return
 
-        # process children
+        self._plan_rooms(start, loff_block)
+        self._write_header(resource, True)
+        loff_block.save_to_resource(resource, room_start)
         for c in self.children:
             c.save_to_resource(resource, room_start)
+        if resource.tell() - start != self.size:
+            # The plan was wrong, so the room offsets may be wrong too.
+            self.size = resource.tell() - start
+            try:
+                self._rewrite_header(resource, start, loff_block)
+            except IOError:
+                raise util.ScummPackerException('Can not correct the size of block "%s" in a resource that can not seek.' % self.name)
 
-        # go back and write size of LECF block (i.e. the whole ".001" file)
-        self.size = resource.tell() - start
-        resource.flush()
+    def _has_placeholders(self):
+        for c in self.children:
+            if isinstance(c, (UnloadedBlockPlaceholder, PackedBlockPlaceholder)):
+                return True
+        return False
+
+    def _plan_rooms(self, start, loff_block):
+        """ Works out this block's size, and maps where each room will be
+        saved in the global index map, for the LOFF/FO block."""
+        location = start + self._get_header_size() + loff_block.size
+        for c in self.children:
+            size = c.compute_size()
+            if hasattr(c, "map_planned_location"):
+                c.map_planned_location(location)
+            location += size
+        self.size = location - start
+
+    def _rewrite_header(self, resource, start, loff_block):
+        """ Goes back and writes the size of this block (i.e. the whole ".001"
+        file), and the LOFF/FO block, using the room offsets mapped while
+        saving the rooms."""
         end = resource.tell()
         resource.seek(start, os.SEEK_SET)
         self._write_header(resource, True)
-
-        # go back and write the LOFF block
-        loff_block.save_to_resource(resource, room_start)
+        loff_block.save_to_resource(resource)
         resource.seek(end, os.SEEK_SET)
 
     def __repr__(self):
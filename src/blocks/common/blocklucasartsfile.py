@@ -1,9 +1,9 @@
 import logging
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 from blockcontainer import BlockContainer
 from blockgloballyindexed import BlockGloballyIndexed
+from blockroom import BlockRoom
 
 class BlockLucasartsFile(BlockContainer, BlockGloballyIndexed):
     """ Anything inheriting from this class should also inherit from the concrete versions
@@ -17,47 +17,79 @@ class BlockLucasartsFile(BlockContainer, BlockGloballyIndexed):
         self._read_data(resource, location, True, location)
         try:
             # look up by location on disk
-            self.index = control.global_index_map.get_index(self.name, (control.disk_spanning_counter, location))  # TODO: confirm if this is correct
+            self.index = self.context.global_index_map.get_index(self.name, (self.context.disk_spanning_counter, location))  # TODO: confirm if this is correct
         except util.ScummPackerUnrecognisedIndexException, suie:
             logging.error(("Block \"%s\" at offset %s has no entry in the index file (.000). " +
                           "It can not be re-packed or used in the game.") % (self.name, location))
             raise suie
             self.is_unknown = True
-            self.index = control.unknown_blocks_counter.get_next_index(self.name)
+            self.index = self.context.unknown_blocks_counter.get_next_index(self.name)
 
     def save_to_resource(self, resource, room_start=0):
         location = resource.tell()
         room_start = location
         # Map the location of the LF block.
-        control.global_index_map.map_index(self.name, (control.disk_spanning_counter, location), self.index)
+        self.context.global_index_map.map_index(self.name, (self.context.disk_spanning_counter, location), self.index)
         # Map the room number to the disk number, for later use in
         # 0R/DROO blocks in the index file.
-        control.global_index_map.map_index(self.disk_lookup_name,
+        self.context.global_index_map.map_index(self.disk_lookup_name,
                                            self.index,
-                                           control.disk_spanning_counter)
+                                           self.context.disk_spanning_counter)
         super(BlockLucasartsFile, self).save_to_resource(resource, room_start)
 
+    def compute_size(self):
+        """ Also works out the offset of the room (ROOM/RO) from the start of
+        this block, for map_planned_location."""
+        size = self._get_header_size()
+        self._planned_room = None # (offset, room block)
+        for c in self.children:
+            if self._planned_room is None and isinstance(c, BlockRoom):
+                self._planned_room = (size, c)
+            size += c.compute_size()
+        self.size = size
+        self._size_planned = True
+        return size
+
+    def map_planned_location(self, location):
+        """ Maps the offsets this block and its room will be saved at, so
+        they're known before anything is written. compute_size must be called
+        first."""
+        self.context.global_index_map.map_index(self.name, (self.context.disk_spanning_counter, location), self.index)
+        self.context.global_index_map.map_index(self.disk_lookup_name,
+                                           self.index,
+                                           self.context.disk_spanning_counter)
+        if self._planned_room is not None:
+            room_offset, room = self._planned_room
+            self.context.global_index_map.map_index(room.room_offset_name,
+                                               self.index,
+                                               location + room_offset)
+
     def save_to_file(self, path):
         logging.info("Saving block %s" % self.generate_file_name())
         super(BlockLucasartsFile, self).save_to_file(path)
 
     def load_from_file(self, path):
-        name = os.path.split(path)[1]
-        self.name = name.split('_')[0]
-        self.index = int(name.split('_')[1])
+        self.load_name_from_file(path)
         self.children = []
 
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
         if "order.xml" in file_list:
             file_list.remove("order.xml")
             self._load_order_from_xml(os.path.join(path, "order.xml"))
 
         for f in file_list:
-            b = control.file_dispatcher.dispatch_next_block(f)
+            b = self.context.file_dispatcher.dispatch_next_block(f)
             if b != None:
                 b.load_from_file(os.path.join(path, f))
                 self.append(b)
 
+    def load_name_from_file(self, path):
+        """ Sets the name and index from the directory name, without loading
+        any children."""
+        name = os.path.split(path)[1]
+        self.name = name.split('_')[0]
+        self.index = int(name.split('_')[1])
+
     def generate_file_name(self):
         return (self.name
                 + "_"
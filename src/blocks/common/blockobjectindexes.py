@@ -8,21 +8,18 @@ class BlockObjectIndexes(AbstractBlock):
     class_data_size = NotImplementedError("This property must be overridden by inheriting classes.")
 
     def _read_data(self, resource, start, decrypt, room_start=0):
-        num_items = util.str2int(resource.read(2), crypt_val=(self.crypt_value if decrypt else None))
-        self.objects = []
-        # Read all owner+state values
-        for _ in xrange(num_items):
-            owner_and_state = util.str2int(resource.read(1), crypt_val=(self.crypt_value if decrypt else None))
-            owner = (owner_and_state & 0xF0) >> 4
-            state = owner_and_state & 0x0F
-            self.objects.append([owner, state])
-        # Read all class data values
-        for i in xrange(num_items):
-            class_data = util.str2int(resource.read(self.class_data_size), crypt_val=(self.crypt_value if decrypt else None))
-            self.objects[i].append(class_data)
+        crypt_value = (self.crypt_value if decrypt else None)
+        num_items = util.str2int(resource.read(2), crypt_val=crypt_value)
+        # Read all owner+state values, then all class data values
+        owners_and_states = util.str2ints(resource.read(num_items), 'B', num_items, crypt_val=crypt_value)
+        class_data_fmt = util.INT_FORMATS[self.class_data_size]
+        class_datas = util.str2ints(resource.read(self.class_data_size * num_items),
+                                    class_data_fmt, num_items, crypt_val=crypt_value)
+        self.objects = [[(owner_and_state & 0xF0) >> 4, owner_and_state & 0x0F, class_data]
+                        for owner_and_state, class_data in zip(owners_and_states, class_datas)]
 
     def load_from_file(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
 
         self.objects = []
         for obj_node in tree.getiterator("object-entry"):
@@ -46,7 +43,7 @@ class BlockObjectIndexes(AbstractBlock):
             et.SubElement(obj_node, "class-data").text = util.hex2xml(class_data)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "dobj.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "dobj.xml"))
 
     def save_to_resource(self, resource, room_start=0):
         """ TODO: allow filling of unspecified values (e.g. if entries for
@@ -61,9 +58,8 @@ class BlockObjectIndexes(AbstractBlock):
         self._save_table_data(resource)
 
     def _save_table_data(self, resource):
-        for owner, state, _ in self.objects:
-            combined_val = ((owner & 0x0F) << 4) | (state & 0x0F)
-            resource.write(util.int2str(combined_val, 1, crypt_val=self.crypt_value))
-        for _, _, class_data in self.objects:
-            resource.write(util.int2str(class_data, self.class_data_size, crypt_val=self.crypt_value))
+        owners_and_states = [((owner & 0x0F) << 4) | (state & 0x0F) for owner, state, _ in self.objects]
+        resource.write(util.ints2str(owners_and_states, 'B', crypt_val=self.crypt_value))
+        class_datas = [class_data for _, _, class_data in self.objects]
+        resource.write(util.ints2str(class_datas, util.INT_FORMATS[self.class_data_size], crypt_val=self.crypt_value))
 
@@ -0,0 +1,40 @@
+import scummpacker_util as util
+
+# Rank maps for each block_ordering list, keyed by the list's id.
+_rank_maps = {}
+
+def get_rank_map(block_ordering):
+    """ Returns a dict mapping each block type in a container's block_ordering
+    list to its rank. If a block type is listed more than once, its first
+    position is used, just like list.index."""
+    cached = _rank_maps.get(id(block_ordering))
+    if cached is None or cached[0] is not block_ordering or cached[1] != len(block_ordering):
+        cached = (block_ordering, len(block_ordering), util.build_position_map(block_ordering))
+        _rank_maps[id(block_ordering)] = cached
+    return cached[2]
+
+class OrderPositionCache(object):
+    """ Remembers where each index appears in the order lists of an order map
+    (block type -> list of indexes, as loaded from order.xml), so looking up
+    a block's order doesn't need a linear search.
+
+    Order lists are checked for changes on every lookup, and their positions
+    are recalculated if they have been replaced or extended."""
+
+    def __init__(self):
+        self._cache = {}
+
+    def get(self, order_map, block_type):
+        """ Returns a dict mapping indexes to their position in the order list
+        for the given block type, or None if there is no order list."""
+        order_list = order_map.get(block_type)
+        if order_list is None:
+            return None
+        cached = self._cache.get(block_type)
+        if cached is None or cached[0] is not order_list or cached[1] != len(order_list):
+            cached = (order_list, len(order_list), util.build_position_map(order_list))
+            self._cache[block_type] = cached
+        return cached[2]
+
+    def clear(self):
+        self._cache = {}
@@ -1,5 +1,4 @@
 import logging
-import scummpacker_control as control
 from scriptblockcontainer import ScriptBlockContainer
 from objectblockcontainer import ObjectBlockContainer
 from blockcontainer import BlockContainer
@@ -26,14 +25,14 @@ class BlockRoom(BlockContainer): # also globally indexed
 
     def _read_data(self, resource, start, decrypt, room_start=0):
         end = start + self.size
-        object_container = self.object_container_class(self.block_name_length, self.crypt_value)
-        script_container = self.script_container_class(self.block_name_length, self.crypt_value)
+        object_container = self.object_container_class(self.block_name_length, self.crypt_value, self.context)
+        script_container = self.script_container_class(self.block_name_length, self.crypt_value, self.context)
         while resource.tell() < end:
             if self._should_skip_room(resource):
                 logging.warning("Skipping known dodgy room data at offset %s" % resource.tell())
                 resource.seek(end)
                 break
-            block = control.block_dispatcher.dispatch_next_block(resource)
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
             block.load_from_resource(resource, room_start)
             if block.name in self.script_types:
                 script_container.append(block)
@@ -53,14 +52,14 @@ class BlockRoom(BlockContainer): # also globally indexed
 
     def save_to_resource(self, resource, room_start=0):
         location = resource.tell()
-        room_num = control.global_index_map.get_index(self.lf_name, (control.disk_spanning_counter, room_start))
+        room_num = self.context.global_index_map.get_index(self.lf_name, (self.context.disk_spanning_counter, room_start))
         logging.debug("Saving room: %s" % room_num)
-        control.global_index_map.map_index(self.room_offset_name, room_num, location)
+        self.context.global_index_map.map_index(self.room_offset_name, room_num, location)
         super(BlockRoom, self).save_to_resource(resource, room_start)
 
     def _should_skip_room(self, resource):
-        if control.global_args.game in self.dodgy_offsets:
-            doff_set = self.dodgy_offsets[control.global_args.game]
+        if self.context.global_args.game in self.dodgy_offsets:
+            doff_set = self.dodgy_offsets[self.context.global_args.game]
             if resource.tell() - 4 - self.block_name_length in doff_set:
                 return True
         return False
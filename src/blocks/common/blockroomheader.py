@@ -33,7 +33,7 @@ class BlockRoomHeader(AbstractBlock):
         self._load_header_from_xml(path)
 
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         self.read_xml_node(root)
@@ -44,7 +44,7 @@ class BlockRoomHeader(AbstractBlock):
         self.generate_xml_node(root)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, self.name + ".xml"))
+        self.context.storage.write_xml(root, os.path.join(path, self.name + ".xml"))
 
     def _write_data(self, outfile, encrypt):
         """ Assumes it's writing to a resource."""
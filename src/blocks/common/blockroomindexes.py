@@ -1,5 +1,4 @@
 from collections import defaultdict
-import scummpacker_control as control
 from abstractblock import AbstractBlock
 
 class BlockRoomIndexes(AbstractBlock):
@@ -14,11 +13,13 @@ class BlockRoomIndexes(AbstractBlock):
     default_offset = 0
 
     def __init__(self, *args, **kwds):
+        padding_length = kwds.pop('padding_length', None)
+        super(BlockRoomIndexes, self).__init__(*args, **kwds)
         # Store a mapping of disk numbers to room numbers.
         self.disk_spanning = defaultdict(list)
-        self.padding_length = kwds.get('padding_length',
-                                       self.DEFAULT_PADDING_LENGTHS[control.global_args.game])
-        super(BlockRoomIndexes, self).__init__(*args, **kwds)
+        if padding_length is None:
+            padding_length = self.DEFAULT_PADDING_LENGTHS[self.context.global_args.game]
+        self.padding_length = padding_length
 
     def _read_data(self, resource, start, decrypt, room_start=0):
         raise NotImplementedError("This method must be overridden by inheriting classes.")
@@ -1,6 +1,5 @@
 import xml.etree.ElementTree as et
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 from abstractblock import AbstractBlock
 
@@ -20,7 +19,7 @@ class BlockRoomNames(AbstractBlock):
                 room_name = util.crypt(room_name, self.crypt_value)
             room_name = util.crypt(room_name, 0xFF).rstrip("\x00")
             self.room_names.append((room_no, room_name))
-            control.global_index_map.map_index(self.name, room_no, room_name)
+            self.context.global_index_map.map_index(self.name, room_no, room_name)
 
     def save_to_file(self, path):
         root = et.Element("room_names")
@@ -31,10 +30,10 @@ class BlockRoomNames(AbstractBlock):
             et.SubElement(room, "name").text = util.escape_invalid_chars(room_name)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "roomnames.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "roomnames.xml"))
 
     def load_from_file(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         self.room_names = []
@@ -45,7 +44,7 @@ class BlockRoomNames(AbstractBlock):
                 room_name = ''
             room_name = util.unescape_invalid_chars(room_name)
             self.room_names.append((room_no, room_name))
-            control.global_index_map.map_index(self.name, room_no, room_name)
+            self.context.global_index_map.map_index(self.name, room_no, room_name)
 
     def save_to_resource(self, resource, room_start=0):
         self.size = 10 * len(self.room_names) + 1 + self.block_name_length + 4
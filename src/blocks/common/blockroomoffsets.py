@@ -1,4 +1,4 @@
-import scummpacker_control as control
+import os
 import scummpacker_util as util
 from abstractblock import AbstractBlock
 
@@ -10,22 +10,33 @@ class BlockRoomOffsets(AbstractBlock):
     disk_lookup_name = NotImplementedError("This property must be overridden by inheriting classes.") # string
 
     def _read_data(self, resource, start, decrypt, room_start=0):
-        num_rooms = util.str2int(resource.read(1),
-                                    crypt_val=(self.crypt_value if decrypt else None))
+        crypt_value = (self.crypt_value if decrypt else None)
+        num_rooms = util.str2int(resource.read(1), crypt_val=crypt_value)
+        table = util.str2ints(resource.read(5 * num_rooms), 'BI', num_rooms, crypt_val=crypt_value)
 
-        for _ in xrange(num_rooms):
-            room_no = util.str2int(resource.read(1),
-                                      crypt_val=(self.crypt_value if decrypt else None))
+        for room_no, offset in zip(table[0::2], table[1::2]):
             if self.OFFSET_POINTS_TO_ROOM:
-                room_offset = util.str2int(resource.read(4),
-                                              crypt_val=(self.crypt_value if decrypt else None))
+                room_offset = offset
                 lf_offset = room_offset - self.block_name_length - 4
             else:
-                lf_offset = util.str2int(resource.read(4),
-                                            crypt_val=(self.crypt_value if decrypt else None))
+                lf_offset = offset
                 room_offset = lf_offset + 2 + self.block_name_length + 4 # add 2 bytes for the room number/index of LF block.
-            control.global_index_map.map_index(self.LFLF_NAME, (control.disk_spanning_counter, lf_offset), room_no)
-            control.global_index_map.map_index(self.ROOM_OFFSET_NAME, room_no, room_offset) # HACK
+            self.context.global_index_map.map_index(self.LFLF_NAME, (self.context.disk_spanning_counter, lf_offset), room_no)
+            self.context.global_index_map.map_index(self.ROOM_OFFSET_NAME, room_no, room_offset) # HACK
+
+    def shift_offsets_in_resource(self, resource, after, delta):
+        """ Used when a room has been patched in place. Reads this block from
+        the resource, moves the rooms that start after "after" by delta, and
+        writes it back over itself."""
+        self._read_header(resource, True)
+        num_rooms = util.str2int(resource.read(1), crypt_val=self.crypt_value)
+        table_start = resource.tell()
+        table = list(util.str2ints(resource.read(5 * num_rooms), 'BI', num_rooms, crypt_val=self.crypt_value))
+        for i in xrange(1, len(table), 2):
+            if table[i] > after:
+                table[i] += delta
+        resource.seek(table_start, os.SEEK_SET)
+        resource.write(util.ints2str(table, 'BI', util.LE, self.crypt_value))
 
     def save_to_file(self, path):
         """Don't need to save offsets since they're calculated when packing."""
@@ -42,40 +53,38 @@ class BlockRoomOffsets(AbstractBlock):
         #  comes from the number of entries in the file system.
         if self.OFFSET_POINTS_TO_ROOM:
             room_table = []
-            for room_item in \
-            sorted(control.global_index_map.items(self.ROOM_OFFSET_NAME)):
+            for room_item in self.context.global_index_map.items(self.ROOM_OFFSET_NAME): # sorted by room number
                 # Don't write rooms not on this disk
                 room_num = room_item[0]
-                room_disk = control.global_index_map.get_index(self.disk_lookup_name, room_num)
-                if room_disk == control.disk_spanning_counter:
+                room_disk = self.context.global_index_map.get_index(self.disk_lookup_name, room_num)
+                if room_disk == self.context.disk_spanning_counter:
                     room_table.append(room_item)
 
-            num_of_rooms = len(room_table)
-            resource.write(util.int2str(num_of_rooms, 1, crypt_val=self.crypt_value))
+            table = []
             for room_num, room_offset in room_table:
-                room_num = int(room_num)
-                resource.write(util.int2str(room_num, 1, crypt_val=self.crypt_value))
-                resource.write(util.int2str(room_offset, 4, util.LE, self.crypt_value))
+                table.append(int(room_num))
+                table.append(room_offset)
         else:
             room_table = []
-            for lflf_item in \
-            sorted(control.global_index_map.items(self.LFLF_NAME)):
+            for lflf_item in self.context.global_index_map.items(self.LFLF_NAME): # sorted by disk and offset
                 # Don't write rooms not on this disk
                 room_num = lflf_item[1]
-                room_disk = control.global_index_map.get_index(self.disk_lookup_name, room_num)
-                if room_disk == control.disk_spanning_counter:
+                room_disk = self.context.global_index_map.get_index(self.disk_lookup_name, room_num)
+                if room_disk == self.context.disk_spanning_counter:
                     room_table.append(lflf_item)
 
-            num_of_rooms = len(room_table)
-            resource.write(util.int2str(num_of_rooms, 1, crypt_val=self.crypt_value))
+            table = []
             for lflf_item, room_num in room_table:
                 if isinstance(lflf_item, tuple):
                     lf_offset = lflf_item[1]
                 else:
                     lf_offset = lflf_item
-                room_num = int(room_num)
-                resource.write(util.int2str(room_num, 1, crypt_val=self.crypt_value))
-                resource.write(util.int2str(lf_offset, 4, util.LE, self.crypt_value))
+                table.append(int(room_num))
+                table.append(lf_offset)
+
+        num_of_rooms = len(room_table)
+        resource.write(util.int2str(num_of_rooms, 1, crypt_val=self.crypt_value))
+        resource.write(util.ints2str(table, 'BI', util.LE, self.crypt_value))
 
     def write_dummy_block(self, resource, num_rooms):
         """This method should be called before save_to_resource. It just
@@ -87,8 +96,7 @@ class BlockRoomOffsets(AbstractBlock):
         block_start = resource.tell()
         self._write_dummy_header(resource, True)
         resource.write(util.int2str(num_rooms, 1, crypt_val=self.crypt_value))
-        for _ in xrange(num_rooms):
-            resource.write(util.int2str(0, 1, crypt_val=self.crypt_value) * 5)
+        resource.write(util.int2str(0, 1, crypt_val=self.crypt_value) * (5 * num_rooms))
         block_end = resource.tell()
         self.size = block_end - block_start
 
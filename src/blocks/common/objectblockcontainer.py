@@ -1,18 +1,18 @@
 import xml.etree.ElementTree as et
 import os
 import re
-import scummpacker_control as control
 import scummpacker_util as util
 
 class ObjectBlockContainer(object):
     """ Contains objects, which contain image and code blocks."""
 
-    def __init__(self, block_name_length, crypt_value, *args, **kwds):
+    def __init__(self, block_name_length, crypt_value, context=None, *args, **kwds):
         self._init_class_data()
         self.objects = {}
         self.obj_id_name_length = 4 # should be increased depending on number of objects in the game
         self.block_name_length = block_name_length
         self.crypt_value = crypt_value
+        self.context = context
         self.name = "objects"
         self.order_map = { self.obcd_name : [], self.obim_name : [] }
         self.between_blocks = []
@@ -43,8 +43,7 @@ class ObjectBlockContainer(object):
 
     def save_to_file(self, path):
         objects_path = os.path.join(path, self.generate_file_name())
-        if not os.path.isdir(objects_path):
-            os.mkdir(objects_path) # throws an exception if can't create dir
+        self.context.storage.makedir(objects_path)
         for objimage, objcode in self.objects.values():
             # New path name = Object ID + object name (removing trailing spaces)
             if objcode is None or objimage is None:
@@ -53,8 +52,7 @@ class ObjectBlockContainer(object):
             obj_name = objcode.obj_name
             obj_path_name = str(obj_id).zfill(self.obj_id_name_length) + "_" + util.discard_invalid_chars(obj_name).rstrip()
             newpath = os.path.join(objects_path, obj_path_name)
-            if not os.path.isdir(newpath):
-                os.mkdir(newpath) # throws an exception if can't create dir
+            self.context.storage.makedir(newpath)
             objimage.save_to_file(newpath)
             objcode.save_to_file(newpath)
             self._save_header_to_xml(newpath, objimage, objcode)
@@ -63,6 +61,10 @@ class ObjectBlockContainer(object):
         for b in self.between_blocks:
             b.save_to_file(objects_path)
 
+    def compute_size(self):
+        blocks = [b for image_and_code in self.objects.values() for b in image_and_code if b is not None]
+        return sum([b.compute_size() for b in blocks + self.between_blocks])
+
     def save_to_resource(self, resource, room_start=0):
         self._save_object_images_to_resource(resource, room_start)
         self._save_between_blocks_to_resource(resource, room_start)
@@ -100,40 +102,73 @@ class ObjectBlockContainer(object):
         objcode.generate_xml_node(root)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "OBHD.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "OBHD.xml"))
 
     def _save_order_to_xml(self, path):
         root = et.Element("order")
 
-        for block_type, order_list in self.order_map.items():
+        for block_type in sorted(self.order_map.keys()): # sorted, so the file is the same every time
+            order_list = self.order_map[block_type]
             order_list_node = et.SubElement(root, "order-list")
             order_list_node.set("block-type", block_type)
             for o in order_list:
                 et.SubElement(order_list_node, "order-entry").text = util.int2xml(o)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "order.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "order.xml"))
+
+    def _find_object_dirs(self, file_list):
+        re_pattern = re.compile(r"[0-9]{" + str(self.obj_id_name_length) + r"}_.*")
+        return [f for f in file_list if re_pattern.match(f) != None]
+
+    def validate_files(self, path, max_objects=None):
+        """ Checks each object directory has what's needed to load both its
+        image and code blocks, reading just the OBHD.xml headers. Returns a
+        list of problems."""
+        problems = []
+        object_dirs = sorted(self._find_object_dirs(self.context.storage.listdir(path)))
+        if max_objects is not None and len(object_dirs) > max_objects:
+            problems.append("%s: %d objects, but MAXS only allows %d in a room" % (path, len(object_dirs), max_objects))
+        object_dirs_by_id = {}
+        for od in object_dirs:
+            new_path = os.path.join(path, od)
+            file_list = self.context.storage.listdir(new_path)
+            if not "OBHD.xml" in file_list:
+                problems.append("%s: missing the object header (OBHD.xml)" % new_path)
+                continue
+            header = self.context.storage.parse_xml(os.path.join(new_path, "OBHD.xml")).getroot()
+            obj_id = header.findtext("id")
+            if obj_id is None:
+                problems.append("%s: OBHD.xml has no object ID" % new_path)
+            else:
+                obj_id = util.xml2int(obj_id)
+                if obj_id in object_dirs_by_id:
+                    problems.append("%s: object %d is also in %s" % (new_path, obj_id, object_dirs_by_id[obj_id]))
+                object_dirs_by_id[obj_id] = od
+            for object_class in (self.obim_class, self.obcd_class):
+                block = object_class(self.block_name_length, self.crypt_value, self.context)
+                problems.extend(["%s: %s" % (new_path, p) for p in block.validate_files(file_list, header)])
+        return problems
 
     def load_from_file(self, path):
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
 
-        re_pattern = re.compile(r"[0-9]{" + str(self.obj_id_name_length) + r"}_.*")
-        object_dirs = [f for f in file_list if re_pattern.match(f) != None]
+        object_dirs = self._find_object_dirs(file_list)
         self.order_map = { self.obcd_name : [], self.obim_name : [] }
         for od in object_dirs:
             new_path = os.path.join(path, od)
 
-            objimage = self.obim_class(self.block_name_length, self.crypt_value)
+            objimage = self.obim_class(self.block_name_length, self.crypt_value, self.context)
             objimage.load_from_file(new_path)
             self.add_image_block(objimage)
 
-            objcode = self.obcd_class(self.block_name_length, self.crypt_value)
+            objcode = self.obcd_class(self.block_name_length, self.crypt_value, self.context)
             objcode.load_from_file(new_path)
             self.add_code_block(objcode)
 
         file_list = [f for f in file_list if not f in object_dirs]
         for f in file_list:
-            b = control.file_dispatcher.dispatch_next_block(f)
+            b = self.context.file_dispatcher.dispatch_next_block(f)
             if b != None:
                 b.load_from_file(os.path.join(path, f))
                 self.between_blocks.append(b)
@@ -142,11 +177,11 @@ class ObjectBlockContainer(object):
 
     def _load_order_from_xml(self, path):
         order_fname = os.path.join(path, "order.xml")
-        if not os.path.isfile(order_fname):
+        if not self.context.storage.isfile(order_fname):
             # If order.xml does not exist, use whatever order we want.
             return
 
-        tree = et.parse(order_fname)
+        tree = self.context.storage.parse_xml(order_fname)
         root = tree.getroot()
 
         loaded_order_map = self.order_map
@@ -162,7 +197,8 @@ class ObjectBlockContainer(object):
 
             # Retain order of items loaded but not present in order.xml
             if block_type in loaded_order_map:
-                extra_orders = [i for i in loaded_order_map[block_type] if not i in self.order_map[block_type]]
+                ordered = frozenset(self.order_map[block_type])
+                extra_orders = [i for i in loaded_order_map[block_type] if not i in ordered]
                 self.order_map[block_type].extend(extra_orders)
 
     def generate_file_name(self):
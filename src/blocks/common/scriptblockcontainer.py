@@ -1,5 +1,5 @@
+import operator
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 
 class ScriptBlockContainer(object):
@@ -9,12 +9,13 @@ class ScriptBlockContainer(object):
     lf_name = None
     num_local_name = None
 
-    def __init__(self, block_name_length, crypt_value, *args, **kwds):
+    def __init__(self, block_name_length, crypt_value, context=None, *args, **kwds):
         self.local_scripts = []
         self.encd_script = None
         self.excd_script = None
         self.block_name_length = block_name_length
         self.crypt_value = crypt_value
+        self.context = context
         self.name = "scripts"
 
     def append(self, block):
@@ -29,8 +30,7 @@ class ScriptBlockContainer(object):
 
     def save_to_file(self, path):
         newpath = os.path.join(path, self.generate_file_name())
-        if not os.path.isdir(newpath):
-            os.mkdir(newpath) # throws an exception if can't create dir
+        self.context.storage.makedir(newpath)
         if self.encd_script:
             self.encd_script.save_to_file(newpath)
         if self.excd_script:
@@ -38,10 +38,16 @@ class ScriptBlockContainer(object):
         for s in self.local_scripts:
             s.save_to_file(newpath)
 
+    def compute_size(self):
+        size = sum([s.compute_size() for s in (self.excd_script, self.encd_script) if s is not None])
+        # The "number of local scripts" block has a header and a 2 byte count.
+        size += self.block_name_length + 4 + 2
+        return size + sum([s.compute_size() for s in self.local_scripts])
+
     def save_to_resource(self, resource, room_start=0):
         # Write entry and exit scripts (seperate from local scripts)
         if not self.encd_script or not self.excd_script:
-            room_num = control.global_index_map.get_index(self.lf_name, (control.disk_spanning_counter, room_start))
+            room_num = self.context.global_index_map.get_index(self.lf_name, (self.context.disk_spanning_counter, room_start))
             raise util.ScummPackerException(
                 "Room #" + str(room_num) + " appears to be missing either a room entry or exit script (or both).")
         self.excd_script.save_to_resource(resource, room_start)
@@ -51,7 +57,7 @@ class ScriptBlockContainer(object):
         self._write_number_of_local_scripts(resource)
 
         # Write all local scripts sorted by script number
-        self.local_scripts.sort(cmp=lambda x,y: cmp(x.script_id, y.script_id))
+        self.local_scripts.sort(key=operator.attrgetter("script_id"))
         for s in self.local_scripts:
             s.save_to_resource(resource, room_start)
 
@@ -63,14 +69,25 @@ class ScriptBlockContainer(object):
         resource.write(util.int2str(num_local_scripts, 2, util.LE, self.crypt_value))
 
     def load_from_file(self, path):
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
 
         for f in file_list:
-            b = control.file_dispatcher.dispatch_next_block(f)
+            b = self.context.file_dispatcher.dispatch_next_block(f)
             if b != None: #and self.script_types: # TODO?: only load recognised scripts
                 b.load_from_file(os.path.join(path, f))
                 self.append(b)
 
+    def validate_files(self, path):
+        """ Checks the scripts directory has what save_to_resource needs,
+        without loading it. Returns a list of problems."""
+        script_names = frozenset([os.path.splitext(f)[0] for f in self.context.storage.listdir(path)])
+        problems = []
+        if not self.entry_script_name in script_names:
+            problems.append("%s: missing the room entry script (%s)" % (path, self.entry_script_name))
+        if not self.exit_script_name in script_names:
+            problems.append("%s: missing the room exit script (%s)" % (path, self.exit_script_name))
+        return problems
+
     def generate_file_name(self):
         return "scripts"
 
@@ -1,6 +1,5 @@
 import os
 import re
-import scummpacker_control as control
 import scummpacker_util as util
 from blocks.common import AbstractBlock
 
@@ -16,7 +15,7 @@ class BlockOBIMShared(object):
         end = start + self.size
 
         # Load the header
-        block = self.imhd_class(self.block_name_length, self.crypt_value)
+        block = self.imhd_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_resource(resource)
         self.obj_id = block.obj_id # maybe should handle header info better
         self.imhd = block
@@ -24,14 +23,14 @@ class BlockOBIMShared(object):
         # Load the image data
         i = block.num_imnn
         while i > 0:
-            block = self.container_class(self.block_name_length, self.crypt_value)
+            block = self.container_class(self.block_name_length, self.crypt_value, self.context)
             block.load_from_resource(resource)
             self.append(block)
             i -= 1
 
     def load_from_file(self, path):
         # Load the header
-        block = self.imhd_class(self.block_name_length, self.crypt_value)
+        block = self.imhd_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_file(os.path.join(path, "OBHD.xml"))
         self.append(block)
         self.obj_id = block.obj_id
@@ -39,7 +38,7 @@ class BlockOBIMShared(object):
         self.name = "OBIM"
 
         # Load the image data
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
         re_pattern = re.compile(r"IM[0-9a-fA-F]{2}")
         imnn_dirs = [f for f in file_list if re_pattern.match(f) != None]
         if len(imnn_dirs) != block.num_imnn:
@@ -51,10 +50,23 @@ class BlockOBIMShared(object):
 
         for d in imnn_dirs:
             new_path = os.path.join(path, d)
-            block = self.container_class(self.block_name_length, self.crypt_value)
+            block = self.container_class(self.block_name_length, self.crypt_value, self.context)
             block.load_from_file(new_path)
             self.append(block)
 
+    def validate_files(self, file_list, header):
+        """ Checks an object's directory listing and OBHD.xml header (see
+        ObjectBlockContainer.validate_files). Returns a list of problems."""
+        num_imnn = header.findtext("image/num_images")
+        if num_imnn is None:
+            return ["OBHD.xml has no image header"]
+        re_pattern = re.compile(r"IM[0-9a-fA-F]{2}")
+        num_imnn_dirs = len([f for f in file_list if re_pattern.match(f) != None])
+        if num_imnn_dirs != util.xml2int(num_imnn):
+            return ["Number of images in the header (%s) does not match the number of image directories (%d)"
+                    % (num_imnn, num_imnn_dirs)]
+        return []
+
     def generate_file_name(self):
         return ""
 
@@ -74,16 +86,16 @@ class BlockOBCDShared(object):
 
     def _read_data(self, resource, start, decrypt, room_start=0):
         end = start + self.size
-        block = self.cdhd_class(self.block_name_length, self.crypt_value)
+        block = self.cdhd_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_resource(resource)
         self.obj_id = block.obj_id # maybe should handle header info better
         self.cdhd = block
 
-        block = self.verb_class(self.block_name_length, self.crypt_value)
+        block = self.verb_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_resource(resource)
         self.verb = block
 
-        block = self.obna_class(self.block_name_length, self.crypt_value)
+        block = self.obna_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_resource(resource)
         self.obna = block
 
@@ -91,38 +103,46 @@ class BlockOBCDShared(object):
 
     def load_from_file(self, path):
         self.name = "OBCD"
-        block = self.cdhd_class(self.block_name_length, self.crypt_value)
+        block = self.cdhd_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_file(os.path.join(path, "OBHD.xml"))
         self.obj_id = block.obj_id # maybe should handle header info better
         self.cdhd = block
 
-        block = self.verb_class(self.block_name_length, self.crypt_value)
+        block = self.verb_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_file(os.path.join(path, "VERB.dmp")) # hmm
         self.verb = block
 
-        block = self.obna_class(self.block_name_length, self.crypt_value)
+        block = self.obna_class(self.block_name_length, self.crypt_value, self.context)
         block.load_from_file(os.path.join(path, "OBHD.xml"))
         self.obna = block
 
         self.obj_name = self.obna.obj_name # cheat
 
+    def validate_files(self, file_list, header):
+        """ Checks an object's directory listing and OBHD.xml header (see
+        ObjectBlockContainer.validate_files). Returns a list of problems."""
+        problems = []
+        if header.find("code") is None:
+            problems.append("OBHD.xml has no code header")
+        if not "VERB.dmp" in file_list:
+            problems.append("missing the object's verb scripts (VERB.dmp)")
+        return problems
+
     def save_to_file(self, path):
         self.verb.save_to_file(path)
 
+    def compute_size(self):
+        self.size = self._get_header_size() + sum([b.compute_size() for b in (self.cdhd, self.verb, self.obna)])
+        return self.size
+
     def save_to_resource(self, resource, room_start=0):
         start = resource.tell()
-        self._write_dummy_header(resource, True)
+        self.compute_size()
+        self._write_header(resource, True)
         self.cdhd.save_to_resource(resource, room_start)
         self.verb.save_to_resource(resource, room_start)
         self.obna.save_to_resource(resource, room_start)
-        end = resource.tell()
-        self.size = end - start
-        resource.flush()
-        # Go back and write the correct header information
-        resource.seek(start, os.SEEK_SET)
-        self._write_header(resource, True)
-        resource.flush()
-        resource.seek(end, os.SEEK_SET) # resume where we left off
+        self._check_planned_size(resource, start)
 
     def generate_file_name(self):
         return str(self.obj_id) + "_" + self.obj_name
@@ -180,13 +200,13 @@ class BlockSOUNShared(object):
         else:
             end = start + self.size
             while resource.tell() < end:
-                block = control.block_dispatcher.dispatch_next_block(resource)
+                block = self.context.block_dispatcher.dispatch_next_block(resource)
                 block.load_from_resource(resource)
                 self.append(block)
 
     def save_to_file(self, path):
         if self.is_cd_track:
-            outfile = file(os.path.join(path, self.generate_file_name()), 'wb')
+            outfile = self.context.storage.open_write(os.path.join(path, self.generate_file_name()))
             self._write_header(outfile, False)
             self._write_raw_data(outfile, self.data, False)
             outfile.close()
@@ -194,11 +214,16 @@ class BlockSOUNShared(object):
             newpath = self._create_directory(path)
             self._save_children(newpath)
 
+    def compute_size(self):
+        if self.is_cd_track:
+            return self.size
+        return super(BlockSOUNShared, self).compute_size()
+
     def save_to_resource(self, resource, room_start=0):
         location = resource.tell()
-        room_num = control.global_index_map.get_index(self.lf_name, (control.disk_spanning_counter, room_start))
-        room_offset = control.global_index_map.get_index(self.room_offset_name, room_num)
-        control.global_index_map.map_index(self.name,
+        room_num, room_offset = self.context.global_index_map.get_room(self.lf_name, self.room_offset_name,
+                                                                  self.context.disk_spanning_counter, room_start)
+        self.context.global_index_map.map_index(self.name,
                                            (room_num, location - room_offset),
                                            self.index)
         if self.is_cd_track:
@@ -215,10 +240,10 @@ class BlockSOUNShared(object):
             self.index = int(name.split('_')[1])
             self.children = []
 
-            file_list = os.listdir(path)
+            file_list = self.context.storage.listdir(path)
 
             for f in file_list:
-                b = control.file_dispatcher.dispatch_next_block(f)
+                b = self.context.file_dispatcher.dispatch_next_block(f)
                 if b != None:
                     b.load_from_file(os.path.join(path, f))
                     self.append(b)
@@ -227,7 +252,7 @@ class BlockSOUNShared(object):
             self.name = name.split('_')[0]
             self.index = int(os.path.splitext(name.split('_')[1])[0])
             self.children = []
-            soun_file = file(path, 'rb')
+            soun_file = self.context.storage.open_read(path)
             self._read_header(soun_file, False)
             self._read_data(soun_file, 0, False)
             soun_file.close()
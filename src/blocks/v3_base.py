@@ -1,5 +1,4 @@
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 from v4_base import BlockContainerV4
 
@@ -25,9 +24,9 @@ class LFLContainerV3(BlockContainerV4):
         #  the resource file, and starts at offset 0.
         # Not sure what to do with the disk values. In original index files,
         #  disk numbers are 0x31, 0x32, 0x33, 0x34 etc.
-        control.global_index_map.map_index('LF', (control.disk_spanning_counter, 0), int(self.name))
-        control.global_index_map.map_index('FO', int(self.name), 0)
-        control.global_index_map.map_index("Disk",
+        self.context.global_index_map.map_index('LF', (self.context.disk_spanning_counter, 0), int(self.name))
+        self.context.global_index_map.map_index('FO', int(self.name), 0)
+        self.context.global_index_map.map_index("Disk",
                                            int(self.name),
                                            int(self.name))
         start = resource.tell()
@@ -41,20 +40,24 @@ class LFLContainerV3(BlockContainerV4):
         self.children = []
         self.order_map = {}
 
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
         if "order.xml" in file_list:
             file_list.remove("order.xml")
             self._load_order_from_xml(os.path.join(path, "order.xml"))
 
         # HACK
-        control.global_index_map.map_index('LF', (int(self.name), 0), int(self.name))
+        self.context.global_index_map.map_index('LF', (int(self.name), 0), int(self.name))
 
         for f in file_list:
-            b = control.file_dispatcher.dispatch_next_block(f)
+            b = self.context.file_dispatcher.dispatch_next_block(f)
             if b != None:
                 b.load_from_file(os.path.join(path, f))
                 self.append(b)
 
+    def compute_size(self):
+        # There's no header, just the children.
+        return sum([c.compute_size() for c in self.children])
+
     def save_to_resource(self, resource, room_start=0):
         """ 
         HACK:
@@ -67,13 +70,11 @@ class LFLContainerV3(BlockContainerV4):
 
         This supports Zak room 47 which has no room in the LFL file.
         """
-        try:
-            control.global_index_map.get_index('FO', int(self.name))
-        except util.ScummPackerUnrecognisedIndexException, suie:
-            control.global_index_map.map_index('FO', int(self.name), 0)
+        if self.context.global_index_map.find_index('FO', int(self.name)) is None:
+            self.context.global_index_map.map_index('FO', int(self.name), 0)
         
         # HACK
-        control.disk_spanning_counter = int(self.name)
+        self.context.disk_spanning_counter = int(self.name)
         # process children
         for c in self.children:
             c.save_to_resource(resource, room_start)
@@ -86,7 +87,7 @@ class LFLContainerV3(BlockContainerV4):
     def _read_data(self, resource, start, decrypt, room_start=0):
         end = start + self.size
         while resource.tell() < end:
-            block = control.block_dispatcher.dispatch_next_block(resource)
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
             block.load_from_resource(resource, room_start)
             self.append(block)
 
@@ -1,5 +1,4 @@
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 from blocks.v4 import BlockSOV4
 
@@ -9,14 +8,13 @@ class BlockSOV3(BlockSOV4):
     treated as globally indexed, while the nested block should not.
     """
     def _handle_unknown_index(self, location, room_start):
-        try:
-            # Try looking up index of a hypothetical parent block. If none
-            #  found, this is an unknown outer SO block. If index is found,
-            #  this is an inner SO block, which does not require an index.
-            self._lookup_index(location - self.block_name_length - 4, room_start)
+        # Try looking up index of a hypothetical parent block. If none
+        #  found, this is an unknown outer SO block. If index is found,
+        #  this is an inner SO block, which does not require an index.
+        if self.lookup_index(location - self.block_name_length - 4, room_start) is not None:
             self.index = None
             self.is_unknown = False
-        except util.ScummPackerUnrecognisedIndexException, suie:
+        else:
             super(BlockSOV3, self)._handle_unknown_index(location, room_start)
 
     def save_to_resource(self, resource, room_start=0):
@@ -39,7 +37,7 @@ class BlockSOV3(BlockSOV4):
             self.index = None
         self.children = []
 
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
         if "order.xml" in file_list:
             file_list.remove("order.xml")
             # The below line of code is pointless, since outer SO blocks only
@@ -48,7 +46,7 @@ class BlockSOV3(BlockSOV4):
             self._load_order_from_xml(os.path.join(path, "order.xml"))
 
         for f in file_list:
-            b = control.file_dispatcher.dispatch_next_block(f)
+            b = self.context.file_dispatcher.dispatch_next_block(f)
             if b != None:
                 b.load_from_file(os.path.join(path, f))
                 self.append(b)
@@ -9,7 +9,8 @@ from v4_index import *
 
 def __test_unpack():
     import dispatchers
-    control.global_args.set_args(unpack=True, pack=False, scumm_version="4",
+    context = control.PackContext()
+    context.global_args.set_args(unpack=True, pack=False, scumm_version="4",
         game="LOOMCD", input_file_name="DISK01.LEC", output_file_name="D:\\TEMP")
     outpath = "D:\\TEMP"
 
@@ -20,12 +21,13 @@ def __test_unpack():
 #
 #    dir_block.save_to_file(outpath)
     #print dispatchers.INDEXED_BLOCKS_V4
-    control.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V4)
-    control.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V4)
+    context.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V4)
+    context.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V4)
 
     logging.debug("Reading from indexes...")
     dirfile = file(os.path.join("..", "000.LFL"), "rb")
     dir_block = dispatchers.IndexBlockContainerV4()
+    dir_block.context = context
     dir_block.load_from_resource(dirfile)
     dirfile.close()
 
@@ -33,9 +35,10 @@ def __test_unpack():
     
     
     logging.debug("Reading from resources...")
-    control.block_dispatcher = dispatchers.BlockDispatcherV4()
+    context.block_dispatcher = dispatchers.BlockDispatcherV4()
+    context.block_dispatcher.context = context
     resfile = file(os.path.join("..", "DISK01.LEC"), "rb")
-    block = BlockContainerV4(2, 0x69)
+    block = BlockContainerV4(2, 0x69, context)
     block.load_from_resource(resfile)
     resfile.close()
 
@@ -46,15 +49,18 @@ def __test_unpack():
 
 def __test_pack():
     import dispatchers
-    control.global_args.set_args(unpack=False, pack=True, scumm_version="4",
+    context = control.PackContext()
+    context.global_args.set_args(unpack=False, pack=True, scumm_version="4",
         game="LOOMCD", input_file_name="D:\\TEMP", output_file_name="D:\\TEMP\outres4.000")
-    control.file_dispatcher = dispatchers.FileDispatcherV4()
-    control.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V4)
-    control.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V4)
+    context.file_dispatcher = dispatchers.FileDispatcherV4()
+    context.file_dispatcher.context = context
+    context.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V4)
+    context.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V4)
     startpath = "D:\\TEMP"
-    block = BlockLEV4(2, 0x69)
+    block = BlockLEV4(2, 0x69, context)
     block.load_from_file(startpath)
     index_block = dispatchers.IndexBlockContainerV4()
+    index_block.context = context
     index_block.load_from_file(startpath)
     
     logging.info("read from file, now saving to resource")
@@ -1,7 +1,6 @@
 #! /usr/bin/python
 from __future__ import with_statement
 import logging
-import scummpacker_control as control
 import scummpacker_util as util
 from common import *
 
@@ -89,7 +88,7 @@ class BlockContainerV4(BlockContainer, BlockDefaultV4):
         while resource.tell() < end:
 #            if resource.tell() in self.junk_sound_locations:
 #                logging.debug("Found known junk sound at offset: %d" % resource.tell() )
-            block = control.block_dispatcher.dispatch_next_block(resource)
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
             block.load_from_resource(resource, room_start)
             self.append(block)
             
@@ -133,31 +132,14 @@ class BlockIndexDirectoryV4(BlockIndexDirectory, BlockDefaultV4):
         },
     }
 
-    def _read_data(self, resource, start, decrypt, room_start=0):
-        num_items = util.str2int(resource.read(2), crypt_val=(self.crypt_value if decrypt else None))
-        room_nums = []
-        offsets = []
-        i = num_items
-        while i > 0:
-            room_no = util.str2int(resource.read(1), crypt_val=(self.crypt_value if decrypt else None))
-            room_nums.append(room_no)
-            offset = util.str2int(resource.read(4), crypt_val=(self.crypt_value if decrypt else None))
-            offsets.append(offset)
-            i -= 1
-
-        for i, key in enumerate(zip(room_nums, offsets)):
-            control.global_index_map.map_index(self.DIR_TYPES[self.name], key, i)
-        
-        #logging.debug("Index for : %s" % self.name)
-        #logging.debug(control.global_index_map.items(self.DIR_TYPES[self.name]))
+    def _read_table(self, resource, num_items, crypt_value):
+        # Room numbers and offsets are interleaved.
+        table = util.str2ints(resource.read(5 * num_items), 'BI', num_items, crypt_val=crypt_value)
+        return table[0::2], table[1::2]
 
     def _save_table_data(self, resource, num_items, item_map):
+        table = []
         for i in xrange(num_items):
-            if not i in item_map:
-                # write dummy values for unused item numbers.
-                resource.write(util.int2str(0, 1, crypt_val=self.crypt_value))
-                resource.write(util.int2str(0, 4, crypt_val=self.crypt_value))
-            else:
-                room_num, offset = item_map[i]
-                resource.write(util.int2str(room_num, 1, crypt_val=self.crypt_value))
-                resource.write(util.int2str(offset, 4, crypt_val=self.crypt_value))
+            # write dummy values for unused item numbers.
+            table.extend(item_map.get(i, (0, 0)))
+        resource.write(util.ints2str(table, 'BI', crypt_val=self.crypt_value))
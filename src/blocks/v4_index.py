@@ -1,5 +1,4 @@
 #! /usr/bin/
-import scummpacker_control as control
 import scummpacker_util as util
 from v4_base import *
 
@@ -29,12 +28,12 @@ class Block0RV4(BlockRoomIndexes, BlockDefaultV4):
 
     def _read_data(self, resource, start, decrypt, room_start=0):
         """Read the disk spanning for each room."""
-        num_items = util.str2int(resource.read(2), crypt_val=(self.crypt_value if decrypt else None))
+        crypt_value = (self.crypt_value if decrypt else None)
+        num_items = util.str2int(resource.read(2), crypt_val=crypt_value)
         
-        # Read all owner+state values
-        for room_num in xrange(num_items):
-            disk_num = util.str2int(resource.read(1), crypt_val=(self.crypt_value if decrypt else None))
-            offset = util.str2int(resource.read(4), util.LE, crypt_val=(self.crypt_value if decrypt else None)) # always 0
+        # Read all disk numbers and offsets (offsets are always 0)
+        table = util.str2ints(resource.read(5 * num_items), 'BI', num_items, crypt_val=crypt_value)
+        for room_num, disk_num in enumerate(table[0::2]):
             if disk_num != 0:
                 self.disk_spanning[disk_num].append(room_num)
             
@@ -47,32 +46,30 @@ class Block0RV4(BlockRoomIndexes, BlockDefaultV4):
                     num_items_length + self.block_name_length + block_size_length
         self._write_header(resource, True)
         resource.write(util.int2str(self.padding_length, 2, crypt_val=self.crypt_value))
+        table = []
         for room_num in xrange(self.padding_length): # this is "file/disk number" in V4, rather than "room number"
-            try:
-                disk_number = control.global_index_map.get_index(self.disk_lookup_name, room_num)
-            except util.ScummPackerUnrecognisedIndexException:
+            disk_number = self.context.global_index_map.find_index(self.disk_lookup_name, room_num)
+            if disk_number is None:
                 disk_number = self.default_disk_or_room_number
-            resource.write(util.int2str(disk_number, 1, crypt_val=self.crypt_value))
-            resource.write(util.int2str(self.default_offset, 4, crypt_val=self.crypt_value))
+            table.append(disk_number)
+            table.append(self.default_offset)
+        resource.write(util.ints2str(table, 'BI', crypt_val=self.crypt_value))
     
 class Block0OV4(BlockObjectIndexes, BlockDefaultV4):
     name = "0O"
     class_data_size = 3
 
     def _read_data(self, resource, start, decrypt, room_start=0):
-        num_items = util.str2int(resource.read(2), crypt_val=(self.crypt_value if decrypt else None))
-        self.objects = []
-        # Read all owner+state and class data values
-        for _ in xrange(num_items):
-            class_data = util.str2int(resource.read(self.class_data_size), util.LE, crypt_val=(self.crypt_value if decrypt else None))            
-            owner_and_state = util.str2int(resource.read(1), crypt_val=(self.crypt_value if decrypt else None))
-            owner = (owner_and_state & 0xF0) >> 4
-            state = owner_and_state & 0x0F            
-            self.objects.append([owner, state, class_data])
+        crypt_value = (self.crypt_value if decrypt else None)
+        num_items = util.str2int(resource.read(2), crypt_val=crypt_value)
+        # Each entry is 3 bytes of class data followed by 1 byte of owner+state,
+        #  so read them as a table of little-endian 4 byte values.
+        entries = util.str2ints(resource.read(4 * num_items), 'I', num_items, util.LE, crypt_val=crypt_value)
+        self.objects = [[(entry >> 28) & 0x0F, (entry >> 24) & 0x0F, entry & 0xFFFFFF]
+                        for entry in entries]
 
     def _save_table_data(self, resource):
-        for owner, state, class_data in self.objects:
-            resource.write(util.int2str(class_data, self.class_data_size, util.LE, crypt_val=self.crypt_value))            
-            combined_val = ((owner & 0x0F) << 4) | (state & 0x0F)
-            resource.write(util.int2str(combined_val, 1, crypt_val=self.crypt_value))
+        entries = [(((owner & 0x0F) << 28) | ((state & 0x0F) << 24) | (class_data & 0xFFFFFF))
+                   for owner, state, class_data in self.objects]
+        resource.write(util.ints2str(entries, 'I', util.LE, crypt_val=self.crypt_value))
             
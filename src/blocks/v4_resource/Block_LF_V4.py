@@ -1,12 +1,12 @@
 from blocks.common import BlockLucasartsFile, BlockRoom
 from blocks.v4_base import BlockContainerV4, BlockGloballyIndexedV4
-import scummpacker_control as control
 import scummpacker_util as util
 
 
 class BlockLFV4(BlockLucasartsFile, BlockContainerV4, BlockGloballyIndexedV4):
     is_unknown = False
     disk_lookup_name = "Disk"
+    children_start = 2 # the room number
 
     def _read_data(self, resource, start, decrypt, room_start=0):
         """LF blocks store the room number before any child blocks.
@@ -15,7 +15,7 @@ class BlockLFV4(BlockLucasartsFile, BlockContainerV4, BlockGloballyIndexedV4):
         self.index = util.str2int(resource.read(2), crypt_val=(self.crypt_value if decrypt else None))
         end = start + self.size
         while resource.tell() < end:
-            block = control.block_dispatcher.dispatch_next_block(resource)
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
             if self._should_skip_child_block(block):
                 block.skip_from_resource(resource, start)
             else:
@@ -93,8 +93,18 @@ class BlockOCV4(BlockDefaultV4):
         self._load_script_from_file(os.path.join(path, "OC.dmp"))
         self.size = self._calculate_size()
 
+    def validate_files(self, file_list, header):
+        """ Checks an object's directory listing and OBHD.xml header (see
+        ObjectBlockContainer.validate_files). Returns a list of problems."""
+        problems = []
+        if header.find("code") is None:
+            problems.append("OBHD.xml has no code header")
+        if not "OC.dmp" in file_list:
+            problems.append("missing the object's code (OC.dmp)")
+        return problems
+
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         # Shared
@@ -103,10 +113,10 @@ class BlockOCV4(BlockDefaultV4):
         self.obj_name = '' if name is None else util.unescape_invalid_chars(name)
         self.obj_name = self.obj_name if self.obj_name != None else ""
 
-        util.xml_helper.read(self, root, self.xml_structure)
+        self.read_xml_node(root)
 
     def _load_script_from_file(self, path):
-        with file(path, 'rb') as script_file:
+        with self.context.storage.open_read(path) as script_file:
             # Skip the header info, except name offset
             script_file.seek(6 + 12)
             name_offset = ord(script_file.read(1))
@@ -23,15 +23,22 @@ class BlockOIV4(BlockDefaultV4):
         self._load_data_from_file(os.path.join(path, "OI.dmp"))
         self.size = self._calculate_size()
 
+    def validate_files(self, file_list, header):
+        """ Checks an object's directory listing and OBHD.xml header (see
+        ObjectBlockContainer.validate_files). Returns a list of problems."""
+        if not "OI.dmp" in file_list:
+            return ["missing the object's image (OI.dmp)"]
+        return []
+
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         # Shared
         self.obj_id = util.xml2int(root.find("id").text)
 
     def _load_data_from_file(self, path):
-        with file(path, 'rb') as data_file:
+        with self.context.storage.open_read(path) as data_file:
             # Skip the header info
             data_file.seek(6 + 2)
             # read script data
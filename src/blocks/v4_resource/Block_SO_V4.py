@@ -1,6 +1,5 @@
 import logging
 import os
-import scummpacker_control as control
 from blocks.v4_base import BlockContainerV4, BlockGloballyIndexedV4
 
 class BlockSOV4(BlockContainerV4, BlockGloballyIndexedV4):
@@ -18,7 +17,7 @@ class BlockSOV4(BlockContainerV4, BlockGloballyIndexedV4):
     def _read_size(self, resource, decrypt):
         location = resource.tell()
         size = super(BlockSOV4, self)._read_size(resource, decrypt)
-        dodgy_offset_lookup = (control.global_args.game, location, size)
+        dodgy_offset_lookup = (self.context.global_args.game, location, size)
         if dodgy_offset_lookup in self.dodgy_offsets:
             logging.debug("dodgy SO offset found: %s, %s, %s" % dodgy_offset_lookup)
             size += 256
@@ -36,13 +35,13 @@ class BlockSOV4(BlockContainerV4, BlockGloballyIndexedV4):
         self.index = int(name.split('_')[1])
         self.children = []
 
-        file_list = os.listdir(path)
+        file_list = self.context.storage.listdir(path)
         if "order.xml" in file_list:
             file_list.remove("order.xml")
             self._load_order_from_xml(os.path.join(path, "order.xml"))
 
         for f in file_list:
-            b = control.file_dispatcher.dispatch_next_block(f)
+            b = self.context.file_dispatcher.dispatch_next_block(f)
             if b != None:
                 b.load_from_file(os.path.join(path, f))
                 self.append(b)
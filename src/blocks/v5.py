@@ -6,23 +6,26 @@ from v5_index import *
 
 def __test_unpack():
     import dispatchers
-    control.global_args.set_args(unpack=True, pack=False, scumm_version="5",
+    context = control.PackContext()
+    context.global_args.set_args(unpack=True, pack=False, scumm_version="5",
         game="MI2", input_file_name="MONKEY2.000", output_file_name="D:\\TEMP")
-    control.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V5)
-    control.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V5)
+    context.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V5)
+    context.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V5)
 
     outpath = "D:\\TEMP"
 
     dirfile = file("MONKEY2.000", "rb")
     dir_block = dispatchers.IndexBlockContainerV5()
+    dir_block.context = context
     dir_block.load_from_resource(dirfile)
     dirfile.close()
 
     dir_block.save_to_file(outpath)
 
-    control.block_dispatcher = dispatchers.BlockDispatcherV5()
+    context.block_dispatcher = dispatchers.BlockDispatcherV5()
+    context.block_dispatcher.context = context
     resfile = file("MONKEY2.001", "rb")
-    block = BlockLECFV5(4, 0x69)
+    block = BlockLECFV5(4, 0x69, context)
     block.load_from_resource(resfile)
     resfile.close()
 
@@ -30,17 +33,20 @@ def __test_unpack():
 
 def __test_pack():
     import dispatchers
-    control.global_args.set_args(unpack=False, pack=True, scumm_version="5",
+    context = control.PackContext()
+    context.global_args.set_args(unpack=False, pack=True, scumm_version="5",
         game="MI2", input_file_name="D:\\TEMP", output_file_name="D:\\TEMP\\outres.000")
-    control.file_dispatcher = dispatchers.FileDispatcherV5()
-    control.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V5)
-    control.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V5)
+    context.file_dispatcher = dispatchers.FileDispatcherV5()
+    context.file_dispatcher.context = context
+    context.unknown_blocks_counter = control.IndexCounter(*dispatchers.INDEXED_BLOCKS_V5)
+    context.global_index_map = control.IndexMappingContainer(*dispatchers.INDEXED_BLOCKS_V5)
 
     startpath = "D:\\TEMP"
 
-    block = BlockLECFV5(4, 0x69)
+    block = BlockLECFV5(4, 0x69, context)
     block.load_from_file(startpath)
     index_block = dispatchers.IndexBlockContainerV5()
+    index_block.context = context
     index_block.load_from_file(startpath)
 
     logging.info("read from file, now saving to resource")
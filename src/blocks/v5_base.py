@@ -2,7 +2,6 @@
 from __future__ import with_statement
 import array
 import os
-import scummpacker_control as control
 import scummpacker_util as util
 from common import *
 from shared import BlockDefaultSharedV5V6
@@ -123,16 +122,16 @@ class BlockMIDISoundV5(BlockSoundV5):
     def load_from_file(self, path):
         self.name = os.path.splitext(os.path.split(path)[1])[0]
         mdhd_fname = os.path.splitext(path)[0] + ".mdhd"
-        if os.path.isfile(mdhd_fname):
+        if self.context.storage.isfile(mdhd_fname):
             #logging.debug("Loading mdhd from file: " + mdhd_fname)
-            mdhd_file = file(mdhd_fname, 'rb')
+            mdhd_file = self.context.storage.open_read(mdhd_fname)
             mdhd_data = self._read_raw_data(mdhd_file, self.MDHD_SIZE, False)
             mdhd_file.close()
         else:
             mdhd_data = self._generate_mdhd_header()
         self.mdhd_header = mdhd_data
-        self.size = os.path.getsize(path) # size does not include ADL/ROL block header
-        midi_file = file(path, 'rb')
+        self.size = self.context.storage.getsize(path) # size does not include ADL/ROL block header
+        midi_file = self.context.storage.open_read(path)
         self._read_data(midi_file, 0, False)
         midi_file.close()
 
@@ -141,13 +140,17 @@ class BlockMIDISoundV5(BlockSoundV5):
         # MI1CD\LECF\LFLF_011\SOUN_043\SOU
         # 4D44 6864 0000 0008 0000 FF7F 0000 0080
         if self.mdhd_header.tostring() != self.MDHD_DEFAULT_DATA:
-            outfile = file(os.path.join(path, self.generate_file_name() + ".mdhd"), 'wb')
+            outfile = self.context.storage.open_write(os.path.join(path, self.generate_file_name() + ".mdhd"))
             self._write_mdhd_header(outfile, False)
             outfile.close()
-        outfile = file(os.path.join(path, self.generate_file_name() + ".mid"), 'wb')
+        outfile = self.context.storage.open_write(os.path.join(path, self.generate_file_name() + ".mid"))
         self._write_data(outfile, False)
         outfile.close()
 
+    def compute_size(self):
+        # Size doesn't include the block header or the MDHD header.
+        return self._get_header_size() + self.MDHD_SIZE + self.size
+
     def save_to_resource(self, resource, room_start=0):
         self._write_header(resource, True)
         self._write_mdhd_header(resource, True)
@@ -220,20 +223,8 @@ class BlockIndexDirectoryV5(BlockIndexDirectory, BlockDefaultV5):
         }
     }
 
-    def _read_data(self, resource, start, decrypt, room_start=0):
-        num_items = util.str2int(resource.read(2), crypt_val=(self.crypt_value if decrypt else None))
-        room_nums = []
-        i = num_items
-        while i > 0:
-            room_no = util.str2int(resource.read(1), crypt_val=(self.crypt_value if decrypt else None))
-            room_nums.append(room_no)
-            i -= 1
-        offsets = []
-        i = num_items
-        while i > 0:
-            offset = util.str2int(resource.read(4), crypt_val=(self.crypt_value if decrypt else None))
-            offsets.append(offset)
-            i -= 1
-
-        for i, key in enumerate(zip(room_nums, offsets)):
-            control.global_index_map.map_index(self.DIR_TYPES[self.name], key, i)
+    def _read_table(self, resource, num_items, crypt_value):
+        # A table of room numbers, followed by a table of offsets.
+        room_nums = util.str2ints(resource.read(num_items), 'B', num_items, crypt_val=crypt_value)
+        offsets = util.str2ints(resource.read(4 * num_items), 'I', num_items, crypt_val=crypt_value)
+        return room_nums, offsets
@@ -1,7 +1,6 @@
 import os
 import struct
 import xml.etree.ElementTree as et
-import scummpacker_control as control
 import scummpacker_util as util
 from common import *
 from v5_base import *
@@ -50,10 +49,10 @@ class BlockMAXSV5(BlockDefaultV5):
         et.SubElement(root, "inventory_objects").text = util.int2xml(self.inventory_objects)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "maxs.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "maxs.xml"))
 
     def load_from_file(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         self.size = 18 + self.block_name_length + 4
@@ -68,6 +67,14 @@ class BlockMAXSV5(BlockDefaultV5):
         self.unknown_4 = util.xml2int(root.find("unknown_4").text)
         self.inventory_objects = util.xml2int(root.find("inventory_objects").text)
 
+    def get_limits(self):
+        """ Returns how many of each resource type the game allows, keyed by
+        lookup name ("objects" is the number of objects in a room)."""
+        return {
+            "CHAR" : self.char_sets,
+            "objects" : self.local_objects
+        }
+
     def _write_data(self, outfile, encrypt):
         """ Assumes it's writing to a resource."""
         data = struct.pack("<9H", self.num_vars, self.unknown_1, self.bit_vars, self.local_objects,
@@ -106,8 +113,7 @@ class BlockDROOV5(BlockRoomIndexes, BlockDefaultV5):
         self.size = 5 * self.padding_length + 2 + self.block_name_length + 4
         self._write_header(resource, True)
         resource.write(util.int2str(self.padding_length, 2, crypt_val=self.crypt_value))
-        for _ in xrange(self.padding_length): # this is "file/disk number" rather than "room number" in V4
-            resource.write(util.int2str(self.default_disk_or_room_number, 1, crypt_val=self.crypt_value))
-        for _ in xrange(self.padding_length):
-            resource.write(util.int2str(self.default_offset, 4, crypt_val=self.crypt_value))
+        # this is "file/disk number" rather than "room number" in V4
+        resource.write(util.ints2str([self.default_disk_or_room_number] * self.padding_length, 'B', crypt_val=self.crypt_value))
+        resource.write(util.ints2str([self.default_offset] * self.padding_length, 'I', crypt_val=self.crypt_value))
 
@@ -56,7 +56,7 @@ class BlockCDHDV5(BlockDefaultV5):
         self._load_header_from_xml(path)
 
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         # Shared
@@ -59,7 +59,7 @@ class BlockIMHDV5(BlockDefaultV5):
         self._load_header_from_xml(path)
 
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         # Shared
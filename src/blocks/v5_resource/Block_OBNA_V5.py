@@ -18,7 +18,7 @@ class BlockOBNAV5(BlockDefaultV5):
         self.size = len(self.obj_name) + 1 + 8
 
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         # Shared
@@ -31,7 +31,7 @@ class BlockRMIHV5(BlockDefaultV5):
         self._load_header_from_xml(path)
 
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         self.read_xml_node(root)
@@ -42,7 +42,7 @@ class BlockRMIHV5(BlockDefaultV5):
         self.generate_xml_node(root)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "RMIH.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "RMIH.xml"))
 
     def _write_data(self, outfile, encrypt):
         """ Assumes it's writing to a resource."""
@@ -16,14 +16,14 @@ class BlockSBLV5(BlockSoundV5):
 
     def load_from_file(self, path):
         self.name = os.path.splitext(os.path.split(path)[1])[0]
-        self.size = os.path.getsize(path) - 0x1A + 27 # ignore VOC header, add SBL block header (could just +1)
-        voc_file = file(path, 'rb')
+        self.size = self.context.storage.getsize(path) - 0x1A + 27 # ignore VOC header, add SBL block header (could just +1)
+        voc_file = self.context.storage.open_read(path)
         voc_file.seek(0x1A, os.SEEK_CUR)
         self.data = self._read_raw_data(voc_file, self.size - 27, False)
         voc_file.close()
 
     def save_to_file(self, path):
-        outfile = file(os.path.join(path, self.generate_file_name()), 'wb')
+        outfile = self.context.storage.open_write(os.path.join(path, self.generate_file_name()))
         self._write_voc_header(outfile, False)
         self._write_data(outfile, False)
         outfile.close()
@@ -71,18 +71,30 @@ class BlockMAXSV6(BlockDefaultV5):
         self.generate_xml_node(root)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "maxs.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "maxs.xml"))
 
     def load_from_file(self, path):
         self.size = self.struct_data['size'] + self.block_name_length + 4
         self._load_header_from_xml(path)
 
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         self.read_xml_node(root)
 
+    def get_limits(self):
+        """ Returns how many of each resource type the game allows, keyed by
+        lookup name ("objects" is the number of objects in a room)."""
+        return {
+            "LFLF" : self.rooms,
+            "SCRP" : self.scripts,
+            "SOUN" : self.sounds,
+            "CHAR" : self.char_sets,
+            "COST" : self.costumes,
+            "objects" : self.local_objects
+        }
+
     def _write_data(self, resource, encrypt):
         """ Assumes it's writing to a resource."""
         self.write_struct_data(self.struct_data, resource, encrypt)
@@ -117,10 +129,10 @@ class BlockAARYV6(BlockDefaultV5):
             et.SubElement(array_node, "c").text = util.int2xml(c)
 
         util.indent_elementtree(root)
-        et.ElementTree(root).write(os.path.join(path, "aary.xml"))
+        self.context.storage.write_xml(root, os.path.join(path, "aary.xml"))
 
     def load_from_file(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         #root = tree.getroot()
 
         self.arrays = []
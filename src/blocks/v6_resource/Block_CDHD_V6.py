@@ -1,5 +1,4 @@
 import xml.etree.ElementTree as et
-import scummpacker_control as control
 import scummpacker_util as util
 from blocks.v6_base import BlockDefaultV6
 
@@ -57,7 +56,7 @@ class BlockCDHDV6(BlockDefaultV6):
         #  position in the file.
         #  The two OBCD blocks for 561 are actually different, but I'm
         #  not sure how to decide which is which, so I've just chosen the first one.
-        if (control.global_args.game == "SAM" and
+        if (self.context.global_args.game == "SAM" and
                 self.obj_id == 561 and
                 (start == 0x00A6CF8F or # floppy version
                  start == 0x00A7C4F2)): # talkie version
@@ -69,7 +68,7 @@ class BlockCDHDV6(BlockDefaultV6):
         self._load_header_from_xml(path)
 
     def _load_header_from_xml(self, path):
-        tree = et.parse(path)
+        tree = self.context.storage.parse_xml(path)
         root = tree.getroot()
 
         # Shared
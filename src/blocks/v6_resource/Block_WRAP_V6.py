@@ -1,6 +1,5 @@
 import os
 from blocks.v6_base import BlockContainerV6
-import scummpacker_control as control
 import scummpacker_util as util
 
 class BlockWRAPV6(BlockContainerV6):
@@ -11,7 +10,7 @@ class BlockWRAPV6(BlockContainerV6):
         apal_counter = 0
         end = start + self.size
         while resource.tell() < end:
-            block = control.block_dispatcher.dispatch_next_block(resource)
+            block = self.context.block_dispatcher.dispatch_next_block(resource)
             block.load_from_resource(resource, room_start)
             if block.name == self.offset_block_name:
                 # Read in, but ignore the offset block, since we can generate it.
@@ -23,16 +22,27 @@ class BlockWRAPV6(BlockContainerV6):
                 raise util.ScummPackerException("Unexpected block \"%s\" found in WRAP container (only expecting APAL or OFFS)." % block.name)
             self.append(block)
 
-    def save_to_resource(self, resource, room_start=0):
-        start = resource.tell()
+    def compute_size(self):
+        self._plan_offsets()
+        return self.size
 
-        # write dummy header
-        self._write_dummy_header(resource, True)
-        # process children
+    def _plan_offsets(self):
+        """ Works out this block's size, and the offset of each APAL block
+        from the start of the offsets block."""
+        offsets = []
+        offset = 8 + len(self.children) * 4 # offsets block
+        for c in self.children:
+            offsets.append(offset)
+            offset += c.compute_size()
+        self.size = self._get_header_size() + offset
+        return offsets
 
-        # First, write a dummy offsets block.
+    def save_to_resource(self, resource, room_start=0):
+        start = resource.tell()
+        planned_offsets = self._plan_offsets()
+        self._write_header(resource, True)
         start_contents = resource.tell()
-        self._write_dummy_offsets(resource)
+        self._write_offsets(resource, planned_offsets, True)
 
         offsets = []
         for c in self.children:
@@ -40,23 +50,13 @@ class BlockWRAPV6(BlockContainerV6):
                 offsets.append(resource.tell() - start_contents) # keep track of offsets of each APAL block
                 c.save_to_resource(resource, room_start)
 
-        # go back and write size of block
-        end = resource.tell()
-        self.size = end - start
-        resource.flush()
-        resource.seek(start, os.SEEK_SET)
-        self._write_header(resource, True)
-        self._write_offsets(resource, offsets, True) # go back and write the real APAL offsets
-        resource.seek(end, os.SEEK_SET)
-
-    def _write_dummy_offsets(self, resource):
-        # Determine the number of APALs
-        num_apals = len(self.children)
-
-        resource.write(util.crypt(self.offset_block_name, self.crypt_value)) # write the block header's name
-        resource.write(util.int2str(0, 4, util.BE, self.crypt_value))
-        for _ in xrange(num_apals):
-            resource.write(util.int2str(0, 4, util.LE, self.crypt_value))
+        self._check_planned_size(resource, start)
+        if offsets != planned_offsets:
+            # The plan was wrong, so go back and write the real APAL offsets.
+            end = resource.tell()
+            resource.seek(start_contents, os.SEEK_SET)
+            self._write_offsets(resource, offsets, True)
+            resource.seek(end, os.SEEK_SET)
 
     def _write_offsets(self, resource, offsets, encrypt):
         assert len(offsets) == len(self.children)
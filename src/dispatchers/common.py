@@ -1,5 +1,6 @@
 import logging
 import os
+import re
 import scummpacker_util as util
 
 class AbstractBlockDispatcher(object):
@@ -10,56 +11,157 @@ class AbstractBlockDispatcher(object):
     REGEX_BLOCKS = []
     ROOT_BLOCK = None
 
+    def __init__(self, *args, **kwds):
+        super(AbstractBlockDispatcher, self).__init__(*args, **kwds)
+        self.context = None # set by PackContext.assign_dispatchers
+        # Block names (or file names) resolved so far, and how often we've
+        #  been able to skip the lookup.
+        self._dispatch_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._combined_regex = self._compile_regex_blocks(self.REGEX_BLOCKS)
+
+    def __getstate__(self):
+        """ Index dispatchers are pickled by the index cache, without their context."""
+        state = self.__dict__.copy()
+        state["context"] = None
+        return state
+
+    def dispatch_root_block(self):
+        return self.ROOT_BLOCK(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
+
     def dispatch_and_load_from_resource(self, resource, room_start=0):
-        root_block = self.ROOT_BLOCK(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        root_block = self.dispatch_root_block()
         root_block.load_from_resource(resource, 0)
         return root_block
 
+    def dispatch_and_stream_to_file(self, resource, path, block_writer):
+        root_block = self.dispatch_root_block()
+        root_block.stream_to_file(resource, path, block_writer)
+        return root_block
+
+    def use_external_crypt(self):
+        """ Stops blocks created by this dispatcher from encrypting or decrypting
+        data themselves, because the resource stream does it for them (e.g. a
+        ResourceBuffer). Returns the crypt value the stream should use."""
+        crypt_value = self.CRYPT_VALUE
+        self.CRYPT_VALUE = None
+        # Cached names are stored as read, so they're no longer valid.
+        self._dispatch_cache = {}
+        return crypt_value
+
     def dispatch_next_block(self, resource):
-        assert type(resource) is file
-        block_name = self._read_block_name(resource)
-        if not self.CRYPT_VALUE is None:
-            block_name = util.crypt(block_name, self.CRYPT_VALUE)
-        if block_name in self.BLOCK_MAP:
-            block_type = self.BLOCK_MAP[block_name]
-        else:
-            block_type = self._dispatch_regex_block(block_name)
+        # Names are cached before decryption, so known blocks skip the crypt too.
+        raw_block_name = self._read_block_name(resource)
+        try:
+            block_type = self._dispatch_cache[raw_block_name]
+            self.cache_hits += 1
+        except KeyError:
+            self.cache_misses += 1
+            block_name = raw_block_name
+            if not self.CRYPT_VALUE is None:
+                block_name = util.crypt(block_name, self.CRYPT_VALUE)
+            block_type = self._resolve_block_type(block_name)
             if block_type is None:
                 block_type = self.DEFAULT_BLOCK
+            self._dispatch_cache[raw_block_name] = block_type
         #logging.debug("Dispatching new block: %s, loc: %s, using block type: %s" % (block_name, resource.tell(), block_type))
-        block = block_type(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE) # instantiate the block object
+        block = block_type(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context) # instantiate the block object
         return block
 
+    def _resolve_block_type(self, block_name):
+        if block_name in self.BLOCK_MAP:
+            return self.BLOCK_MAP[block_name]
+        return self._dispatch_regex_block(block_name)
+
+    def _compile_regex_blocks(self, regex_blocks):
+        """ Combines the REGEX_BLOCKS patterns into one regex, with a named
+        group per pattern, so a name only needs to be matched once. Python
+        tries alternatives in order, so the first matching pattern still wins.
+
+        Returns None if the patterns can't be combined (e.g. they use
+        different flags), in which case they're tried one at a time."""
+        if not regex_blocks:
+            return None
+        if len(set([re_pattern.flags for re_pattern, _ in regex_blocks])) > 1:
+            return None
+        combined = "|".join(["(?P<regex_block_%d>%s)" % (i, re_pattern.pattern)
+                             for i, (re_pattern, _) in enumerate(regex_blocks)])
+        try:
+            return (re.compile(combined, regex_blocks[0][0].flags),
+                    dict([("regex_block_%d" % i, block_type) for i, (_, block_type) in enumerate(regex_blocks)]))
+        except re.error:
+            return None
+
     def _dispatch_regex_block(self, block_name):
+        if self._combined_regex is not None:
+            combined_pattern, group_block_types = self._combined_regex
+            match = combined_pattern.match(block_name)
+            if match is None:
+                return None
+            return group_block_types[match.lastgroup]
         for re_pattern, block_type in self.REGEX_BLOCKS:
             if re_pattern.match(block_name) != None:
                 return block_type
         return None
 
+    def log_cache_stats(self):
+        logging.debug("%s resolved %d names: %d cache hits, %d cache misses." %
+                      (self.__class__.__name__, self.cache_hits + self.cache_misses,
+                       self.cache_hits, self.cache_misses))
+
     def _read_block_name(self, resource):
-        bname = resource.read(self.BLOCK_NAME_LENGTH)
-        resource.seek(-self.BLOCK_NAME_LENGTH, os.SEEK_CUR)
-        return bname
+        return self._peek(resource, self.BLOCK_NAME_LENGTH)
+
+    def _peek(self, resource, size, offset=0):
+        """ Reads upcoming bytes without changing the resource position.
+        Resource buffers can do this without reading and seeking back."""
+        if hasattr(resource, "read_ahead"):
+            return resource.read_ahead(size, offset)
+        if offset:
+            resource.seek(offset, os.SEEK_CUR)
+        data = resource.read(size)
+        resource.seek(-(offset + len(data)), os.SEEK_CUR)
+        return data
 
 class AbstractFileDispatcher(AbstractBlockDispatcher):
     IGNORED_BLOCKS = frozenset([])
 
     def dispatch_and_load_from_file(self, path):
-        root_block = self.ROOT_BLOCK(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        root_block = self.dispatch_root_block()
         root_block.load_from_file(path)
         return root_block
 
+    def dispatch_and_stream_to_resource(self, path, resource):
+        root_block = self.dispatch_root_block()
+        root_block.stream_to_resource(path, resource)
+        return root_block
+
     def dispatch_next_block(self, block_name):
-        if block_name in self.BLOCK_MAP:
-            block_type = self.BLOCK_MAP[block_name]
-        else:
-            block_type = self._dispatch_regex_block(block_name)
-            if block_type is None:
-                if not block_name in self.IGNORED_BLOCKS:
-                    logging.warning("Ignoring unknown file: " + str(block_name))
-                return None
-        block = block_type(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        try:
+            block_type = self._dispatch_cache[block_name]
+            self.cache_hits += 1
+        except KeyError:
+            self.cache_misses += 1
+            block_type = self._resolve_block_type(block_name)
+            self._dispatch_cache[block_name] = block_type
+        if block_type is None:
+            if not block_name in self.IGNORED_BLOCKS:
+                logging.warning("Ignoring unknown file: " + str(block_name))
+            return None
+        block = block_type(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         return block
+
+    def get_block_type(self, block_name):
+        """ Returns the class that would be used for a file or directory name,
+        or None if it's not recognised, without creating a block or logging
+        anything."""
+        try:
+            return self._dispatch_cache[block_name]
+        except KeyError:
+            block_type = self._resolve_block_type(block_name)
+            self._dispatch_cache[block_name] = block_type
+            return block_type
     
 class AbstractIndexDispatcher(AbstractBlockDispatcher):
     def dispatch_and_load_from_resource(self, resource, room_start=0):
@@ -55,11 +55,7 @@ class BlockDispatcherV4(AbstractBlockDispatcher):
 
     def _read_block_name(self, resource):
         """ SCUMM v3 and v4 stores block size before the block name."""
-        resource.seek(4, os.SEEK_CUR)
-        bname = resource.read(self.BLOCK_NAME_LENGTH)
-        resource.seek(-self.BLOCK_NAME_LENGTH, os.SEEK_CUR)
-        resource.seek(-4, os.SEEK_CUR)
-        return bname
+        return self._peek(resource, self.BLOCK_NAME_LENGTH, 4)
 
 class FileDispatcherV4(AbstractFileDispatcher):
     CRYPT_VALUE = 0x69
@@ -132,11 +128,7 @@ class IndexBlockContainerV4(AbstractIndexDispatcher):
     
     def _read_block_name(self, resource):
         """ SCUMM v3 and v4 stores block size before the block name."""
-        resource.seek(4, os.SEEK_CUR)
-        bname = resource.read(self.BLOCK_NAME_LENGTH)
-        resource.seek(-self.BLOCK_NAME_LENGTH, os.SEEK_CUR)
-        resource.seek(-4, os.SEEK_CUR)
-        return bname
+        return self._peek(resource, self.BLOCK_NAME_LENGTH, 4)
     
     def load_from_file(self, path):
         self.children = []
@@ -144,22 +136,22 @@ class IndexBlockContainerV4(AbstractIndexDispatcher):
         # Crappy crappy crap
         # It's like this because blocks need to be in a specific order
         if self.USE_ROOMNAMES:
-            rnam_block = blocks.BlockRNV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+            rnam_block = blocks.BlockRNV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
             rnam_block.load_from_file(os.path.join(path, "roomnames.xml"))
             self.children.append(rnam_block)
 
-        d_block = blocks.Block0RV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = blocks.Block0RV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         self.children.append(d_block)
-        d_block = blocks.BlockIndexDirectoryV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = blocks.BlockIndexDirectoryV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         d_block.name = "0S"
         self.children.append(d_block)
-        d_block = blocks.BlockIndexDirectoryV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = blocks.BlockIndexDirectoryV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         d_block.name = "0N"
         self.children.append(d_block)
-        d_block = blocks.BlockIndexDirectoryV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = blocks.BlockIndexDirectoryV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         d_block.name = "0C"
         self.children.append(d_block)
 
-        dobj_block = blocks.Block0OV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        dobj_block = blocks.Block0OV4(self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         dobj_block.load_from_file(os.path.join(path, "dobj.xml"))
         self.children.append(dobj_block)
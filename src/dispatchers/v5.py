@@ -58,11 +58,6 @@ class BlockDispatcherV5(AbstractBlockDispatcher):
     DEFAULT_BLOCK = blocks.BlockDefaultV5
     ROOT_BLOCK = blocks.BlockLECFV5
 
-    def _read_block_name(self, resource):
-        bname = resource.read(self.BLOCK_NAME_LENGTH)
-        resource.seek(-self.BLOCK_NAME_LENGTH, os.SEEK_CUR)
-        return bname
-
 class FileDispatcherV5(AbstractFileDispatcher):
     CRYPT_VALUE = 0x69
     BLOCK_NAME_LENGTH = 4
@@ -148,30 +143,30 @@ class IndexBlockContainerV5(AbstractIndexDispatcher):
 
         # Crappy crappy crap
         # It's like this because blocks need to be in a specific order
-        rnam_block = self.BLOCK_MAP["RNAM"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        rnam_block = self.BLOCK_MAP["RNAM"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         rnam_block.load_from_file(os.path.join(path, "roomnames.xml"))
         self.children.append(rnam_block)
 
-        maxs_block = self.BLOCK_MAP["MAXS"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        maxs_block = self.BLOCK_MAP["MAXS"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         maxs_block.load_from_file(os.path.join(path, "maxs.xml"))
         self.children.append(maxs_block)
 
-        d_block = self.BLOCK_MAP["DROO"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = self.BLOCK_MAP["DROO"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         self.children.append(d_block)
-        d_block = self.BLOCK_MAP["DSCR"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = self.BLOCK_MAP["DSCR"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         d_block.name = "DSCR"
         self.children.append(d_block)
-        d_block = self.BLOCK_MAP["DSOU"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = self.BLOCK_MAP["DSOU"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         d_block.name = "DSOU"
         self.children.append(d_block)
-        d_block = self.BLOCK_MAP["DCOS"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = self.BLOCK_MAP["DCOS"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         d_block.name = "DCOS"
         self.children.append(d_block)
-        d_block = self.BLOCK_MAP["DCHR"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        d_block = self.BLOCK_MAP["DCHR"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         d_block.name = "DCHR"
         self.children.append(d_block)
 
-        dobj_block = self.BLOCK_MAP["DOBJ"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        dobj_block = self.BLOCK_MAP["DOBJ"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         dobj_block.load_from_file(os.path.join(path, "dobj.xml"))
         self.children.append(dobj_block)
 
@@ -87,6 +87,6 @@ class IndexBlockContainerV6(IndexBlockContainerV5):
     def load_from_file(self, path):
         IndexBlockContainerV5.load_from_file(self, path)
 
-        aary_block = self.BLOCK_MAP["AARY"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE)
+        aary_block = self.BLOCK_MAP["AARY"](self.BLOCK_NAME_LENGTH, self.CRYPT_VALUE, self.context)
         aary_block.load_from_file(os.path.join(path, "aary.xml"))
         self.children.append(aary_block)
@@ -26,6 +26,10 @@ THE SOFTWARE.
 
 import logging
 import sys
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None # Python 2.5; unpacking with more than one job won't be available.
 import traceback
 import scummpacker_control as control
 import scummpacker_res_handler as res_handler
@@ -37,44 +41,90 @@ if sys.version_info[0] < 2 or (sys.version_info[0] == 2 and sys.version_info[1]
 
 def main():
     try:
-        logging.basicConfig(format="", level=logging.DEBUG)
-        logging.NORMAL = 15
-        logging.normal = lambda x: logging.log(logging.NORMAL, x)
-        logging.level = logging.NORMAL
-        # Delegate argument parsing to the global arguments container
-        control.global_args.parse_args()
-        args_validation = control.global_args.validate_args()
+        util.setup_logging()
+        # Delegate argument parsing to the arguments container
+        global_args = control.GlobalArguments()
+        global_args.parse_args()
+        args_validation = global_args.validate_args()
 
         if args_validation is not None:
             logging.error(args_validation)
-            control.global_args.print_help()
+            global_args.print_help()
             return 1
 
-        if control.global_args.unpack:
+        if global_args.unpack:
             logging.normal("Starting game resource unpacking.")
             # Check that we have an input file name
-            if control.global_args.input_file_name == None:
+            if global_args.input_file_name == None:
                 raise util.ScummPackerException("No input path specified")
             # Check that we have an output file name
-            if control.global_args.output_file_name == None:
+            if global_args.output_file_name == None:
                 raise util.ScummPackerException("No output path specified")
             
-            res_handler.global_res_handler.unpack()
+            res_handler.ResourceHandler(control.PackContext(global_args)).unpack()
             logging.normal("Finished!")
             return 0
 
-        elif control.global_args.pack:
+        elif global_args.pack:
             logging.normal("Starting packing to game resources.")
             # Check that we have an input file name
-            if control.global_args.input_file_name == None:
+            if global_args.input_file_name == None:
                 raise util.ScummPackerException("No input path specified")
             # Check that we have an output file name
-            if control.global_args.output_file_name == None:
+            if global_args.output_file_name == None:
                 raise util.ScummPackerException("No output path specified")
             
-            res_handler.global_res_handler.pack()
+            res_handler.ResourceHandler(control.PackContext(global_args)).pack()
             logging.normal("Finished!")
             return 0
+
+        elif global_args.extract:
+            logging.normal("Starting game resource extraction.")
+            # Check that we have an input file name
+            if global_args.input_file_name == None:
+                raise util.ScummPackerException("No input path specified")
+            # Check that we have an output file name
+            if global_args.output_file_name == None:
+                raise util.ScummPackerException("No output path specified")
+
+            res_handler.ResourceHandler(control.PackContext(global_args)).extract()
+            logging.normal("Finished!")
+            return 0
+
+        elif global_args.patch:
+            logging.normal("Starting game resource patching.")
+            # Check that we have an input file name
+            if global_args.input_file_name == None:
+                raise util.ScummPackerException("No input path specified")
+            # Check that we have an output file name
+            if global_args.output_file_name == None:
+                raise util.ScummPackerException("No output path specified")
+
+            res_handler.ResourceHandler(control.PackContext(global_args)).patch()
+            logging.normal("Finished!")
+            return 0
+
+        elif global_args.verify:
+            logging.normal("Starting round trip verification.")
+            # Check that we have an input file name
+            if global_args.input_file_name == None:
+                raise util.ScummPackerException("No input path specified")
+
+            differences = res_handler.ResourceHandler(control.PackContext(global_args)).verify()
+            if differences:
+                logging.error("The game resources don't pack back to the same bytes.")
+                return 1
+            logging.normal("The game resources pack back to the same bytes.")
+            logging.normal("Finished!")
+            return 0
+
+        elif global_args.list:
+            # Check that we have an input file name
+            if global_args.input_file_name == None:
+                raise util.ScummPackerException("No input path specified")
+
+            res_handler.ResourceHandler(control.PackContext(global_args)).list_blocks(sys.stdout)
+            return 0
         
     except Exception, e:
         logging.error("Unhandled exception occured: " + str(e))
@@ -82,5 +132,7 @@ def main():
         return 1
 
 if __name__ == "__main__":
+    if multiprocessing is not None:
+        multiprocessing.freeze_support()
     sys.exit(main())
 
@@ -0,0 +1,300 @@
+#! /usr/bin/python
+""" Micro-benchmarks for ScummPacker's hot paths.
+
+Run with the name of one or more benchmarks, or no arguments to run them all:
+    python scummpacker_bench.py crypt headers
+"""
+import array
+import cStringIO
+import copy
+import random
+import struct
+import sys
+import time
+import xml.etree.ElementTree as et
+import scummpacker_control as control
+import scummpacker_util as util
+
+CRYPT_VALUE = 0x69
+
+def _crypt_per_char(in_val, crypt_val):
+    """ The original per-character crypt function, kept for comparison."""
+    if crypt_val is None:
+        return in_val
+    if type(in_val) is str:
+        out_string = ''
+        for c in in_val:
+            out_string += chr(ord(c) ^ crypt_val)
+        return out_string
+    elif type(in_val) is array.ArrayType:
+        out_val = copy.deepcopy(in_val)
+        for i, byte in enumerate(out_val):
+            out_val[i] = byte ^ crypt_val
+        return out_val
+    raise util.ScummPackerException("Could not encrypt values of type: " + str(type(in_val)))
+
+def _time_it(func, repeat):
+    """ Returns the best time (in seconds) of a few runs of "repeat" calls."""
+    best = None
+    for _ in xrange(3):
+        start = time.time()
+        for _ in xrange(repeat):
+            func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def _report(label, num_bytes, elapsed):
+    if elapsed <= 0:
+        elapsed = 1e-9
+    print "  %-40s %10.2f MB/s" % (label, num_bytes / elapsed / (1024 * 1024))
+
+def _report_rate(label, count, elapsed):
+    if elapsed <= 0:
+        elapsed = 1e-9
+    print "  %-40s %10.0f calls/s" % (label, count / elapsed)
+
+def bench_crypt():
+    """ Throughput of util.crypt against the original per-character version,
+    for field-sized values (block names and sizes) and payload-sized values."""
+    print "crypt:"
+    for size, repeat in ((4, 20000), (4096, 200), (1024 * 1024, 2)):
+        data_str = ''.join([chr(i & 0xFF) for i in xrange(size)])
+        data_arr = array.array('B', data_str)
+        for label, data in (("str", data_str), ("array", data_arr)):
+            num_bytes = size * repeat
+            # The original is far too slow for big payloads, so run it less often.
+            old_repeat = max(1, repeat / 10) if size > 4096 else repeat
+            elapsed = _time_it(lambda: _crypt_per_char(data, CRYPT_VALUE), old_repeat)
+            _report("original %s, %d bytes" % (label, size), size * old_repeat, elapsed)
+            elapsed = _time_it(lambda: util.crypt(data, CRYPT_VALUE), repeat)
+            _report("table %s, %d bytes" % (label, size), num_bytes, elapsed)
+
+def _read_struct_data_interpreted(block, struct_data, resource):
+    """ The original, interpreted AbstractBlock.read_struct_data, kept for comparison."""
+    data = resource.read(struct_data['size'])
+    values = struct.unpack(struct_data['format'], data)
+    for a, v in zip(struct_data['attributes'], values):
+        setattr(block, a, v)
+
+def _write_struct_data_interpreted(block, struct_data, resource):
+    """ The original, interpreted AbstractBlock.write_struct_data, kept for comparison."""
+    data = struct.pack(struct_data['format'], *[getattr(block, a) for a in struct_data['attributes']])
+    resource.write(data)
+
+def _write_xml_interpreted(caller, parent_node, structure):
+    """ The original XMLHelper.write, kept for comparison."""
+    for name, marshaller, attr in structure:
+        node = et.SubElement(parent_node, name)
+        if marshaller == 'n':
+            _write_xml_interpreted(caller, node, attr)
+        elif marshaller == 'c':
+            getattr(caller, attr)(node, util.XMLHelper.WRITE)
+        else:
+            value = reduce(lambda a1, a2: getattr(a1, a2), attr.split("."), caller)
+            node.text = util.XML_WRITE_MARSHALLERS[marshaller](value)
+
+def _read_xml_interpreted(destination, parent_node, structure):
+    """ The original XMLHelper.read, kept for comparison."""
+    for name, marshaller, attr in structure:
+        node = parent_node.find(name)
+        if marshaller == 'n':
+            _read_xml_interpreted(destination, node, attr)
+        elif marshaller == 'c':
+            getattr(destination, attr)(node, util.XMLHelper.READ)
+        else:
+            value = util.XML_READ_MARSHALLERS[marshaller](node.text)
+            attr_split = attr.split(".")
+            target = reduce(lambda a1, a2: getattr(a1, a2), attr_split[:-1], destination)
+            setattr(target, attr_split[-1], value)
+
+def _xml_attributes(structure):
+    for _, marshaller, attr in structure:
+        if marshaller == 'n':
+            for a in _xml_attributes(attr):
+                yield a
+        elif marshaller != 'c':
+            yield attr
+
+def _make_header_block(block_class):
+    """ Creates a block with every declared attribute set to a small value."""
+    block = block_class(4, None)
+    block.size = 0
+    block.hotspots = []
+    for attr in block.struct_data.get('attributes', ()):
+        setattr(block, attr, 1)
+    for attr in _xml_attributes(block.xml_structure):
+        setattr(block, attr, 1)
+    return block
+
+def bench_headers():
+    """ Reading and writing the struct and XML declarations of the object
+    and room header blocks, compiled against the original interpreted code."""
+    import blocks
+    header_classes = (blocks.BlockOCV4, blocks.BlockIMHDV5, blocks.BlockCDHDV5,
+                      blocks.BlockIMHDV6, blocks.BlockCDHDV6, blocks.BlockMAXSV6,
+                      blocks.BlockRMHDV5)
+    repeat = 20000
+    print "headers:"
+    for block_class in header_classes:
+        block = _make_header_block(block_class)
+        label = block_class.__name__
+        struct_data = block.struct_data
+        if struct_data:
+            data = struct.pack(struct_data['format'], *([1] * len(struct_data['attributes'])))
+            resource = cStringIO.StringIO(data)
+            def read_old():
+                resource.seek(0)
+                _read_struct_data_interpreted(block, struct_data, resource)
+            def read_new():
+                resource.seek(0)
+                block.read_struct_data(struct_data, resource, False)
+            _report_rate("%s struct read, original" % label, repeat, _time_it(read_old, repeat))
+            _report_rate("%s struct read, compiled" % label, repeat, _time_it(read_new, repeat))
+            outfile = cStringIO.StringIO()
+            _report_rate("%s struct write, original" % label, repeat,
+                         _time_it(lambda: _write_struct_data_interpreted(block, struct_data, outfile), repeat))
+            _report_rate("%s struct write, compiled" % label, repeat,
+                         _time_it(lambda: block.write_struct_data(struct_data, outfile, False), repeat))
+        structure = block.xml_structure
+        if structure:
+            root = et.Element("root")
+            block.generate_xml_node(root)
+            _report_rate("%s XML write, original" % label, repeat,
+                         _time_it(lambda: _write_xml_interpreted(block, et.Element("root"), structure), repeat))
+            _report_rate("%s XML write, compiled" % label, repeat,
+                         _time_it(lambda: block.generate_xml_node(et.Element("root")), repeat))
+            _report_rate("%s XML read, original" % label, repeat,
+                         _time_it(lambda: _read_xml_interpreted(block, root, structure), repeat))
+            _report_rate("%s XML read, compiled" % label, repeat,
+                         _time_it(lambda: block.read_xml_node(root), repeat))
+
+class _DictIndexMappingContainer(object):
+    """ The original dict-based IndexMappingContainer, kept for comparison."""
+    def __init__(self, *args):
+        self.index_map = {}
+        for s in args:
+            self.index_map[s] = {}
+
+    def map_index(self, map_name, key, index):
+        if not map_name in self.index_map:
+            raise util.ScummPackerException("Unrecognised block \"" + str(map_name) + "\" tried to store a global index.")
+        self.index_map[map_name][key] = index
+
+    def get_index(self, map_name, key):
+        if not map_name in self.index_map:
+            raise util.ScummPackerException("Unrecognised block \"" + str(map_name) + "\" tried to retrieve a global index.")
+        if not key in self.index_map[map_name]:
+            raise util.ScummPackerUnrecognisedIndexException("Block \"" + str(map_name)
+                                                             + "\" tried to retrieve an unrecognised global index \""
+                                                             + str(key) + "\".")
+        return self.index_map[map_name][key]
+
+    def items(self, map_name):
+        return self.index_map[map_name].items()
+
+# Roughly the number of rooms and of each resource type in DOTT's index.
+INDEX_ROOMS = 91
+INDEX_RESOURCES = (("SCRP", 199), ("SOUN", 250), ("COST", 184), ("CHAR", 9))
+
+def _fill_index_map(index_map):
+    """ Maps rooms and resources the way packing does, returning the
+    (room start, location, block name) of every resource."""
+    rng = random.Random(0)
+    blocks = []
+    room_starts = []
+    location = 8
+    for room_num in xrange(1, INDEX_ROOMS + 1):
+        room_start = location
+        room_starts.append((room_num, room_start))
+        index_map.map_index("LFLF", (1, room_start), room_num)
+        index_map.map_index("ROOM", room_num, room_start + 8)
+        index_map.map_index("Disk", room_num, 1)
+        location += rng.randint(10000, 60000)
+    for name, count in INDEX_RESOURCES:
+        for index in xrange(count):
+            room_num, room_start = room_starts[rng.randrange(len(room_starts))]
+            location = room_start + rng.randint(100, 10000)
+            index_map.map_index(name, (room_num, location - room_start - 8), index)
+            blocks.append((room_start, location, name))
+    return sorted(blocks) # in the order they're read
+
+def _lookup_dict(index_map, blocks):
+    """ BlockGloballyIndexed's original lookup, three calls and an
+    exception for unknown blocks."""
+    for room_start, location, name in blocks:
+        try:
+            room_num = index_map.get_index("LFLF", (1, room_start))
+            room_offset = index_map.get_index("ROOM", room_num)
+            index_map.get_index(name, (room_num, location - room_offset))
+        except util.ScummPackerUnrecognisedIndexException:
+            pass
+
+def _lookup_table(index_map, blocks):
+    for room_start, location, name in blocks:
+        index_map.find_block_index("LFLF", "ROOM", name, 1, room_start, location)
+
+def _dict_map_size(index_map):
+    size = 0
+    for block_map in index_map.index_map.values():
+        size += sys.getsizeof(block_map)
+        size += sum([sys.getsizeof(k) for k in block_map if isinstance(k, tuple)])
+    return size
+
+def _table_map_size(index_map):
+    size = 0
+    for table in index_map.index_map.values():
+        size += sys.getsizeof(table) + sys.getsizeof(table.__dict__)
+        size += sys.getsizeof(table._keys) + sys.getsizeof(table._values)
+    return size
+
+def bench_index():
+    """ Lookups, directory ordering and memory of the global index map for
+    a DOTT-sized index, against the original dict-based map."""
+    names = ["LFLF", "ROOM", "Disk"] + [name for name, _ in INDEX_RESOURCES]
+    old_map = _DictIndexMappingContainer(*names)
+    new_map = control.IndexMappingContainer(*names)
+    blocks = _fill_index_map(old_map)
+    _fill_index_map(new_map)
+    unknown_blocks = [(room_start, location + 1, name) for room_start, location, name in blocks]
+    repeat = 20
+    print "index:"
+    for label, lookup_blocks in (("known", blocks), ("unknown", unknown_blocks)):
+        count = len(lookup_blocks) * repeat
+        _report_rate("%s block lookup, original" % label, count,
+                     _time_it(lambda: _lookup_dict(old_map, lookup_blocks), repeat))
+        _report_rate("%s block lookup, tables" % label, count,
+                     _time_it(lambda: _lookup_table(new_map, lookup_blocks), repeat))
+    def directory_dict():
+        for name, _ in INDEX_RESOURCES:
+            items = old_map.items(name)
+            items.sort(cmp=lambda x, y: cmp(x[1], y[1]))
+            dict([(j, i) for i, j in items])
+    def directory_table():
+        for name, _ in INDEX_RESOURCES:
+            new_map.get_table(name)._reverse_map = None # as if the table had changed
+            new_map.get_table(name).reverse_map()
+    _report_rate("directory ordering, original", repeat, _time_it(directory_dict, repeat))
+    _report_rate("directory ordering, tables", repeat, _time_it(directory_table, repeat))
+    print "  %-40s %10d bytes" % ("index map size, original", _dict_map_size(old_map))
+    print "  %-40s %10d bytes" % ("index map size, tables", _table_map_size(new_map))
+
+BENCHMARKS = {
+    "crypt" : bench_crypt,
+    "headers" : bench_headers,
+    "index" : bench_index,
+}
+
+def main(names):
+    if not names:
+        names = sorted(BENCHMARKS.keys())
+    for name in names:
+        if not name in BENCHMARKS:
+            print "Unknown benchmark: %s. Choose from: %s" % (name, ", ".join(sorted(BENCHMARKS.keys())))
+            return 1
+        BENCHMARKS[name]()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,10 +1,22 @@
 #! /usr/bin/python
 # Stores globals
+import array
+from bisect import bisect_left
 import os.path
 import logging
 from optparse import OptionParser
+import scummpacker_storage as storage
 import scummpacker_util as util
 
+# Pair keys of the global index map, e.g. (room number, offset), are packed
+#  into one number so each table's keys fit in one array. Where C longs are
+#  only 32 bits, use doubles, which hold integers exactly up to 2**53.
+_KEY_SHIFT = 32
+_KEY_MASK = (1 << _KEY_SHIFT) - 1
+_KEY_FIRST_MAX = 0xFFFF # room and disk numbers
+_KEY_TYPECODE = 'l' if array.array('l').itemsize >= 8 else 'd'
+_MISSING = object()
+
 class IndexCounter(object):
     def __init__(self, *args):
         self.index_map = {}
@@ -23,16 +35,152 @@ class IndexCounter(object):
         self.index_map[index_name] = self.index_map[index_name] + 1
         return self.index_map[index_name]
 
+    def add_counts(self, counts):
+        """ Adds the counts from another counter's index_map, e.g. one used in
+        a worker process."""
+        for index_name, count in counts.items():
+            if not index_name in self.index_map:
+                raise util.ScummPackerException("Unrecognised block \""
+                                                + str(index_name)
+                                                + "\" tried to add a counted index.")
+            self.index_map[index_name] = self.index_map[index_name] + count
+
+
+class IndexTable(object):
+    """ One table of the global index map, e.g. (room number, offset) -> index
+    for SCRP blocks.
+
+    Keys are kept sorted in an array, with their values in a parallel array,
+    so a lookup is a binary search and iterating gives the keys in order.
+    Keys are either all ints or all pairs of ints; pairs are packed into one
+    number. Values are ints, except in tables like RNAM that store other
+    things, which fall back to a list."""
+    def __init__(self):
+        self._pair_keys = None # not known until the first key is stored
+        self._keys = array.array(_KEY_TYPECODE)
+        self._values = array.array('l')
+        self._reverse_map = None
+
+    def _encode_key(self, key):
+        if self._pair_keys:
+            first, second = key
+            return (first << _KEY_SHIFT) | second
+        return key
+
+    def _decode_key(self, encoded_key):
+        encoded_key = int(encoded_key)
+        if self._pair_keys:
+            return (encoded_key >> _KEY_SHIFT, encoded_key & _KEY_MASK)
+        return encoded_key
+
+    def _is_valid_key(self, key):
+        if self._pair_keys:
+            return type(key) is tuple and len(key) == 2 and \
+                   0 <= key[0] <= _KEY_FIRST_MAX and 0 <= key[1] <= _KEY_MASK
+        return type(key) is not tuple and 0 <= key <= _KEY_MASK
+
+    def _insert_value(self, i, value):
+        if type(self._values) is array.ArrayType:
+            if isinstance(value, (int, long)):
+                try:
+                    self._values.insert(i, value)
+                    return
+                except OverflowError:
+                    pass
+            self._values = self._values.tolist()
+        self._values.insert(i, value)
+
+    def get(self, key, default=None):
+        # This is the hot path when reading resources, so it's all inline.
+        #  Keys that can't be stored just won't be found.
+        if self._pair_keys:
+            if type(key) is not tuple:
+                return default
+            key = (key[0] << _KEY_SHIFT) | key[1]
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i != len(keys) and keys[i] == key:
+            return self._values[i]
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if self._pair_keys is None:
+            self._pair_keys = type(key) is tuple
+        if not self._is_valid_key(key):
+            raise util.ScummPackerException("Invalid global index key: " + str(key))
+        self._reverse_map = None
+        encoded_key = self._encode_key(key)
+        keys = self._keys
+        # Keys usually arrive in order when packing, so check the end first.
+        if not keys or keys[-1] < encoded_key:
+            i = len(keys)
+        else:
+            i = bisect_left(keys, encoded_key)
+            if i < len(keys) and keys[i] == encoded_key:
+                del self._values[i]
+                self._insert_value(i, value)
+                return
+        keys.insert(i, encoded_key)
+        self._insert_value(i, value)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return [self._decode_key(k) for k in self._keys]
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        """ Returns key/value pairs, sorted by key."""
+        return zip(self.keys(), self._values)
+
+    def reverse_map(self):
+        """ Returns a dict of value -> key. If several keys have the same
+        value, the last one wins. Don't modify the dict; it's kept until the
+        table changes."""
+        if self._reverse_map is None:
+            self._reverse_map = dict(zip(self._values, self.keys()))
+        return self._reverse_map
+
+    def clear(self):
+        self.__init__()
+
+    def copy(self):
+        table = IndexTable()
+        table._pair_keys = self._pair_keys
+        table._keys = self._keys[:]
+        table._values = self._values[:]
+        return table
 
 class IndexMappingContainer(object):
     def __init__(self, *args):
-        self.index_map = {}
+        self._index_map = {}
         for s in args:
-            self.index_map[s] = {}
+            self._index_map[s] = IndexTable()
+        self._last_room = None # (lf_name, room_offset_name, disk_number, room_start, room_num, room_offset)
+
+    def set_index_map(self, index_map):
+        """ Replaces all the tables (block name -> IndexTable)."""
+        self._index_map = index_map
+        self._last_room = None
+
+    index_map = property((lambda self: self._index_map), set_index_map)
     
     def reset_maps(self):
-        for k in self.index_map:
-            self.index_map[k].clear()
+        for k in self._index_map:
+            self._index_map[k].clear()
+        self._last_room = None
             
     def map_index(self, map_name, key, index):
         self.__setitem__(map_name, key, index)
@@ -40,38 +188,73 @@ class IndexMappingContainer(object):
     def __setitem__(self, map_name, key, index):
         #if map_name == 'LFLF':
         #    raise util.ScummPackerException("test. %s %s" % (key, index))
-        if not map_name in self.index_map:
-            raise util.ScummPackerException("Unrecognised block \"" 
-                                            + str(map_name) 
-                                            + "\" tried to store a global index.")
         #logging.debug("Setting %s index : %s / %s" % (map_name, key, index))
-        self.index_map[map_name][key] = index
+        self._get_table(map_name, "store")[key] = index
+        if self._last_room is not None and map_name in self._last_room[:2]:
+            self._last_room = None
         
     def get_index(self, map_name, key):
         return self.__getitem__(map_name, key)
     
     def __getitem__(self, map_name, key):
         #logging.debug(map_name)
-        #logging.debug(self.index_map[map_name])
-        if not map_name in self.index_map:
-            raise util.ScummPackerException("Unrecognised block \"" 
-                                            + str(map_name) 
-                                            + "\" tried to retrieve a global index.")
-        if not key in self.index_map[map_name]:
+        #logging.debug(self._index_map[map_name])
+        index = self.find_index(map_name, key)
+        if index is None:
             raise util.ScummPackerUnrecognisedIndexException("Block \"" 
                                             + str(map_name) 
                                             + "\" tried to retrieve an unrecognised global index \""
                                             + str(key)
                                             + "\".")
-        return self.index_map[map_name][key]
+        return index
+
+    def find_index(self, map_name, key):
+        """ Like get_index, but returns None if there's no such index."""
+        try:
+            table = self._index_map[map_name]
+        except KeyError:
+            table = self._get_table(map_name, "retrieve")
+        return table.get(key)
+
+    def get_room(self, lf_name, room_offset_name, disk_number, room_start):
+        """ Returns the number and the ROOM block offset of the room whose
+        LFLF/LF block starts at room_start, in one call.
+
+        Blocks are read and written a room at a time, so the last room
+        looked up is remembered."""
+        last_room = self._last_room
+        if last_room is not None and last_room[3] == room_start and last_room[2] == disk_number and \
+           last_room[0] == lf_name and last_room[1] == room_offset_name:
+            return last_room[4], last_room[5]
+        room_num = self.get_index(lf_name, (disk_number, room_start))
+        room_offset = self.get_index(room_offset_name, room_num)
+        self._last_room = (lf_name, room_offset_name, disk_number, room_start, room_num, room_offset)
+        return room_num, room_offset
+
+    def find_block_index(self, lf_name, room_offset_name, lookup_name, disk_number, room_start, location):
+        """ Returns the index of the block at location in the room whose
+        LFLF/LF block starts at room_start, or None if it has no index."""
+        room_num, room_offset = self.get_room(lf_name, room_offset_name, disk_number, room_start)
+        try:
+            table = self._index_map[lookup_name]
+        except KeyError:
+            table = self._get_table(lookup_name, "retrieve")
+        return table.get((room_num, location - room_offset))
 
     def items(self, map_name):
-        """Returns key/value pairs for the desired block table."""
-        if not map_name in self.index_map:
+        """Returns key/value pairs for the desired block table, sorted by key."""
+        return self._get_table(map_name, "retrieve").items()
+
+    def get_table(self, map_name):
+        return self._get_table(map_name, "retrieve")
+
+    def _get_table(self, map_name, action):
+        table = self._index_map.get(map_name)
+        if table is None:
             raise util.ScummPackerException("Unrecognised block \""
                                             + str(map_name)
-                                            + "\" tried to retrieve a global index.")
-        return self.index_map[map_name].items()
+                                            + "\" tried to " + action + " a global index.")
+        return table
     
 class GlobalArguments(object):
     SCUMM_VERSION_GAME_MAP = {
@@ -101,8 +284,17 @@ class GlobalArguments(object):
         self._game = None
         self._input_file_name = None
         self._output_file_name = None
-        self._unpack = None
-        self._pack = None
+        self.unpack = None
+        self.pack = None
+        self.jobs = 1
+        self.incremental = False
+        self.index_cache = None
+        self.extract = None
+        self.patch = False
+        self.verify = False
+        self.list = False
+        self.list_format = "text"
+        self.compress = False
         self.oparser = OptionParser(usage="%prog [options]",
                                version="ScummPacker v3",
                                description="Packs and unpacks resources used by LucasArts adventure games.")
@@ -130,6 +322,49 @@ class GlobalArguments(object):
         self.oparser.add_option("-p", "--pack", action="store_true",
                            dest="pack", default=False,
                            help="Pack resources.")
+        self.oparser.add_option("-j", "--jobs", action="store", type="int",
+                           dest="jobs", default=1,
+                           help="Number of processes to use. When unpacking, resource files " +
+                           "(or the rooms of a single resource file) are read in parallel. " +
+                           "When packing, rooms are packed in parallel. Defaults to 1.")
+        self.oparser.add_option("--incremental", action="store_true",
+                           dest="incremental", default=False,
+                           help="When packing, copy rooms that haven't changed since the last pack " +
+                           "to the same output path from the old resource files, instead of packing " +
+                           "them again. A manifest of the packed rooms is kept in the output path. " +
+                           "When unpacking, only write files whose contents have changed, and remove " +
+                           "files left over from earlier unpacks.")
+        self.oparser.add_option("--index-cache", action="store",
+                           dest="index_cache",
+                           help="When unpacking, keep decoded index files (e.g. .000) in this " +
+                           "directory, and reuse them while the index file stays the same.")
+        self.oparser.add_option("-x", "--extract", action="store",
+                           dest="extract",
+                           help="Extract just these resources from the game resources, " +
+                           "without unpacking everything else, e.g. \"COST_139,SCRP_001\". " +
+                           "A resource type without a number, e.g. \"SOUN\", extracts every " +
+                           "resource of that type.")
+        self.oparser.add_option("--patch", action="store_true",
+                           dest="patch", default=False,
+                           help="Replace resources in the game resources in the output path, in place, " +
+                           "with the files in the input path (e.g. \"COST_139.dmp\", as saved when " +
+                           "unpacking or extracting), without packing the rest of the game.")
+        self.oparser.add_option("--verify", action="store_true",
+                           dest="verify", default=False,
+                           help="Check that the game resources in the input path pack back to the " +
+                           "same bytes, by unpacking and packing them in memory, and report the " +
+                           "first block that differs. Nothing is written to disk.")
+        self.oparser.add_option("--list", action="store_true",
+                           dest="list", default=False,
+                           help="List every block in the game resources in the input path, with its " +
+                           "offset and size, from the block headers alone. Nothing is unpacked.")
+        self.oparser.add_option("--list-format", action="store", type="choice",
+                           dest="list_format", default="text", choices=["text", "json"],
+                           help="Format of the block listing: \"text\" (the default) or \"json\".")
+        self.oparser.add_option("--compress", action="store_true",
+                           dest="compress", default=False,
+                           help="When unpacking or extracting to a zip archive (an output path ending in " +
+                           "\".zip\"), compress each file in the archive.")
         #self.oparser.set_defaults(scumm_version="5", game="MI2", output_file_name="outres")
 
     def set_scumm_version(self, scumm_version):
@@ -176,23 +411,58 @@ class GlobalArguments(object):
             return "A conflicting SCUMM version and game ID was specified. version: %s, game: %s." % (self.scumm_version, self.game)
         return None
 
-    def validate_args(self):
+    def validate_args(self, backend=None):
+        """ Returns a message saying what's wrong with the arguments, or None.
+        If a backend (see PackContext) is given, the paths are checked in it,
+        instead of on disk."""
         result = self.validate_scumm_version_and_game()
         if result != None:
             return result
         # validate that either pack or unpack is chosen
-        if not self.pack and not self.unpack:
-            return "Please specify whether to pack or unpack SCUMM resources."
-        # Validate input and output paths
-        if self.input_file_name is None or not os.path.isdir(self.input_file_name):
+        if not self.pack and not self.unpack and not self.extract and not self.patch and not self.verify \
+            and not self.list:
+            return "Please specify whether to pack, unpack, extract, patch, verify, or list SCUMM resources."
+        if self.jobs < 1:
+            return "Number of jobs must be at least 1: %s" % self.jobs
+        if backend is not None:
+            return self._validate_backend_paths(backend)
+        # Validate input and output paths. Unpacked files (the output when
+        #  unpacking or extracting, the input when packing or patching) can be
+        #  kept in a zip archive instead of a directory.
+        if (self.pack or self.patch) and storage.is_archive_path(self.input_file_name):
+            if not os.path.isfile(self.input_file_name):
+                return "Input archive does not exist: %s" % self.input_file_name
+        elif self.input_file_name is None or not os.path.isdir(self.input_file_name):
             return "Input path does not exist, or is not a directory: %s" % self.input_file_name
-        if self.output_file_name is None or not os.path.isdir(self.output_file_name):
+        if self.verify or self.list:
+            return None # nothing is written
+        if (self.unpack or self.extract) and storage.is_archive_path(self.output_file_name):
+            output_dir = os.path.dirname(os.path.abspath(self.output_file_name))
+            if not os.path.isdir(output_dir):
+                return "Output archive's directory does not exist: %s" % output_dir
+        elif self.output_file_name is None or not os.path.isdir(self.output_file_name):
             try:
                 os.mkdir(self.output_file_name)
             except OSError:
                 return "Output path could not be created, or is not a directory: " + str(self.output_file_name)
         return None
 
+    def _validate_backend_paths(self, backend):
+        if self.incremental or self.index_cache is not None:
+            return "Incremental packing and unpacking, and the index cache, can't be used with a storage backend."
+        if self.input_file_name is None or not backend.isdir(self.input_file_name):
+            return "Input path does not exist, or is not a directory: %s" % self.input_file_name
+        if self.verify or self.list:
+            return None
+        output_error = "Output path could not be created, or is not a directory: " + str(self.output_file_name)
+        if self.output_file_name is None:
+            return output_error
+        try:
+            backend.makedir(self.output_file_name)
+        except (IOError, OSError):
+            return output_error
+        return None
+
     def parse_args(self):
         options, args = self.oparser.parse_args()
         # @type options Values
@@ -204,6 +474,16 @@ class GlobalArguments(object):
         self.game = options.game
         self.input_file_name = options.input_file_name
         self.output_file_name = options.output_file_name
+        self.jobs = options.jobs
+        self.incremental = options.incremental
+        self.index_cache = options.index_cache
+        self.patch = options.patch
+        self.verify = options.verify
+        self.list = options.list
+        self.list_format = options.list_format
+        self.compress = options.compress
+        if options.extract:
+            self.extract = [name.strip() for name in options.extract.split(",") if name.strip()]
         
 
     def set_args(self, **kwds):
@@ -213,19 +493,62 @@ class GlobalArguments(object):
         self.validate_scumm_version_and_game()
         self._input_file_name = kwds["input_file_name"]
         self._output_file_name = kwds["output_file_name"]
-        self._unpack = kwds["unpack"]
-        self._pack = kwds["pack"]
+        self.unpack = kwds["unpack"]
+        self.pack = kwds["pack"]
+        self.jobs = kwds.get("jobs", 1)
+        self.incremental = kwds.get("incremental", False)
+        self.index_cache = kwds.get("index_cache", None)
+        self.extract = kwds.get("extract", None)
+        self.patch = kwds.get("patch", False)
+        self.verify = kwds.get("verify", False)
+        self.list = kwds.get("list", False)
+        self.list_format = kwds.get("list_format", "text")
+        self.compress = kwds.get("compress", False)
         
 
     def print_help(self):
         self.oparser.print_help()
 
 
-global_args = GlobalArguments()
+class PackContext(object):
+    """ Everything shared by the blocks of one pack or unpack: the
+    arguments, the global index map, the unknown block counts, which
+    resource file ("disk") is being read or written, the dispatchers for the
+    SCUMM version, and where files are read and written (see
+    scummpacker_storage): the storage of the unpacked files, and the
+    game_storage of the game resource files. Both are on disk unless a
+    backend is given, which is then used for all files, e.g. a
+    scummpacker_storage.MemoryStorage to pack or unpack in memory. A
+    separate game_storage can also be given, e.g. to unpack game resources
+    on disk into memory.
+
+    Dispatchers, and the blocks they create, keep a reference to their
+    context, so separate packs and unpacks (e.g. on different threads) don't
+    share any state."""
+    def __init__(self, global_args=None, backend=None, game_storage=None):
+        if global_args is None:
+            global_args = GlobalArguments()
+        self.global_args = global_args
+        self.backend = backend
+        self.global_index_map = IndexMappingContainer()
+        self.unknown_blocks_counter = IndexCounter()
+        self.disk_spanning_counter = 0 # stores which disk/resource file we're looking at.
+        self.index_dispatcher = None
+        self.block_dispatcher = None
+        self.file_dispatcher = None
+        if backend is None:
+            backend = storage.LocalStorage()
+        if game_storage is None:
+            game_storage = backend
+        self.storage = backend # where unpacked files are read and written
+        self.game_storage = game_storage # where game resource files are read and written
 
-unknown_blocks_counter = IndexCounter()
-disk_spanning_counter = 0 # stores which disk/resource file we're looking at.
-global_index_map = IndexMappingContainer()
-index_dispatcher = None
-block_dispatcher = None
-file_dispatcher = None
\ No newline at end of file
+    def assign_dispatchers(self, index_dispatcher, block_dispatcher, file_dispatcher, indexed_blocks):
+        """ Takes the results of dispatchers.DispatcherFactory."""
+        for dispatcher in (index_dispatcher, block_dispatcher, file_dispatcher):
+            dispatcher.context = self
+        self.index_dispatcher = index_dispatcher
+        self.block_dispatcher = block_dispatcher
+        self.file_dispatcher = file_dispatcher
+        self.global_index_map = IndexMappingContainer(*indexed_blocks)
+        self.unknown_blocks_counter = IndexCounter(*indexed_blocks)
@@ -0,0 +1,71 @@
+#! /usr/bin/python
+# Caches decoded index files (.000 etc.), so repeated runs on the same game
+#  don't have to decode them again.
+import cPickle
+import hashlib
+import logging
+import os
+import scummpacker_util as util
+
+class IndexCache(object):
+    """ Saves the decoded index block, and the global index map and unknown
+    block counts as they were straight after decoding it, in cache_dir.
+
+    Each cache file belongs to one game's index file, and is only used if the
+    index file's size, modification time and hash all still match. The cache
+    files are pickles, so only use a cache directory you trust."""
+    CACHE_VERSION = 3 # change when blocks or the index map change shape
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _get_cache_path(self, index_path, game):
+        path_hash = hashlib.md5(os.path.normcase(os.path.abspath(index_path))).hexdigest()
+        return os.path.join(self.cache_dir, "%s_%s.cache" % (game, path_hash))
+
+    def _get_key(self, index_path):
+        stat = os.stat(index_path)
+        index_file = file(index_path, 'rb')
+        try:
+            content_hash = hashlib.md5(index_file.read()).hexdigest()
+        finally:
+            index_file.close()
+        return (self.CACHE_VERSION, stat.st_size, stat.st_mtime, content_hash)
+
+    def load(self, index_path, game):
+        """ Returns (index block, index map, unknown block counts) from the
+        cache, or None if there's nothing usable cached."""
+        cache_path = self._get_cache_path(index_path, game)
+        if not os.path.isfile(cache_path):
+            return None
+        try:
+            cache_file = file(cache_path, 'rb')
+            try:
+                key = cPickle.load(cache_file)
+                if key != self._get_key(index_path):
+                    return None
+                return cPickle.load(cache_file)
+            finally:
+                cache_file.close()
+        except Exception, e: # a broken cache shouldn't stop the index being read
+            logging.warning("Could not read the index cache %s: %s" % (cache_path, e))
+            return None
+
+    def save(self, index_path, game, index_block, index_map, unknown_counts):
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                raise util.ScummPackerException("Index cache path could not be created: " + str(self.cache_dir))
+        cache_path = self._get_cache_path(index_path, game)
+        # Write to a new file first, so an interrupted save can't leave a broken cache.
+        new_cache_path = cache_path + ".new"
+        cache_file = file(new_cache_path, 'wb')
+        try:
+            cPickle.dump(self._get_key(index_path), cache_file, 2)
+            cPickle.dump((index_block, index_map, unknown_counts), cache_file, 2)
+        finally:
+            cache_file.close()
+        if os.path.isfile(cache_path):
+            os.remove(cache_path)
+        os.rename(new_cache_path, cache_path)
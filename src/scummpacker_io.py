@@ -0,0 +1,593 @@
+#! /usr/bin/python
+# File-like wrappers around game resource files, a background writer for
+#  unpacked blocks, and incremental output of unpacked files.
+import array
+import cStringIO
+import mmap
+import os
+import Queue
+import shutil
+import sys
+import threading
+import xml.etree.ElementTree as et
+import scummpacker_util as util
+
+def is_seekable(fileobj):
+    """ Returns False for pipes and other streams that can only be written
+    (or read) in order."""
+    seekable = getattr(fileobj, "seekable", None)
+    if seekable is not None:
+        return seekable()
+    try:
+        fileobj.tell()
+    except (AttributeError, IOError):
+        return False
+    return True
+
+class ResourceBuffer(object):
+    """ Read-only, file-like view of a whole resource file.
+
+    The file is memory-mapped once and, if a crypt value is given, decrypted
+    in a single pass. After that, reads and seeks are just slices and offset
+    changes on the buffer, so parsing a resource file costs no further system
+    calls. Blocks that read from this buffer must not decrypt the data again
+    (see AbstractBlockDispatcher.use_external_crypt).
+
+    If the file's data is given, it's used instead of reading the file."""
+
+    def __init__(self, path, crypt_value=None, data=None):
+        self.name = path
+        self.crypt_value = crypt_value
+        self.closed = False
+        self._pos = 0
+        self._map = None
+        if data is not None:
+            if crypt_value is not None:
+                data = util.crypt(data, crypt_value)
+            self._data = data
+            self._size = len(data)
+            return
+        resource = file(path, 'rb')
+        try:
+            size = os.fstat(resource.fileno()).st_size
+            if size == 0:
+                self._data = ''
+            else:
+                self._map = mmap.mmap(resource.fileno(), size, access=mmap.ACCESS_READ)
+                if crypt_value is None:
+                    # Nothing to decrypt, so read straight from the mapping.
+                    self._data = self._map
+                else:
+                    self._data = util.crypt(self._map[:], crypt_value)
+                    self._map.close()
+                    self._map = None
+        finally:
+            resource.close()
+        self._size = size
+
+    def read(self, size=-1):
+        start = self._pos
+        if size < 0:
+            end = self._size
+        else:
+            end = min(start + size, self._size)
+        if end <= start:
+            return ''
+        self._pos = end
+        return self._data[start:end]
+
+    def read_view(self, size):
+        """ Like read, but returns a buffer object referencing the decrypted
+        data instead of copying it."""
+        start = self._pos
+        end = min(start + size, self._size)
+        if end <= start:
+            return buffer('')
+        self._pos = end
+        return buffer(self._data, start, end - start)
+
+    def read_ahead(self, size, offset=0):
+        """ Returns "size" bytes, starting "offset" bytes after the current
+        position, without moving the current position."""
+        start = self._pos + offset
+        return self._data[start:start + size]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise util.ScummPackerException("Invalid seek mode: " + str(whence))
+        if pos < 0:
+            raise IOError("Can not seek before the start of resource: " + str(self.name))
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._data = ''
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+MAX_READ_GAP = 64 * 1024
+
+def group_locations(locations, max_gap=MAX_READ_GAP):
+    """ Splits block locations into runs that can be read with one read each.
+    A run ends where the next location is more than max_gap bytes after the
+    last one. Returns lists of sorted, unique locations."""
+    runs = []
+    last = None
+    for location in sorted(set(locations)):
+        if last is None or location - last > max_gap:
+            runs.append([])
+        runs[-1].append(location)
+        last = location
+    return runs
+
+class ResourceSpan(object):
+    """ Read-only, file-like view of part of a resource file, read and
+    decrypted in one go. Positions are offsets in the whole file, so blocks
+    can be loaded from the span as if from the file itself.
+
+    The span can be extended once it's known how far its last block goes.
+    Blocks that read from this span must not decrypt the data again (see
+    AbstractBlockDispatcher.use_external_crypt)."""
+
+    def __init__(self, fileobj, start, size, crypt_value=None):
+        self.fileobj = fileobj
+        self.name = getattr(fileobj, "name", None)
+        self.crypt_value = crypt_value
+        self.start = start
+        self.reads = 0
+        self._data = ''
+        self._pos = start
+        self._read_more(size)
+
+    end = property(lambda self: self.start + len(self._data))
+
+    def _read_more(self, size):
+        self.fileobj.seek(self.end, os.SEEK_SET)
+        data = self.fileobj.read(size)
+        if self.crypt_value is not None:
+            data = util.crypt(data, self.crypt_value)
+        self._data += data
+        self.reads += 1
+
+    def extend_to(self, end):
+        """ Reads the rest of the file up to end, if it isn't already in the span."""
+        if end > self.end:
+            self._read_more(end - self.end)
+
+    def read(self, size=-1):
+        start = self._pos - self.start
+        if start < 0:
+            raise IOError("Can not read before the start of the span at %d in resource: %s" % (self.start, self.name))
+        if size < 0:
+            end = len(self._data)
+        else:
+            end = min(start + size, len(self._data))
+        if end <= start:
+            return ''
+        self._pos = self.start + end
+        return self._data[start:end]
+
+    def read_ahead(self, size, offset=0):
+        """ Returns "size" bytes, starting "offset" bytes after the current
+        position, without moving the current position."""
+        start = self._pos - self.start + offset
+        return self._data[start:start + size]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = self.end + offset
+        else:
+            raise util.ScummPackerException("Invalid seek mode: " + str(whence))
+        if pos < 0:
+            raise IOError("Can not seek before the start of resource: " + str(self.name))
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+class RebasedBuffer(object):
+    """ In-memory file for saving a block that will be written at "base" in a
+    resource file. Positions are offsets in the resource file, so the block
+    maps its real location in the global index map."""
+
+    def __init__(self, base):
+        self.base = base
+        self._buffer = cStringIO.StringIO()
+
+    def write(self, data):
+        self._buffer.write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            offset -= self.base
+            if offset < 0:
+                raise IOError("Can not seek before the start of the buffer at %d." % self.base)
+        self._buffer.seek(offset, whence)
+
+    def tell(self):
+        return self.base + self._buffer.tell()
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+MOVE_CHUNK_SIZE = 1024 * 1024
+
+def move_file_data(fileobj, start, delta, chunk_size=MOVE_CHUNK_SIZE):
+    """ Moves everything from start to the end of the file by delta bytes,
+    a chunk at a time. Moving forwards leaves the bytes between start and
+    start + delta as they were; moving backwards truncates the file. The data
+    isn't decrypted, since the crypt doesn't depend on the position."""
+    fileobj.seek(0, os.SEEK_END)
+    end = fileobj.tell()
+    if delta > 0:
+        # Copy from the end backwards, so nothing is overwritten before it's moved.
+        pos = end
+        while pos > start:
+            size = min(chunk_size, pos - start)
+            pos -= size
+            fileobj.seek(pos, os.SEEK_SET)
+            data = fileobj.read(size)
+            fileobj.seek(pos + delta, os.SEEK_SET)
+            fileobj.write(data)
+    elif delta < 0:
+        pos = start
+        while pos < end:
+            size = min(chunk_size, end - pos)
+            fileobj.seek(pos, os.SEEK_SET)
+            data = fileobj.read(size)
+            fileobj.seek(pos + delta, os.SEEK_SET)
+            fileobj.write(data)
+            pos += size
+        fileobj.truncate(end + delta)
+
+class XorFile(object):
+    """ Buffered file-like wrapper that encrypts data on the way out and
+    decrypts it on the way in, so blocks can use plain reads and writes.
+
+    Data is translated a whole buffer at a time rather than a field at a
+    time. The position is tracked here, so tell() never touches the
+    underlying file. Blocks writing to this file must not encrypt the data
+    themselves (see AbstractBlockDispatcher.use_external_crypt)."""
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, fileobj, crypt_value=None, buffer_size=BUFFER_SIZE):
+        self.fileobj = fileobj
+        self.crypt_value = crypt_value
+        self.buffer_size = buffer_size
+        self._table = None if crypt_value is None else util.get_crypt_table(crypt_value)
+        self._write_buffer = []
+        self._write_buffer_len = 0
+        self._read_buffer = ''
+        self._read_buffer_pos = 0
+        self._seekable = True
+        try:
+            self._pos = fileobj.tell()
+        except (AttributeError, IOError):
+            self._pos = 0 # pipes and other unseekable streams
+            self._seekable = False
+
+    name = property(lambda self: getattr(self.fileobj, "name", None))
+    closed = property(lambda self: self.fileobj.closed)
+
+    def _translate(self, data):
+        if self._table is None:
+            return data
+        return data.translate(self._table)
+
+    def write(self, data):
+        if type(data) is array.ArrayType:
+            data = data.tostring()
+        elif type(data) is not str:
+            data = str(data)
+        if self._read_buffer:
+            self._drop_read_buffer()
+        self._write_buffer.append(data)
+        self._write_buffer_len += len(data)
+        self._pos += len(data)
+        if self._write_buffer_len >= self.buffer_size:
+            self._flush_write_buffer()
+
+    def _flush_write_buffer(self):
+        if self._write_buffer_len:
+            self.fileobj.write(self._translate(''.join(self._write_buffer)))
+        self._write_buffer = []
+        self._write_buffer_len = 0
+
+    def _drop_read_buffer(self):
+        """ The underlying file has been read ahead of our position, so move it
+        back before doing anything else."""
+        self.fileobj.seek(self._pos, os.SEEK_SET)
+        self._read_buffer = ''
+        self._read_buffer_pos = 0
+
+    def _fill_read_buffer(self, size):
+        """ Makes sure at least "size" bytes are buffered, unless the end of the
+        file is reached first."""
+        self._flush_write_buffer()
+        available = len(self._read_buffer) - self._read_buffer_pos
+        if available >= size:
+            return
+        data = self.fileobj.read(max(size - available, self.buffer_size))
+        self._read_buffer = self._read_buffer[self._read_buffer_pos:] + self._translate(data)
+        self._read_buffer_pos = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            self._flush_write_buffer()
+            data = self._read_buffer[self._read_buffer_pos:] + self._translate(self.fileobj.read())
+            self._read_buffer = ''
+            self._read_buffer_pos = 0
+        else:
+            self._fill_read_buffer(size)
+            start = self._read_buffer_pos
+            data = self._read_buffer[start:start + size]
+            self._read_buffer_pos += len(data)
+        self._pos += len(data)
+        return data
+
+    def read_ahead(self, size, offset=0):
+        """ Returns "size" bytes, starting "offset" bytes after the current
+        position, without moving the current position."""
+        self._fill_read_buffer(offset + size)
+        start = self._read_buffer_pos + offset
+        return self._read_buffer[start:start + size]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._flush_write_buffer()
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+            whence = os.SEEK_SET
+        if whence == os.SEEK_SET and self._read_buffer:
+            # Short seeks while reading can stay inside the read buffer.
+            buffer_pos = self._read_buffer_pos + offset - self._pos
+            if 0 <= buffer_pos <= len(self._read_buffer):
+                self._read_buffer_pos = buffer_pos
+                self._pos = offset
+                return
+        self.fileobj.seek(offset, whence)
+        self._pos = self.fileobj.tell() if whence == os.SEEK_END else offset
+        self._read_buffer = ''
+        self._read_buffer_pos = 0
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return self._seekable
+
+    def flush(self):
+        self._flush_write_buffer()
+        self.fileobj.flush()
+
+    def close(self):
+        if not self.fileobj.closed:
+            self.flush()
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+class BlockWriter(object):
+    """ Saves blocks to files on a background thread, so the next block can be
+    read from the resource while the last one is being written out.
+
+    At most "max_pending" blocks wait to be saved; save() blocks until there's
+    room. Once a block has been saved, the writer drops its reference to it.
+    If saving fails, the error is raised again by the next call to save() or
+    close(), and any blocks still waiting are not saved."""
+    MAX_PENDING = 2
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self._queue = Queue.Queue(max_pending)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="BlockWriter")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def save(self, block, path):
+        """ Queues block.save_to_file(path)."""
+        self._raise_error()
+        if self._closed:
+            raise util.ScummPackerException("Can not save blocks to a closed BlockWriter.")
+        self._queue.put((block, path))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            block, path = item
+            del item
+            if self._error is None:
+                try:
+                    block.save_to_file(path)
+                except Exception:
+                    self._error = sys.exc_info()
+            del block
+
+    def _raise_error(self):
+        if self._error is not None:
+            exc_type, exc_value, tb = self._error
+            raise exc_type, exc_value, tb
+
+    def close(self):
+        """ Waits for all queued blocks to be saved."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't hide the original error behind one from the writer.
+            try:
+                self.close()
+            except Exception:
+                pass
+        return False
+
+class OutputTracker(object):
+    """ Used for incremental unpacking. Keeps track of every file and
+    directory created by the unpack, so that files left over from an earlier
+    unpack can be removed afterwards.
+
+    Paths are added from the BlockWriter thread as well as the main thread."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.paths = set()
+        self.files_changed = 0
+        self.files_unchanged = 0
+
+    def add_path(self, path, changed=None):
+        """ Records a directory, or a file (in which case "changed" says
+        whether it had to be written)."""
+        path = _normalise_path(path)
+        self._lock.acquire()
+        try:
+            self.paths.add(path)
+            if changed is not None:
+                if changed:
+                    self.files_changed += 1
+                else:
+                    self.files_unchanged += 1
+        finally:
+            self._lock.release()
+
+    def get_state(self):
+        """ Returns what has been recorded, e.g. to send from a worker process
+        back to the main process."""
+        return self.paths, self.files_changed, self.files_unchanged
+
+    def add_state(self, state):
+        paths, files_changed, files_unchanged = state
+        self._lock.acquire()
+        try:
+            self.paths.update(paths)
+            self.files_changed += files_changed
+            self.files_unchanged += files_unchanged
+        finally:
+            self._lock.release()
+
+    def remove_stale_paths(self):
+        """ Removes anything in the recorded directories that wasn't created by
+        this unpack. Returns the number of files and directories removed."""
+        removed = 0
+        for dir_path in sorted(self.paths):
+            if not os.path.isdir(dir_path):
+                continue
+            for name in sorted(os.listdir(dir_path)):
+                path = _normalise_path(os.path.join(dir_path, name))
+                if path in self.paths:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                removed += 1
+        return removed
+
+def _normalise_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+class _IncrementalOutputFile(object):
+    """ Buffers everything written to it, and on closing, only writes the file
+    if its contents are different to what's already there."""
+    def __init__(self, path, tracker):
+        self.name = path
+        self.closed = False
+        self._tracker = tracker
+        self._buffer = cStringIO.StringIO()
+
+    def write(self, data):
+        self._buffer.write(data)
+
+    def tell(self):
+        return self._buffer.tell()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        data = self._buffer.getvalue()
+        self._buffer.close()
+        changed = not _file_contains(self.name, data)
+        if changed:
+            out_file = file(self.name, 'wb')
+            try:
+                out_file.write(data)
+            finally:
+                out_file.close()
+        self._tracker.add_path(self.name, changed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+def _file_contains(path, data):
+    if not os.path.isfile(path) or os.path.getsize(path) != len(data):
+        return False
+    in_file = file(path, 'rb')
+    try:
+        return in_file.read() == data
+    finally:
+        in_file.close()
+
+def open_output_file(path, output_tracker=None):
+    """ Opens a file to save an unpacked block to. When unpacking
+    incrementally (with an output_tracker), the file is only written if its
+    contents have changed."""
+    if output_tracker is None:
+        return file(path, 'wb')
+    return _IncrementalOutputFile(path, output_tracker)
+
+def make_output_dir(path, output_tracker=None):
+    """ Creates a directory to save unpacked blocks to, if it doesn't exist."""
+    if not os.path.isdir(path):
+        os.mkdir(path) # throws an exception if can't create dir
+    if output_tracker is not None:
+        output_tracker.add_path(path)
+
+def write_xml_file(tree, path, output_tracker=None):
+    """ Saves an ElementTree (or its root element) to an output file."""
+    if not hasattr(tree, "getroot"):
+        tree = et.ElementTree(tree)
+    out_file = open_output_file(path, output_tracker)
+    try:
+        tree.write(out_file)
+    finally:
+        out_file.close()
@@ -0,0 +1,139 @@
+#! /usr/bin/python
+# Records which rooms were packed into each resource file, and where, so the
+#  next pack to the same output path can reuse the rooms that haven't changed.
+import hashlib
+import os
+import xml.etree.ElementTree as et
+import scummpacker_storage
+import scummpacker_util as util
+
+MANIFEST_FILE_NAME = "scummpacker_manifest.xml"
+HASH_CHUNK_SIZE = 64 * 1024
+
+def hash_directory(path, storage=None):
+    """ Returns a hash of the names and contents of every file under path,
+    read through storage (see scummpacker_storage), or from disk."""
+    if storage is None:
+        storage = scummpacker_storage.LocalStorage()
+    digest = hashlib.md5()
+    _hash_files(storage, path, "", digest)
+    return digest.hexdigest()
+
+def _hash_files(storage, path, relative_dir, digest):
+    """ Hashes the files in path, then the directories in it, in the same
+    order as os.walk, so hashes don't change with the storage."""
+    dir_names = []
+    for name in sorted(storage.listdir(path)):
+        file_path = os.path.join(path, name)
+        if storage.isdir(file_path):
+            dir_names.append(name)
+            continue
+        digest.update(relative_dir + "/" + name + "\x00")
+        in_file = storage.open_read(file_path)
+        try:
+            data = in_file.read(HASH_CHUNK_SIZE)
+            while data:
+                digest.update(data)
+                data = in_file.read(HASH_CHUNK_SIZE)
+        finally:
+            in_file.close()
+        digest.update("\x00")
+    for name in dir_names:
+        _hash_files(storage, os.path.join(path, name), (relative_dir + "/" + name).lstrip("/"), digest)
+
+def _key2xml(key):
+    if isinstance(key, tuple):
+        return ",".join([util.int2xml(k) for k in key])
+    return util.int2xml(key)
+
+def _xml2key(in_str):
+    if "," in in_str:
+        return tuple([util.xml2int(k) for k in in_str.split(",")])
+    return util.xml2int(in_str)
+
+class PackedRoom(object):
+    """ A room (LFLF/LF block) as it was packed into a resource file.
+
+    index_entries are the entries the room added to the global index map,
+    with the room saved at offset 0 (see PackedBlockPlaceholder)."""
+    def __init__(self, name, content_hash, location, size, index_entries):
+        self.name = name
+        self.content_hash = content_hash
+        self.location = location
+        self.size = size
+        self.index_entries = index_entries
+
+class PackManifest(object):
+    """ The rooms packed into each resource file, by room directory name.
+
+    A resource file's rooms can only be reused if the file hasn't been
+    changed since the manifest was saved."""
+    def __init__(self, game):
+        self.game = game
+        self.resource_files = {} # file name -> (size, mtime, {room name : PackedRoom})
+
+    def load_from_file(self, path):
+        """ Loads the manifest at path, if there is one for the same game."""
+        self.resource_files = {}
+        if not os.path.isfile(path):
+            return
+        root = et.parse(path).getroot()
+        if root.get("game") != self.game:
+            return
+        for rf_node in root.findall("resource-file"):
+            rooms = {}
+            for room_node in rf_node.findall("room"):
+                index_entries = [(e.get("map"), _xml2key(e.get("key")), util.xml2int(e.get("index")))
+                                 for e in room_node.findall("index-entry")]
+                room = PackedRoom(room_node.get("name"),
+                                  room_node.get("hash"),
+                                  util.xml2int(room_node.get("location")),
+                                  util.xml2int(room_node.get("size")),
+                                  index_entries)
+                rooms[room.name] = room
+            self.resource_files[rf_node.get("name")] = (util.xml2int(rf_node.get("size")),
+                                                        float(rf_node.get("mtime")),
+                                                        rooms)
+
+    def save_to_file(self, path):
+        root = et.Element("manifest")
+        root.set("game", self.game)
+        for file_name in sorted(self.resource_files.keys()):
+            size, mtime, rooms = self.resource_files[file_name]
+            rf_node = et.SubElement(root, "resource-file")
+            rf_node.set("name", file_name)
+            rf_node.set("size", util.int2xml(size))
+            rf_node.set("mtime", repr(mtime))
+            for room in sorted(rooms.values(), key=lambda r: r.location):
+                room_node = et.SubElement(rf_node, "room")
+                room_node.set("name", room.name)
+                room_node.set("hash", room.content_hash)
+                room_node.set("location", util.int2xml(room.location))
+                room_node.set("size", util.int2xml(room.size))
+                for map_name, key, index in sorted(room.index_entries):
+                    entry_node = et.SubElement(room_node, "index-entry")
+                    entry_node.set("map", map_name)
+                    entry_node.set("key", _key2xml(key))
+                    entry_node.set("index", util.int2xml(index))
+        util.indent_elementtree(root)
+        et.ElementTree(root).write(path)
+
+    def get_rooms(self, resource_path):
+        """ Returns the rooms packed into the resource file at resource_path,
+        by name, or an empty dict if the file has changed since it was packed."""
+        file_name = os.path.basename(resource_path)
+        if not file_name in self.resource_files or not os.path.isfile(resource_path):
+            return {}
+        size, mtime, rooms = self.resource_files[file_name]
+        stat = os.stat(resource_path)
+        if stat.st_size != size or stat.st_mtime != mtime:
+            return {}
+        return rooms
+
+    def set_rooms(self, resource_path, rooms):
+        """ Records the rooms just packed into the resource file at
+        resource_path, which must be closed."""
+        stat = os.stat(resource_path)
+        self.resource_files[os.path.basename(resource_path)] = (stat.st_size,
+                                                                stat.st_mtime,
+                                                                dict([(r.name, r) for r in rooms]))
@@ -1,25 +1,153 @@
 from __future__ import with_statement
+import cStringIO
 import logging
 import os
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None # Python 2.5
 import scummpacker_util as util
 import scummpacker_control as control
+import scummpacker_io as res_io
+import scummpacker_index_cache as index_cache
+import scummpacker_manifest as manifest
+import scummpacker_skeleton as skeleton
+import scummpacker_storage as storage
+import scummpacker_validate as validator
+import scummpacker_verify as verifier
 import dispatchers
+from blocks.common import BlockIndexDirectory, BlockLucasartsEntertainmentContainer
 
 dummy_set = frozenset(tuple())
 
-def assign_dispatchers(index_dispatcher, block_dispatcher, file_dispatcher, indexed_blocks):
-    """ This is pretty grotty."""
-    control.index_dispatcher = index_dispatcher
-    control.block_dispatcher = block_dispatcher
-    control.file_dispatcher = file_dispatcher
-    control.global_index_map = control.IndexMappingContainer(*indexed_blocks)
-    control.unknown_blocks_counter = control.IndexCounter(*indexed_blocks)
+def unpack_resource_file(context, resource_file, crypt_value, block_writer):
+    """ Reads one resource file (e.g. DISK01.LEC or 01.LFL), handing its
+    blocks to block_writer to be saved."""
+    resource_counter, res_name, disk_path = resource_file
+    logging.normal("Reading from %s" % res_name)
+    logging.normal("Saving resource %i to %s" % (resource_counter - 1, disk_path))
+    context.disk_spanning_counter = resource_counter
+    with res_io.XorFile(context.game_storage.open_read(res_name), crypt_value) as res_file:
+        context.block_dispatcher.dispatch_and_stream_to_file(res_file, disk_path, block_writer)
+
+# Set in each worker process by _init_worker.
+_worker_context = None
+_worker_index_map = None
+_worker_crypt_value = None
+_worker_archive_path = None
+
+def _init_worker(scumm_version, game, incremental, index_map, crypt_value, archive_path):
+    """ Sets up the context of a worker process, using a snapshot of the
+    global index map taken before any rooms were read or written.
+    archive_path is the zip archive to read unpacked files from, if they're
+    not in a directory."""
+    global _worker_context, _worker_index_map, _worker_crypt_value, _worker_archive_path
+    util.setup_logging()
+    global_args = control.GlobalArguments()
+    global_args.scumm_version = scumm_version
+    global_args.game = game
+    global_args.incremental = incremental
+    _worker_context = control.PackContext(global_args)
+    _worker_context.assign_dispatchers(*dispatchers.DispatcherFactory(scumm_version))
+    _worker_context.block_dispatcher.use_external_crypt()
+    _worker_context.file_dispatcher.use_external_crypt()
+    _worker_index_map = index_map
+    _worker_crypt_value = crypt_value
+    _worker_archive_path = archive_path
+    if archive_path is not None:
+        _worker_context.storage = storage.ZipStorage(archive_path, 'r')
+
+def _reset_worker_context():
+    """ Each job starts from the same index map and unknown block counts, so
+    the result doesn't depend on which worker gets which job."""
+    _worker_context.global_index_map.index_map = _copy_index_map(_worker_index_map)
+    _worker_context.unknown_blocks_counter.reset_counts()
+    if _worker_context.global_args.incremental and _worker_archive_path is None:
+        _worker_context.storage = storage.LocalStorage(res_io.OutputTracker())
+    return _worker_context
+
+def _get_unpack_worker_result(context, result):
+    """ Adds the unknown block counts, and the files written when unpacking
+    incrementally, to the result of an unpack job."""
+    output_state = None
+    if context.storage.output_tracker is not None:
+        output_state = context.storage.output_tracker.get_state()
+    return result, context.unknown_blocks_counter.index_map, output_state
+
+def _copy_index_map(index_map):
+    return dict([(map_name, block_map.copy()) for map_name, block_map in index_map.items()])
+
+def _unpack_resource_file_in_worker(resource_file):
+    """ Unpacks one resource file in a worker process."""
+    context = _reset_worker_context()
+    with res_io.BlockWriter() as block_writer:
+        unpack_resource_file(context, resource_file, _worker_crypt_value, block_writer)
+    return _get_unpack_worker_result(context, None)
+
+def _unpack_room_in_worker(room):
+    """ Unpacks one room (LFLF/LF block) in a worker process. The result is
+    the room's name and index."""
+    resource_counter, res_name, location, path = room
+    context = _reset_worker_context()
+    context.disk_spanning_counter = resource_counter
+    with res_io.XorFile(context.game_storage.open_read(res_name), _worker_crypt_value) as res_file:
+        res_file.seek(location, os.SEEK_SET)
+        block = context.block_dispatcher.dispatch_next_block(res_file)
+        block.load_from_resource(res_file)
+    block.save_to_file(path)
+    return _get_unpack_worker_result(context, (block.name, getattr(block, "index", None)))
+
+def _pack_room_in_worker(room):
+    """ Packs one room (LFLF/LF directory) in a worker process. See
+    _pack_room."""
+    resource_counter, path = room
+    context = _reset_worker_context()
+    return _pack_room(context, resource_counter, path, _worker_index_map)
+
+def pack_room_to_buffer(context, resource_counter, path):
+    """ Packs one room (LFLF/LF directory) in this process, like a worker
+    would, leaving the global index map as it was. See _pack_room."""
+    base_index_map = context.global_index_map.index_map
+    context.global_index_map.index_map = _copy_index_map(base_index_map)
+    try:
+        return _pack_room(context, resource_counter, path, base_index_map)
+    finally:
+        context.global_index_map.index_map = base_index_map
+
+def _pack_room(context, resource_counter, path, base_index_map):
+    """ Packs one room into a buffer starting at offset 0. Returns the
+    unencrypted data, and the entries it added to the global index map
+    compared to base_index_map (see PackedBlockPlaceholder)."""
+    context.disk_spanning_counter = resource_counter
+    block = context.file_dispatcher.dispatch_next_block(os.path.basename(path))
+    block.load_from_file(path)
+    outfile = cStringIO.StringIO()
+    block.save_to_resource(outfile)
+    index_entries = []
+    for map_name, block_map in context.global_index_map.index_map.items():
+        old_block_map = base_index_map.get(map_name, {})
+        for key, index in block_map.items():
+            if old_block_map.get(key) != index:
+                index_entries.append((map_name, key, index))
+    return outfile.getvalue(), index_entries
+
+def _attach_context(block, context):
+    """ Gives a block, and its children, the context to use. Blocks from the
+    index cache are pickled without one."""
+    block.context = context
+    for c in getattr(block, "children", ()):
+        _attach_context(c, context)
 
 class ResourceHandler(object):
     """Handles saving and loading from resource files, adjusting file names,
-    spanning across multiple resource files ("disks"), etc."""
+    spanning across multiple resource files ("disks"), etc.
+
+    Each handler packs or unpacks using its own context (see
+    scummpacker_control.PackContext), so separate handlers can run at the
+    same time on different threads."""
     
     SINGLE_ROOM_MULTI_FILE, MULTI_ROOM_MULTI_FILE, SINGLE_FILE = range(3)
+    ROOM_OFFSETS_READ_SIZE = 4096 # enough for the LECF/LE header and a full LOFF/FO block
     RESOURCE_FILE_TEMPLATES_PER_GAME = {
         "ZAKFM" : (SINGLE_ROOM_MULTI_FILE,
                   ("00", "LFL"),
@@ -84,122 +212,893 @@ class ResourceHandler(object):
 
     }
     
-    def unpack(self):       
-        # Get our dispatchers that know about the version-specific stuff.
-        assign_dispatchers(*dispatchers.DispatcherFactory(control.global_args.scumm_version))
-        # Get resource names
+    def __init__(self, context):
+        self.context = context
+
+    def unpack(self):
+        self._open_unpacked_storage(self.context.global_args.output_file_name, 'w')
+        try:
+            self._unpack_game()
+            if self.context.storage.output_tracker is not None:
+                self._finish_incremental_unpack(self.context.storage.output_tracker)
+        finally:
+            self._close_unpacked_storage()
+
+    def _open_unpacked_storage(self, path, mode):
+        """ Sets up the storage of the unpacked files in path (see
+        scummpacker_storage): the context's backend if it has one, otherwise a
+        zip archive if path ends with ".zip", or a directory. mode is "r" to
+        read them, or "w" to write them."""
+        global_args = self.context.global_args
+        if self.context.backend is not None:
+            self.context.storage = self.context.backend
+        elif storage.is_archive_path(path):
+            if mode == 'w' and global_args.incremental:
+                logging.warning("Incremental unpacking isn't supported for archives, so the whole archive will be written.")
+            self.context.storage = storage.ZipStorage(path, mode, global_args.compress)
+        elif mode == 'w' and global_args.incremental:
+            self.context.storage = storage.LocalStorage(res_io.OutputTracker())
+        else:
+            self.context.storage = storage.LocalStorage()
+
+    def _close_unpacked_storage(self):
+        if self.context.backend is not None:
+            return # the backend belongs to whoever made the context
         try:
-            spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self.RESOURCE_FILE_TEMPLATES_PER_GAME[control.global_args.game]
+            self.context.storage.close()
+        finally:
+            self.context.storage = storage.LocalStorage()
+
+    def _finish_incremental_unpack(self, output_tracker):
+        removed = output_tracker.remove_stale_paths()
+        logging.normal("Wrote %d changed files, left %d unchanged files, and removed %d stale files or directories." %
+                       (output_tracker.files_changed, output_tracker.files_unchanged, removed))
+
+    def _get_resource_template(self):
+        """ Returns the resource file names to read for the game."""
+        try:
+            template = self.RESOURCE_FILE_TEMPLATES_PER_GAME[self.context.global_args.game]
         except KeyError:
-            raise util.ScummPackerException("No resource file template defined for game: %s" % control.global_args.game)
+            raise util.ScummPackerException("No resource file template defined for game: %s" % self.context.global_args.game)
         # HACK: support alternative resource names. TODO: do this better.
-        if control.global_args.game.endswith('alt'):
-            control.global_args.game = control.global_args.game[:-3]
-
-        # Load from resources
-        logging.normal("Loading from game resources...")
-        base_path = control.global_args.input_file_name
-        assert os.path.isdir(base_path)
-        resources = []
+        if self.context.global_args.game.endswith('alt'):
+            self.context.global_args.game = self.context.global_args.game[:-3]
+        return template
+
+    def _find_resource_files(self, base_path, spanning, resource_name, resource_ext, ignored_res):
+        """ Finds the resource files to read, which could be split across
+        multiple disk files. Returns the resource number and path of each."""
+        resource_files = []
         resource_counter = 1
-        
-        # read index
-        with file(os.path.join(base_path, index_name + "." + index_ext), 'rb') as index_file:
-            index_block = control.index_dispatcher.dispatch_and_load_from_resource(index_file)
-            
-        # read resources, which could be split across multiple disk files.
         while resource_counter < 100:
             # Look for 01.LFL, 02.LFL or DISK01.LEC, DISK02.LEC etc until no more found.
             rfn = resource_name.replace("%NN%", str(resource_counter).zfill(2)) + "." + resource_ext
-            print rfn
             if rfn in ignored_res:
                 resource_counter += 1
                 continue
             res_name = os.path.join(base_path, rfn)
             # SCUMM v3 can have gaps in room numbering/file names.
-            if not os.path.isfile(res_name):
+            if not self.context.game_storage.isfile(res_name):
                 if spanning == self.SINGLE_ROOM_MULTI_FILE:
                     resource_counter += 1
                     continue
                 else:
                     break
-            logging.normal("Reading from %s" % res_name)
-            control.disk_spanning_counter = resource_counter
-            with file(res_name, 'rb') as res_file:
-                resources.append(control.block_dispatcher.dispatch_and_load_from_resource(res_file))
+            resource_files.append((resource_counter, res_name))
             if spanning == self.SINGLE_FILE:
                 break
             else:
                 resource_counter += 1
-            
-        # Save to files
-        logging.normal("Saving to files...")        
-        base_path = control.global_args.output_file_name
-        assert os.path.isdir(base_path)        
-        for i, resource_block in enumerate(resources):
-            # SCUMM V3 can have gaps in numbering, so LFL Container block
-            #  handles creation of the output resource folders.
-            if spanning == self.SINGLE_ROOM_MULTI_FILE:
-                disk_path = base_path
-            else:
-                disk_path = os.path.join(base_path, resource_name.replace("%NN%", str(i + 1).zfill(2)))
-            logging.normal("Saving resource %i to %s" % (i, disk_path))
-            if not os.path.isdir(disk_path):
-                os.mkdir(disk_path)
-            resource_block.save_to_file(disk_path)
-        index_block.save_to_file(base_path)
-    
-    def pack(self):
-        # Get our dispatchers that know about the version-specific stuff.
-        assign_dispatchers(*dispatchers.DispatcherFactory(control.global_args.scumm_version))
-        # Get resource names
-        try:
-            spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self.RESOURCE_FILE_TEMPLATES_PER_GAME[control.global_args.game]
-        except KeyError:
-            raise util.ScummPackerException("No resource file template defined for game: %s" % control.global_args.game)
-        # Load from files
-        logging.normal("Loading from files...")
-        assert os.path.isdir(control.global_args.input_file_name)
-        base_path = control.global_args.input_file_name
-        resources = []
+        return resource_files
+
+    def _find_unpacked_resource_dirs(self, base_path, spanning, resource_name):
+        """ Finds the directories of unpacked resource files, which could be
+        split across multiple disks. Returns the resource number and path of
+        each."""
+        resource_dirs = []
         resource_counter = 1
-        # load folders, which represents disk spanning.
         while resource_counter < 100:
             # Look for DISK01, DISK02 etc until no more found.
             res_name = os.path.join(base_path, resource_name.replace("%NN%", str(resource_counter).zfill(2)))
-            if not os.path.isdir(res_name):
+            if not self.context.storage.isdir(res_name):
                 # SCUMM V3 names files by room number, which can have gaps.
                 if spanning == self.SINGLE_ROOM_MULTI_FILE:
                     resource_counter += 1
                     continue
                 else:
                     break
-            logging.normal("Reading from %s" % res_name)
-            control.disk_spanning_counter = resource_counter
-            resources.append(control.file_dispatcher.dispatch_and_load_from_file(res_name))
+            resource_dirs.append((resource_counter, res_name))
             if spanning == self.SINGLE_FILE:
                 break
             else:
                 resource_counter += 1
-        index_block = control.index_dispatcher.dispatch_and_load_from_file(control.global_args.input_file_name)
+        return resource_dirs
+
+    def _unpack_game(self):
+        # Get our dispatchers that know about the version-specific stuff.
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory(self.context.global_args.scumm_version))
+        # Get resource names
+        spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self._get_resource_template()
+
+        # Load from resources. Each room is saved to files as soon as it has
+        #  been read, rather than loading the whole game first.
+        logging.normal("Unpacking game resources...")
+        base_path = self.context.global_args.input_file_name
+        assert self.context.game_storage.isdir(base_path)
+        output_path = self.context.global_args.output_file_name
+        assert self.context.storage.isdir(output_path)
         
-        # Save to resources
-        logging.normal("Saving to game resources...")        
-        base_path = control.global_args.output_file_name
-        assert os.path.isdir(base_path)
-        for i, resource_block in enumerate(resources):
+        # The index is read through a decrypted buffer, and resource files
+        #  through a decrypting file wrapper, so the blocks themselves don't
+        #  need to decrypt anything.
+        index_crypt_value = self.context.index_dispatcher.use_external_crypt()
+        resource_crypt_value = self.context.block_dispatcher.use_external_crypt()
+
+        # read index
+        index_path = os.path.join(base_path, index_name + "." + index_ext)
+        index_block = self._load_index(index_path, index_crypt_value)
+            
+        # find resources, which could be split across multiple disk files.
+        resource_files = []
+        for resource_counter, res_name in self._find_resource_files(base_path, spanning, resource_name,
+                                                                    resource_ext, ignored_res):
+            # SCUMM V3 can have gaps in numbering, so LFL Container block
+            #  handles creation of the output resource folders.
             if spanning == self.SINGLE_ROOM_MULTI_FILE:
-                res_num = int(resource_block.name)
+                disk_path = output_path
+            else:
+                disk_path = os.path.join(output_path, resource_name.replace("%NN%", str(resource_counter).zfill(2)))
+                self.context.storage.makedir(disk_path)
+            resource_files.append((resource_counter, res_name, disk_path))
+
+        # read resources. Each file only depends on the index, so they can be
+        #  read by separate processes.
+        max_jobs = self.context.global_args.jobs
+        if max_jobs > 1 and self.context.backend is not None:
+            # Worker processes only read and write files on disk.
+            logging.warning("Unpacking with a storage backend only uses one job.")
+            max_jobs = 1
+        elif max_jobs > 1 and self.context.storage.archive_path is not None:
+            # Separate processes can't add files to the same archive.
+            logging.warning("Unpacking to an archive only uses one job.")
+            max_jobs = 1
+        jobs = min(max_jobs, len(resource_files))
+        if jobs > 1 and multiprocessing is None:
+            logging.warning("Python 2.6 or higher is required to unpack with more than one job.")
+            jobs = 1
+        if jobs > 1:
+            self._unpack_resource_files_in_parallel(resource_files, resource_crypt_value, jobs)
+        elif max_jobs > 1 and len(resource_files) == 1 and multiprocessing is not None and \
+             issubclass(self.context.block_dispatcher.ROOT_BLOCK, BlockLucasartsEntertainmentContainer):
+            # Just one resource file, so read its rooms in parallel instead.
+            self._unpack_rooms_in_parallel(resource_files[0], resource_crypt_value, max_jobs)
+        else:
+            # Saving happens on a background thread, while the next room is read.
+            with res_io.BlockWriter() as block_writer:
+                for resource_file in resource_files:
+                    unpack_resource_file(self.context, resource_file, resource_crypt_value, block_writer)
+        index_block.save_to_file(output_path)
+        self.context.index_dispatcher.log_cache_stats()
+        self.context.block_dispatcher.log_cache_stats()
+    
+    def _load_index(self, index_path, crypt_value):
+        """ Reads the index file, which fills the global index map, or takes it
+        from the index cache if one is being used."""
+        cache = None
+        if self.context.global_args.index_cache is not None:
+            cache = index_cache.IndexCache(self.context.global_args.index_cache)
+            cached = cache.load(index_path, self.context.global_args.game)
+            if cached is not None:
+                logging.normal("Using cached index for %s" % index_path)
+                index_block, self.context.global_index_map.index_map, unknown_counts = cached
+                self.context.unknown_blocks_counter.index_map = unknown_counts
+                _attach_context(index_block, self.context)
+                return index_block
+        with self.context.game_storage.open_buffer(index_path, crypt_value) as index_file:
+            index_block = self.context.index_dispatcher.dispatch_and_load_from_resource(index_file)
+        if cache is not None:
+            cache.save(index_path, self.context.global_args.game, index_block,
+                       self.context.global_index_map.index_map, self.context.unknown_blocks_counter.index_map)
+        return index_block
+
+    def _unpack_resource_files_in_parallel(self, resource_files, crypt_value, jobs):
+        logging.normal("Unpacking %d resource files with %d jobs..." % (len(resource_files), jobs))
+        self._run_unpack_workers(_unpack_resource_file_in_worker, resource_files, crypt_value, jobs)
+
+    def _unpack_rooms_in_parallel(self, resource_file, crypt_value, jobs):
+        """ Finds the rooms in the resource file using its LOFF/FO block, then
+        reads and saves each room in a worker process."""
+        resource_counter, res_name, disk_path = resource_file
+        logging.normal("Reading from %s" % res_name)
+        self.context.disk_spanning_counter = resource_counter
+        root_block = self.context.block_dispatcher.dispatch_root_block()
+        with res_io.XorFile(self.context.game_storage.open_read(res_name), crypt_value) as res_file:
+            path, locations = root_block.find_rooms_in_resource(res_file, disk_path)
+        rooms = [(resource_counter, res_name, location, path) for location in locations]
+        jobs = max(1, min(jobs, len(rooms)))
+        logging.normal("Unpacking %d rooms with %d jobs..." % (len(rooms), jobs))
+        root_block.add_saved_rooms(self._run_unpack_workers(_unpack_room_in_worker, rooms, crypt_value, jobs))
+        root_block.save_to_file(disk_path)
+
+    def _create_worker_pool(self, jobs, crypt_value):
+        return multiprocessing.Pool(jobs, _init_worker,
+                                    (self.context.global_args.scumm_version,
+                                     self.context.global_args.game,
+                                     self.context.global_args.incremental,
+                                     self.context.global_index_map.index_map,
+                                     crypt_value,
+                                     self.context.storage.archive_path))
+
+    def _run_unpack_workers(self, worker_func, jobs_list, crypt_value, jobs):
+        """ Runs worker_func over jobs_list in a process pool. Returns the
+        workers' results, in the same order as jobs_list."""
+        pool = self._create_worker_pool(jobs, crypt_value)
+        try:
+            results = pool.map(worker_func, jobs_list, 1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        # Merge in job order, so the totals don't depend on timing.
+        for _, counts, output_state in results:
+            self.context.unknown_blocks_counter.add_counts(counts)
+            if output_state is not None:
+                self.context.storage.output_tracker.add_state(output_state)
+        return [result for result, _, _ in results]
+
+    def extract(self):
+        """ Extracts just the resources named in the arguments, e.g. "COST_139",
+        or "SOUN" for every sound. The index file's directories (e.g. DCOS) and
+        the resource files' room offsets (LOFF/FO) give the location of each
+        one, so nothing else is read. Requests are sorted by location, and
+        nearby ones are read together. The resources are saved straight into
+        the output path, the same way as when unpacking.
+
+        Returns the (block name, index) of each resource extracted."""
+        self._open_unpacked_storage(self.context.global_args.output_file_name, 'w')
+        try:
+            return self._extract_resources()
+        finally:
+            self._close_unpacked_storage()
+
+    def _extract_resources(self):
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory(self.context.global_args.scumm_version))
+        spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self._get_resource_template()
+        if not issubclass(self.context.block_dispatcher.ROOT_BLOCK, BlockLucasartsEntertainmentContainer):
+            raise util.ScummPackerException("Extracting resources is only supported for games with LECF or LE resource files.")
+        base_path = self.context.global_args.input_file_name
+        assert self.context.game_storage.isdir(base_path)
+        output_path = self.context.global_args.output_file_name
+        assert self.context.storage.isdir(output_path)
+        index_crypt_value = self.context.index_dispatcher.use_external_crypt()
+        resource_crypt_value = self.context.block_dispatcher.use_external_crypt()
+        root_block = self.context.block_dispatcher.dispatch_root_block()
+
+        self._load_index(os.path.join(base_path, index_name + "." + index_ext), index_crypt_value)
+        wanted, named = self._find_wanted_resources(self.context.global_args.extract)
+
+        extracted = []
+        reads = 0
+        for resource_counter, res_name in self._find_resource_files(base_path, spanning, resource_name,
+                                                                    resource_ext, ignored_res):
+            logging.normal("Reading from %s" % res_name)
+            self.context.disk_spanning_counter = resource_counter
+            res_file = self.context.game_storage.open_read(res_name)
+            try:
+                room_offsets = res_io.ResourceSpan(res_file, 0, self.ROOM_OFFSETS_READ_SIZE, resource_crypt_value)
+                root_block.read_room_offsets(room_offsets)
+                reads += room_offsets.reads
+                located = self._locate_resources(wanted, resource_counter, root_block.OFFSET_CLASS)
+                for run in res_io.group_locations(located.keys()):
+                    run_extracted, run_reads = self._extract_run(res_file, resource_crypt_value, run,
+                                                                 located, output_path)
+                    extracted.extend(run_extracted)
+                    reads += run_reads
+            finally:
+                res_file.close()
+            for key in located.itervalues():
+                del wanted[key[:2]]
+        for block_name, index in sorted(wanted.keys()):
+            if (block_name, index) in named:
+                logging.error("%s_%s could not be found in the resource files." % (block_name, str(index).zfill(3)))
+        logging.normal("Extracted %d resources with %d reads." % (len(extracted), reads))
+        return extracted
+
+    def _get_extractable_names(self):
+        """ Block names that have a directory in the index file, e.g. COST."""
+        return frozenset([block_type.DIR_TYPES[name]
+                          for name, block_type in self.context.index_dispatcher.BLOCK_MAP.items()
+                          if issubclass(block_type, BlockIndexDirectory)])
+
+    def _find_wanted_resources(self, names):
+        """ Looks up the room number and offset of each named resource in the
+        index file's directories. Returns a dict of (block name, index) ->
+        (room number, offset), and the set of resources that were asked for by
+        number rather than by type."""
+        extractable = self._get_extractable_names()
+        wanted = {}
+        named = set()
+        for name in names:
+            if "_" in name:
+                block_name, index = name.split("_", 1)
+                try:
+                    index = int(index)
+                except ValueError:
+                    raise util.ScummPackerException("Invalid resource name: %s" % name)
+            else:
+                block_name, index = name, None
+            if not block_name in extractable:
+                raise util.ScummPackerException("Can not extract \"%s\". Resource types that can be extracted are: %s." %
+                                                (name, ", ".join(sorted(extractable))))
+            directory = self.context.global_index_map.get_table(block_name).reverse_map()
+            if index is None:
+                for i, key in directory.iteritems():
+                    wanted[(block_name, i)] = key
+            elif index in directory:
+                wanted[(block_name, index)] = directory[index]
+                named.add((block_name, index))
             else:
-                res_num = i + 1
-            disk_file_name = os.path.join(base_path, (resource_name + "." + resource_ext).replace("%NN%", str(res_num).zfill(2)))
-            logging.normal("Saving to %s" % disk_file_name)
-            control.disk_spanning_counter = i + 1
-            with file(disk_file_name, 'wb') as disk_file:
-                resource_block.save_to_resource(disk_file)
-
-        with file(os.path.join(base_path, index_name + "." + index_ext), 'wb') as index_file:
+                logging.error("%s has no entry in the index file." % name)
+        return wanted, named
+
+    def _locate_resources(self, wanted, disk_number, offset_class):
+        """ Finds the wanted resources in the rooms of the current resource
+        file, whose room offsets must have been read. Returns a dict of
+        location -> (block name, index, start of the room's LFLF/LF block)."""
+        room_starts = self.context.global_index_map.get_table(offset_class.LFLF_NAME).reverse_map()
+        located = {}
+        for (block_name, index), (room_num, offset) in wanted.iteritems():
+            room_start = room_starts.get(room_num)
+            if room_start is None or room_start[0] != disk_number:
+                continue
+            room_offset = self.context.global_index_map.get_index(offset_class.ROOM_OFFSET_NAME, room_num)
+            located[room_offset + offset] = (block_name, index, room_start[1])
+        return located
+
+    def _extract_run(self, res_file, crypt_value, run, located, output_path):
+        """ Reads the resources at the locations in run (see
+        scummpacker_io.group_locations) and saves them. The headers are read
+        first, to find out how far the run goes, then the rest of it is read
+        in one go. Returns the (block name, index) of each resource saved, and
+        the number of reads."""
+        header_size = self.context.block_dispatcher.BLOCK_NAME_LENGTH + 4
+        span = res_io.ResourceSpan(res_file, run[0], run[-1] + header_size - run[0], crypt_value)
+        end = span.end
+        for location in run:
+            span.seek(location, os.SEEK_SET)
+            block = self.context.block_dispatcher.dispatch_next_block(span)
+            block.read_header_from_resource(span)
+            end = max(end, location + block.size)
+        span.extend_to(end)
+        extracted = []
+        for location in run:
+            block_name, index, room_start = located[location]
+            span.seek(location, os.SEEK_SET)
+            block = self.context.block_dispatcher.dispatch_next_block(span)
+            block.load_from_resource(span, room_start)
+            if getattr(block, "lookup_name", None) != block_name or block.index != index:
+                logging.error("The index file entry for %s_%s points to block \"%s\" at offset %d, so it can not be extracted." %
+                              (block_name, str(index).zfill(3), block.name, location))
+                continue
+            block.save_to_file(output_path)
+            extracted.append((block_name, index))
+        return extracted, span.reads
+
+    def patch(self):
+        """ Replaces resources in the game resources in the output path, in
+        place, with the files in the input path, e.g. "COST_139.dmp" as saved
+        by unpack or extract. Only globally indexed resources (e.g. scripts and
+        costumes) can be replaced.
+
+        Each new block is written over the old one. If its size is different,
+        the rest of the resource file is moved up or down, and the sizes of
+        the room (LFLF/LF) and the LECF/LE block, the offsets of the later
+        rooms (LOFF/FO), and the index file entries for the blocks after it in
+        the same room are corrected. Nothing else is read or parsed; moving
+        the rest of the file is a plain copy, without decoding any blocks.
+
+        Returns the (block name, index) of each resource patched."""
+        self._open_unpacked_storage(self.context.global_args.input_file_name, 'r')
+        try:
+            return self._patch_resources()
+        finally:
+            self._close_unpacked_storage()
+
+    def _patch_resources(self):
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory(self.context.global_args.scumm_version))
+        spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self._get_resource_template()
+        if not issubclass(self.context.block_dispatcher.ROOT_BLOCK, BlockLucasartsEntertainmentContainer):
+            raise util.ScummPackerException("Patching resources is only supported for games with LECF or LE resource files.")
+        patch_path = self.context.global_args.input_file_name
+        assert self.context.storage.isdir(patch_path)
+        game_path = self.context.global_args.output_file_name
+        index_path = os.path.join(game_path, index_name + "." + index_ext)
+        if not self.context.game_storage.isfile(index_path):
+            raise util.ScummPackerException("Index file to patch does not exist: %s" % index_path)
+        index_crypt_value = self.context.index_dispatcher.use_external_crypt()
+        resource_crypt_value = self.context.block_dispatcher.use_external_crypt()
+        self.context.file_dispatcher.use_external_crypt()
+        root_block = self.context.block_dispatcher.dispatch_root_block()
+
+        self._load_index(index_path, index_crypt_value)
+        patches = self._load_patches(patch_path)
+        wanted = {}
+        for key, block in sorted(patches.items()):
+            directory = self.context.global_index_map.get_table(key[0]).reverse_map()
+            if key[1] in directory:
+                wanted[key] = directory[key[1]]
+            else:
+                logging.error("%s_%s has no entry in the index file, so it can not be patched." % (key[0], str(key[1]).zfill(3)))
+
+        patched = []
+        with res_io.XorFile(self.context.game_storage.open_update(index_path), index_crypt_value) as index_file:
+            directory_locations = self._find_directories(index_file)
+            for resource_counter, res_name in self._find_resource_files(game_path, spanning, resource_name,
+                                                                        resource_ext, ignored_res):
+                self.context.disk_spanning_counter = resource_counter
+                res_file = self.context.game_storage.open_update(res_name)
+                try:
+                    room_offsets = res_io.ResourceSpan(res_file, 0, self.ROOM_OFFSETS_READ_SIZE, resource_crypt_value)
+                    offsets_location = root_block.read_room_offsets(room_offsets)
+                    located = self._locate_resources(wanted, resource_counter, root_block.OFFSET_CLASS)
+                    # Patch the last block first, so patching one block doesn't move the others.
+                    for location in sorted(located.keys(), reverse=True):
+                        block_name, index, room_start = located[location]
+                        room_num = wanted[(block_name, index)][0]
+                        self._patch_block(res_file, resource_crypt_value, root_block, offsets_location,
+                                          index_file, directory_locations, patches[(block_name, index)],
+                                          location, room_num, room_start)
+                        patched.append((block_name, index))
+                finally:
+                    res_file.close()
+                for key in located.itervalues():
+                    del wanted[key[:2]]
+        for block_name, index in sorted(wanted.keys()):
+            logging.error("%s_%s could not be found in the resource files." % (block_name, str(index).zfill(3)))
+        logging.normal("Patched %d resources." % len(patched))
+        return patched
+
+    def _load_patches(self, path):
+        """ Loads the replacement resources in path. Returns a dict of
+        (block name, index) -> block."""
+        extractable = self._get_extractable_names()
+        patches = {}
+        for file_name in sorted(self.context.storage.listdir(path)):
+            block = self.context.file_dispatcher.dispatch_next_block(file_name)
+            if block is None:
+                continue
+            block.load_from_file(os.path.join(path, file_name))
+            if not getattr(block, "lookup_name", None) in extractable:
+                logging.warning("Ignoring %s; only resources with an index file directory (%s) can be patched." %
+                                (file_name, ", ".join(sorted(extractable))))
+                continue
+            patches[(block.lookup_name, block.index)] = block
+        return patches
+
+    def _find_directories(self, index_file):
+        """ Returns the locations of the directory blocks (e.g. DCOS) in the
+        index file."""
+        index_file.seek(0, os.SEEK_END)
+        end = index_file.tell()
+        locations = []
+        location = 0
+        while location < end:
+            index_file.seek(location, os.SEEK_SET)
+            block = self.context.index_dispatcher.dispatch_next_block(index_file)
+            block.read_header_from_resource(index_file)
+            if isinstance(block, BlockIndexDirectory):
+                locations.append(location)
+            location += block.size
+        return locations
+
+    def _patch_block(self, res_file, crypt_value, root_block, offsets_location,
+                     index_file, directory_locations, block, location, room_num, room_start):
+        """ Writes block over the block at location, in the room (LFLF/LF)
+        starting at room_start. See patch."""
+        dispatcher = self.context.block_dispatcher
+        room_offset_name = root_block.OFFSET_CLASS.ROOM_OFFSET_NAME
+        room_offset = self.context.global_index_map.get_index(room_offset_name, room_num)
+        # Read the room, and make sure the old block is one of its children.
+        room = res_io.ResourceSpan(res_file, room_start, dispatcher.BLOCK_NAME_LENGTH + 4, crypt_value)
+        room_block = dispatcher.dispatch_next_block(room)
+        room_block.read_header_from_resource(room)
+        room_end = room_start + room_block.size
+        room.extend_to(room_end)
+        old_block = None
+        child_location = room_offset
+        while child_location <= location and child_location < room_end:
+            room.seek(child_location, os.SEEK_SET)
+            child = dispatcher.dispatch_next_block(room)
+            child.read_header_from_resource(room)
+            if child_location == location:
+                old_block = child
+                break
+            child_location += child.size
+        if old_block is None or old_block.name != block.name:
+            raise util.ScummPackerException("The index file entry for %s_%s doesn't point to a %s block in room %d." %
+                                            (block.name, str(block.index).zfill(3), block.name, room_num))
+
+        data = res_io.RebasedBuffer(location)
+        block.save_to_resource(data, room_start)
+        data = data.getvalue()
+        delta = len(data) - old_block.size
+        if delta:
+            res_io.move_file_data(res_file, location + old_block.size, delta)
+        resource = res_io.XorFile(res_file, crypt_value)
+        resource.seek(location, os.SEEK_SET)
+        resource.write(data)
+        if delta:
+            room_block.size += delta
+            room_block.index = room_num # v4 LF blocks store the room number in the header
+            resource.seek(room_start, os.SEEK_SET)
+            room_block.write_header_to_resource(resource)
+            resource.seek(0, os.SEEK_SET)
+            root_block.read_header_from_resource(resource)
+            root_block.size += delta
+            resource.seek(0, os.SEEK_SET)
+            root_block.write_header_to_resource(resource)
+            resource.seek(offsets_location, os.SEEK_SET)
+            offsets_block = dispatcher.dispatch_next_block(resource)
+            offsets_block.shift_offsets_in_resource(resource, location, delta)
+            for directory_location in directory_locations:
+                index_file.seek(directory_location, os.SEEK_SET)
+                directory = self.context.index_dispatcher.dispatch_next_block(index_file)
+                directory.shift_offsets_in_resource(index_file, room_num, location - room_offset, delta)
+        resource.flush()
+        logging.normal("Patched %s_%s in room %d (%+d bytes)." % (block.name, str(block.index).zfill(3), room_num, delta))
+
+    def verify(self):
+        """ Unpacks the game resources in the input path and packs them again,
+        all in memory (see scummpacker_storage.MemoryStorage), then compares
+        each packed file with the original, a top-level block or room at a
+        time (see scummpacker_verify). Nothing is written to disk.
+
+        Returns the first difference (a scummpacker_verify.Difference) in
+        each file that doesn't match; none means the game packs back to the
+        same bytes."""
+        global_args = self.context.global_args
+        memory = storage.MemoryStorage()
+        unpacked_path = "unpacked"
+        packed_path = "packed"
+        memory.makedir(unpacked_path)
+        memory.makedir(packed_path)
+        logging.normal("Unpacking in memory...")
+        unpack_context = control.PackContext(self._create_verify_args(global_args.input_file_name, unpacked_path, unpack=True),
+                                             memory, self.context.game_storage)
+        ResourceHandler(unpack_context).unpack()
+        logging.normal("Packing in memory...")
+        pack_context = control.PackContext(self._create_verify_args(unpacked_path, packed_path, pack=True), memory)
+        ResourceHandler(pack_context).pack()
+
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory(global_args.scumm_version))
+        spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self._get_resource_template()
+        index_crypt_value = self.context.index_dispatcher.use_external_crypt()
+        resource_crypt_value = self.context.block_dispatcher.use_external_crypt()
+        index_file_name = index_name + "." + index_ext
+        original_names = [index_file_name]
+        for _, res_name in self._find_resource_files(global_args.input_file_name, spanning, resource_name,
+                                                     resource_ext, ignored_res):
+            original_names.append(os.path.basename(res_name))
+        packed_names = memory.listdir(packed_path)
+        differences = []
+        for file_name in original_names:
+            if not file_name in packed_names:
+                differences.append(verifier.Difference(file_name, None, 0, "file was not packed"))
+        for file_name in packed_names:
+            if not file_name in original_names:
+                differences.append(verifier.Difference(file_name, None, 0, "file is not in the original game resources"))
+                continue
+            if file_name == index_file_name:
+                dispatcher, crypt_value = self.context.index_dispatcher, index_crypt_value
+            else:
+                dispatcher, crypt_value = self.context.block_dispatcher, resource_crypt_value
+            original_path = os.path.join(global_args.input_file_name, file_name)
+            with res_io.XorFile(self.context.game_storage.open_read(original_path), crypt_value) as original:
+                with res_io.XorFile(memory.open_read(os.path.join(packed_path, file_name)), crypt_value) as repacked:
+                    difference, compared = verifier.compare_resource_files(dispatcher, original, repacked, file_name)
+            if difference is None:
+                logging.normal("%s matches (%d blocks compared)." % (file_name, compared))
+            else:
+                differences.append(difference)
+        for difference in differences:
+            logging.error(str(difference))
+        return differences
+
+    def list_blocks(self, out):
+        """ Writes a listing of every block in the game resources to out (a
+        file-like object), in the format given in the arguments (see
+        scummpacker_skeleton.LISTING_WRITERS), followed by the number and size
+        of the blocks of each type. Only the index file is loaded; the other
+        files are listed from their block headers (see
+        scummpacker_skeleton.iter_skeleton), as they're read.
+
+        Returns the totals, a dict of block name -> [number of blocks, total
+        size]."""
+        writer = skeleton.LISTING_WRITERS[self.context.global_args.list_format](out)
+        for entry in self._iter_skeletons():
+            writer.write(entry)
+        writer.close()
+        return writer.totals
+
+    def _iter_skeletons(self):
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory(self.context.global_args.scumm_version))
+        spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self._get_resource_template()
+        index_crypt_value = self.context.index_dispatcher.use_external_crypt()
+        resource_crypt_value = self.context.block_dispatcher.use_external_crypt()
+        base_path = self.context.global_args.input_file_name
+        index_file_name = index_name + "." + index_ext
+        index_path = os.path.join(base_path, index_file_name)
+        self._load_index(index_path, index_crypt_value)
+        with res_io.XorFile(self.context.game_storage.open_read(index_path), index_crypt_value) as index_file:
+            for entry in skeleton.iter_skeleton(self.context, self.context.index_dispatcher, index_file, index_file_name):
+                yield entry
+        for resource_counter, res_name in self._find_resource_files(base_path, spanning, resource_name,
+                                                                    resource_ext, ignored_res):
+            self.context.disk_spanning_counter = resource_counter
+            with res_io.XorFile(self.context.game_storage.open_read(res_name), resource_crypt_value) as res_file:
+                root_block = self.context.block_dispatcher.dispatch_root_block()
+                if isinstance(root_block, BlockLucasartsEntertainmentContainer):
+                    root_block.read_room_offsets(res_file)
+                for entry in skeleton.iter_skeleton(self.context, self.context.block_dispatcher, res_file,
+                                                    os.path.basename(res_name)):
+                    yield entry
+
+    def _create_verify_args(self, input_path, output_path, **mode):
+        global_args = control.GlobalArguments()
+        args = dict(unpack=False, pack=False)
+        args.update(mode)
+        global_args.set_args(scumm_version=self.context.global_args.scumm_version, game=self.context.global_args.game,
+                             input_file_name=input_path, output_file_name=output_path, **args)
+        return global_args
+
+    def pack(self):
+        self._open_unpacked_storage(self.context.global_args.input_file_name, 'r')
+        try:
+            self._pack_game()
+        finally:
+            self._close_unpacked_storage()
+
+    def _pack_game(self):
+        # Get our dispatchers that know about the version-specific stuff.
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory(self.context.global_args.scumm_version))
+        # Get resource names
+        try:
+            spanning, (index_name, index_ext), (resource_name, resource_ext), ignored_res = self.RESOURCE_FILE_TEMPLATES_PER_GAME[self.context.global_args.game]
+        except KeyError:
+            raise util.ScummPackerException("No resource file template defined for game: %s" % self.context.global_args.game)
+        # Output files are encrypted as they're written, so the blocks
+        #  themselves don't need to encrypt anything.
+        index_crypt_value = self.context.index_dispatcher.use_external_crypt()
+        resource_crypt_value = self.context.file_dispatcher.use_external_crypt()
+
+        # Load the index first. It doesn't depend on the resource blocks, so
+        #  they can then be written out as they're loaded.
+        logging.normal("Loading from files...")
+        assert self.context.storage.isdir(self.context.global_args.input_file_name)
+        base_path = self.context.global_args.input_file_name
+        index_block = self.context.index_dispatcher.dispatch_and_load_from_file(base_path)
+
+        # Check the rooms can be packed before anything is written, rather
+        #  than stopping partway through a resource file.
+        resource_dirs = self._find_unpacked_resource_dirs(base_path, spanning, resource_name)
+        problems = validator.validate_unpacked_game(self.context, index_block,
+                                                    [res_name for _, res_name in resource_dirs])
+        if problems:
+            raise util.ScummPackerException("The unpacked files can not be packed (%d problems found):\n%s"
+                                            % (len(problems), "\n".join(problems)))
+
+        # Load and save resources, one room at a time, or in parallel.
+        logging.normal("Saving to game resources...")
+        output_path = self.context.global_args.output_file_name
+        assert self.context.game_storage.isdir(output_path)
+        pool = None
+        if self.context.global_args.jobs > 1:
+            if self.context.backend is not None:
+                logging.warning("Packing with a storage backend only uses one job.")
+            elif multiprocessing is None:
+                logging.warning("Python 2.6 or higher is required to pack with more than one job.")
+            elif issubclass(self.context.file_dispatcher.ROOT_BLOCK, BlockLucasartsEntertainmentContainer):
+                logging.normal("Packing rooms with %d jobs..." % self.context.global_args.jobs)
+                pool = self._create_worker_pool(self.context.global_args.jobs, None)
+        pack_manifest = None
+        if self.context.global_args.incremental:
+            if issubclass(self.context.file_dispatcher.ROOT_BLOCK, BlockLucasartsEntertainmentContainer):
+                manifest_path = os.path.join(output_path, manifest.MANIFEST_FILE_NAME)
+                old_manifest = manifest.PackManifest(self.context.global_args.game)
+                old_manifest.load_from_file(manifest_path)
+                pack_manifest = manifest.PackManifest(self.context.global_args.game)
+            else:
+                logging.warning("Incremental packing is only supported for games with LECF or LE resource files.")
+        try:
+            # load folders, which represents disk spanning.
+            for resource_counter, res_name in resource_dirs:
+                disk_file_name = os.path.join(output_path, (resource_name + "." + resource_ext).replace("%NN%", str(resource_counter).zfill(2)))
+                logging.normal("Reading from %s" % res_name)
+                logging.normal("Saving to %s" % disk_file_name)
+                self.context.disk_spanning_counter = resource_counter
+                if pack_manifest is not None:
+                    self._pack_rooms_incrementally(pool, res_name, resource_counter, disk_file_name,
+                                                   resource_crypt_value, old_manifest, pack_manifest)
+                else:
+                    with res_io.XorFile(self.context.game_storage.open_write(disk_file_name), resource_crypt_value) as disk_file:
+                        if pool is None:
+                            self.context.file_dispatcher.dispatch_and_stream_to_resource(res_name, disk_file)
+                        else:
+                            self._pack_rooms_in_parallel(pool, res_name, resource_counter, disk_file)
+            if pool is not None:
+                pool.close()
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.join()
+        self.context.file_dispatcher.log_cache_stats()
+
+        with res_io.XorFile(self.context.game_storage.open_write(os.path.join(output_path, index_name + "." + index_ext)),
+                            index_crypt_value) as index_file:
             index_block.save_to_resource(index_file)
+        if pack_manifest is not None:
+            pack_manifest.save_to_file(manifest_path)
 
-            
-global_res_handler = ResourceHandler()
\ No newline at end of file
+
+    def _pack_rooms_in_parallel(self, pool, res_name, resource_counter, disk_file):
+        """ Packs each room into a buffer in a worker process, then writes the
+        buffers in order, rebasing the offsets they recorded. Rooms are written
+        as soon as they (and all rooms before them) are ready."""
+        root_block = self.context.file_dispatcher.dispatch_root_block()
+        room_paths = root_block.find_rooms_in_files(res_name)
+        packed_rooms = pool.imap(_pack_room_in_worker,
+                                 [(resource_counter, room_path) for room_path in room_paths], 1)
+        root_block.save_packed_rooms_to_resource(disk_file, packed_rooms)
+
+    def _pack_rooms_incrementally(self, pool, res_name, resource_counter, disk_file_name,
+                                  crypt_value, old_manifest, pack_manifest):
+        """ Packs only the rooms whose files have changed since the last pack
+        (according to old_manifest), and copies the rest from the old resource
+        file. Everything is written to a new file, which then replaces the old
+        one. The rooms written are recorded in pack_manifest."""
+        root_block = self.context.file_dispatcher.dispatch_root_block()
+        room_paths = root_block.find_rooms_in_files(res_name)
+        old_rooms = old_manifest.get_rooms(disk_file_name)
+        rooms = [] # (room path, content hash, PackedRoom to reuse or None)
+        for room_path in room_paths:
+            content_hash = manifest.hash_directory(room_path, self.context.storage)
+            old_room = old_rooms.get(os.path.basename(room_path))
+            if old_room is not None and old_room.content_hash != content_hash:
+                old_room = None
+            rooms.append((room_path, content_hash, old_room))
+        changed_paths = [room_path for room_path, _, old_room in rooms if old_room is None]
+        logging.normal("Reusing %d of %d rooms from the last pack." %
+                       (len(rooms) - len(changed_paths), len(rooms)))
+        if pool is None:
+            changed_rooms = (pack_room_to_buffer(self.context, resource_counter, room_path) for room_path in changed_paths)
+        else:
+            changed_rooms = pool.imap(_pack_room_in_worker,
+                                      [(resource_counter, room_path) for room_path in changed_paths], 1)
+
+        new_file_name = disk_file_name
+        old_file = None
+        if len(changed_paths) < len(rooms):
+            new_file_name = disk_file_name + ".new"
+            old_file = res_io.XorFile(file(disk_file_name, 'rb'), crypt_value)
+        index_entries = []
+        try:
+            with res_io.XorFile(file(new_file_name, 'wb'), crypt_value) as disk_file:
+                layout = root_block.save_packed_rooms_to_resource(
+                    disk_file, self._reuse_or_pack_rooms(rooms, changed_rooms, old_file, index_entries))
+        except:
+            if new_file_name != disk_file_name and os.path.isfile(new_file_name):
+                os.remove(new_file_name)
+            raise
+        finally:
+            if old_file is not None:
+                old_file.close()
+        if new_file_name != disk_file_name:
+            os.remove(disk_file_name)
+            os.rename(new_file_name, disk_file_name)
+        pack_manifest.set_rooms(disk_file_name,
+                                [manifest.PackedRoom(os.path.basename(room_path), content_hash, location, size, entries)
+                                 for (room_path, content_hash, _), (location, size), entries
+                                 in zip(rooms, layout, index_entries)])
+
+    def _reuse_or_pack_rooms(self, rooms, changed_rooms, old_file, index_entries):
+        """ Yields a (data, index_entries) pair for each room, either read from
+        old_file or taken from changed_rooms. Also appends each room's index
+        entries to index_entries, for the manifest."""
+        for _, _, old_room in rooms:
+            if old_room is None:
+                data, entries = changed_rooms.next()
+            else:
+                old_file.seek(old_room.location)
+                data, entries = old_file.read(old_room.size), old_room.index_entries
+            index_entries.append(entries)
+            yield data, entries
+
+LIBRARY_OPTIONS = frozenset(["jobs", "incremental", "index_cache", "compress"])
+
+def _create_context(input_path, output_path, game, scumm_version, backend, options, **mode):
+    """ mode says what to do, e.g. unpack=True or extract=[names]."""
+    for option in options:
+        if not option in LIBRARY_OPTIONS:
+            raise util.ScummPackerException("Unrecognised option: %s" % option)
+    args = dict(unpack=False, pack=False)
+    args.update(mode)
+    args.update(options)
+    global_args = control.GlobalArguments()
+    global_args.set_args(scumm_version=scumm_version, game=game,
+                         input_file_name=input_path, output_file_name=output_path,
+                         **args)
+    result = global_args.validate_args(backend)
+    if result is not None:
+        raise util.ScummPackerException(result)
+    return control.PackContext(global_args, backend)
+
+def unpack(input_path, output_path, game=None, scumm_version=None, backend=None, **options):
+    """ Unpacks the game resources in input_path to files in output_path.
+    Give the game, the SCUMM version, or both. The other options are the same
+    as the command line's: jobs, incremental, index_cache and compress. If
+    output_path ends with ".zip", the files are saved in a zip archive.
+
+    If a backend (a scummpacker_storage.Storage, e.g. a MemoryStorage) is
+    given, both paths are in it, and nothing is read from or written to disk.
+    Backends use one job, and can't be used with incremental or index_cache.
+
+    Each call has its own context, which is returned, so unpacks (and packs)
+    can run at the same time on different threads."""
+    util.add_normal_logging_level()
+    context = _create_context(input_path, output_path, game, scumm_version, backend, options, unpack=True)
+    ResourceHandler(context).unpack()
+    return context
+
+def pack(input_path, output_path, game=None, scumm_version=None, backend=None, **options):
+    """ Packs the unpacked files in input_path (a directory, or a zip
+    archive) to game resources in output_path. See unpack."""
+    util.add_normal_logging_level()
+    context = _create_context(input_path, output_path, game, scumm_version, backend, options, pack=True)
+    ResourceHandler(context).pack()
+    return context
+
+def extract(input_path, output_path, resources, game=None, scumm_version=None, backend=None, **options):
+    """ Extracts just the named resources (e.g. ["COST_139", "SCRP_001"]) from
+    the game resources in input_path, and saves them in output_path. See
+    unpack, and ResourceHandler.extract.
+
+    Returns the (block name, index) of each resource extracted."""
+    util.add_normal_logging_level()
+    context = _create_context(input_path, output_path, game, scumm_version, backend, options,
+                              extract=list(resources))
+    return ResourceHandler(context).extract()
+
+def patch(input_path, output_path, game=None, scumm_version=None, backend=None, **options):
+    """ Replaces resources in the game resources in output_path, in place,
+    with the files in input_path (e.g. "COST_139.dmp"). See unpack, and
+    ResourceHandler.patch.
+
+    Returns the (block name, index) of each resource patched."""
+    util.add_normal_logging_level()
+    context = _create_context(input_path, output_path, game, scumm_version, backend, options,
+                              patch=True)
+    return ResourceHandler(context).patch()
+
+def verify(input_path, game=None, scumm_version=None, backend=None):
+    """ Checks that the game resources in input_path pack back to the same
+    bytes, without writing anything. See unpack, and ResourceHandler.verify.
+
+    Returns the first difference in each file that doesn't match."""
+    util.add_normal_logging_level()
+    context = _create_context(input_path, None, game, scumm_version, backend, {}, verify=True)
+    return ResourceHandler(context).verify()
+
+def list_blocks(input_path, out, game=None, scumm_version=None, list_format="text", backend=None):
+    """ Writes a listing of the blocks in the game resources in input_path to
+    out, as "text" or "json". See unpack, and ResourceHandler.list_blocks.
+
+    Returns the number and total size of the blocks of each type."""
+    util.add_normal_logging_level()
+    context = _create_context(input_path, None, game, scumm_version, backend, {},
+                              list=True, list_format=list_format)
+    return ResourceHandler(context).list_blocks(out)
@@ -0,0 +1,164 @@
+#! /usr/bin/python
+# Lists the blocks in game resource files from their headers alone, seeking
+#  past the data of each block, like "tar t" lists an archive.
+import os
+try:
+    import json
+except ImportError:
+    json = None # Python 2.5; only text listings are available.
+import scummpacker_util as util
+from blocks.common import BlockContainer, BlockGloballyIndexed, BlockLucasartsFile
+
+class SkeletonEntry(object):
+    """ A block found by iter_skeleton: where it is, and its number if the
+    index file has one for it (and the number of the room it's in)."""
+    def __init__(self, file_name, path, name, index, room, location, size, is_container):
+        self.file_name = file_name
+        self.path = path # e.g. "LECF/LFLF_002/SOUN_003/SOU"
+        self.name = name
+        self.index = index
+        self.room = room
+        self.location = location
+        self.size = size
+        self.is_container = is_container # True if its children are listed after it
+
+    def to_dict(self):
+        return {
+            "file" : self.file_name,
+            "path" : self.path,
+            "type" : self.name,
+            "index" : self.index,
+            "room" : self.room,
+            "offset" : self.location,
+            "size" : self.size,
+            "container" : self.is_container
+        }
+
+def iter_block_headers(dispatcher, resource, start, end):
+    """ Yields (block, location, data location) for each block from start to
+    end, reading just the headers and seeking past the data. Stops at a block
+    that doesn't fit before end, or whose header runs past the end of the
+    file."""
+    location = start
+    while location < end:
+        resource.seek(location, os.SEEK_SET)
+        block = dispatcher.dispatch_next_block(resource)
+        try:
+            block.read_header_from_resource(resource)
+        except EOFError:
+            return
+        data_location = resource.tell()
+        if block.size < data_location - location or location + block.size > end:
+            return
+        yield block, location, data_location
+        location += block.size
+
+def _children_fill(dispatcher, resource, start, end):
+    """ Returns True if the blocks from start to end end exactly at end, i.e.
+    the data is made of child blocks."""
+    children_end = start
+    for block, location, data_location in iter_block_headers(dispatcher, resource, start, end):
+        children_end = location + block.size
+    return children_end == end
+
+def _find_index(block, location, room_start, global_index_map, disk_number):
+    """ Returns the number of a room or globally indexed block, from the index
+    file's maps, or None."""
+    try:
+        if isinstance(block, BlockLucasartsFile):
+            return global_index_map.find_index(block.name, (disk_number, location))
+        if isinstance(block, BlockGloballyIndexed) and room_start is not None:
+            return block.lookup_index(location, room_start)
+    except util.ScummPackerException:
+        pass # no index, e.g. the block isn't in the index file's directories
+    return None
+
+def _iter_skeleton(context, dispatcher, resource, file_name, start, end, parent_path, room_start, room):
+    for block, location, data_location in iter_block_headers(dispatcher, resource, start, end):
+        name = block.name.strip()
+        index = _find_index(block, location, room_start, context.global_index_map, context.disk_spanning_counter)
+        child_room_start, child_room = room_start, room
+        if isinstance(block, BlockLucasartsFile):
+            child_room_start, child_room = location, index
+        path = name
+        if index is not None:
+            path = "%s_%s" % (name, str(index).zfill(3))
+        if parent_path is not None:
+            path = parent_path + "/" + path
+        children_start = data_location + getattr(block, "children_start", 0)
+        block_end = location + block.size
+        is_container = isinstance(block, BlockContainer) and children_start < block_end and \
+            _children_fill(dispatcher, resource, children_start, block_end)
+        yield SkeletonEntry(file_name, path, name, index, child_room, location, block.size, is_container)
+        if is_container:
+            for entry in _iter_skeleton(context, dispatcher, resource, file_name, children_start, block_end,
+                                        path, child_room_start, child_room):
+                yield entry
+
+def iter_skeleton(context, dispatcher, resource, file_name):
+    """ Yields a SkeletonEntry for each block in a resource file (a decrypted
+    file-like object), each container before its children, without reading
+    any block's data. Only the current block of each level is held, so memory
+    use doesn't grow with the size of the file.
+
+    The global index map must already be filled from the index file, and for
+    LECF/LE resource files, from the room offsets (see
+    BlockLucasartsEntertainmentContainer.read_room_offsets)."""
+    resource.seek(0, os.SEEK_END)
+    end = resource.tell()
+    return _iter_skeleton(context, dispatcher, resource, file_name, 0, end, None, None, None)
+
+class ListingWriter(object):
+    """ Writes SkeletonEntries as they're found, and adds up the number and
+    size of the blocks of each type."""
+    def __init__(self, out):
+        self.out = out
+        self.totals = {} # block name -> [number of blocks, total size]
+
+    def write(self, entry):
+        totals = self.totals.setdefault(entry.name, [0, 0])
+        totals[0] += 1
+        totals[1] += entry.size
+        self._write_entry(entry)
+
+    def _write_entry(self, entry):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def close(self):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+class TextListingWriter(ListingWriter):
+    """ One line per block: offset, size, then the file and path, with a "/"
+    after containers. The totals for each block type follow."""
+    def _write_entry(self, entry):
+        self.out.write("%10d %10d  %s/%s%s\n" % (entry.location, entry.size, entry.file_name, entry.path,
+                                                  "/" if entry.is_container else ""))
+
+    def close(self):
+        self.out.write("\nTotals by block type:\n")
+        for name in sorted(self.totals):
+            count, size = self.totals[name]
+            self.out.write("%-4s %8d blocks %12d bytes\n" % (name, count, size))
+
+class JsonListingWriter(ListingWriter):
+    """ A JSON object with a "blocks" list (see SkeletonEntry.to_dict), and
+    the "totals" for each block type. The list is written as it goes."""
+    def __init__(self, out):
+        if json is None:
+            raise util.ScummPackerException("Python 2.6 or higher is required to list blocks as JSON.")
+        super(JsonListingWriter, self).__init__(out)
+        self.out.write('{"blocks": [')
+        self._separator = "\n"
+
+    def _write_entry(self, entry):
+        self.out.write(self._separator + json.dumps(entry.to_dict(), sort_keys=True))
+        self._separator = ",\n"
+
+    def close(self):
+        totals = dict([(name, {"count" : count, "size" : size}) for name, (count, size) in self.totals.items()])
+        self.out.write('\n],\n"totals": %s}\n' % json.dumps(totals, sort_keys=True))
+
+LISTING_WRITERS = {
+    "text" : TextListingWriter,
+    "json" : JsonListingWriter
+}
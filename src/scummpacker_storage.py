@@ -0,0 +1,499 @@
+#! /usr/bin/python
+# Where files are kept: a directory on disk, a single zip archive, or memory.
+#  Blocks read and write their files through the context's storage, using the
+#  same paths either way.
+import cStringIO
+import errno
+import os
+import threading
+import time
+import xml.etree.ElementTree as et
+try:
+    import xml.etree.cElementTree as cet # much faster to parse with
+except ImportError:
+    cet = et
+import zipfile
+import scummpacker_io
+import scummpacker_util as util
+
+ARCHIVE_EXTENSION = ".zip"
+
+def is_archive_path(path):
+    """ Unpacked files go in a zip archive if the path given for them ends
+    with ".zip"."""
+    return path is not None and path.lower().endswith(ARCHIVE_EXTENSION)
+
+class Storage(object):
+    """ Reads and writes files and directories, by path."""
+    output_tracker = None # see LocalStorage
+    archive_path = None # see ZipStorage
+
+    def open_read(self, path):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def open_write(self, path):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def open_update(self, path):
+        """ Opens an existing file to be read and written in place, like
+        file(path, 'r+b')."""
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def makedir(self, path):
+        """ Creates a directory, if it doesn't exist. Its parent must exist."""
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def listdir(self, path):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def isdir(self, path):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def isfile(self, path):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def getsize(self, path):
+        raise NotImplementedError("This method must be overridden by inheriting classes.")
+
+    def close(self):
+        pass
+
+    def makedirs(self, path):
+        """ Creates a directory, and any of its parents that don't exist."""
+        path = os.path.normpath(path)
+        parent = os.path.dirname(path)
+        if parent and parent != path and not self.isdir(parent):
+            self.makedirs(parent)
+        self.makedir(path)
+
+    def read_data(self, path):
+        """ Returns the whole contents of a file."""
+        in_file = self.open_read(path)
+        try:
+            return in_file.read()
+        finally:
+            in_file.close()
+
+    def write_data(self, path, data):
+        out_file = self.open_write(path)
+        try:
+            out_file.write(data)
+        finally:
+            out_file.close()
+
+    def open_buffer(self, path, crypt_value=None):
+        """ Returns a scummpacker_io.ResourceBuffer of a whole (game resource)
+        file."""
+        return scummpacker_io.ResourceBuffer(path, crypt_value, self.read_data(path))
+
+    def parse_xml(self, path):
+        """ Returns an ElementTree of the XML file at path."""
+        in_file = self.open_read(path)
+        try:
+            return cet.parse(in_file)
+        finally:
+            in_file.close()
+
+    def write_xml(self, tree, path):
+        """ Saves an ElementTree (or its root element) to path."""
+        if not hasattr(tree, "getroot"):
+            tree = et.ElementTree(tree)
+        out_file = self.open_write(path)
+        try:
+            tree.write(out_file)
+        finally:
+            out_file.close()
+
+class LocalStorage(Storage):
+    """ Unpacked files in a directory on disk.
+
+    When unpacking incrementally, output_tracker (see
+    scummpacker_io.OutputTracker) records every file and directory written,
+    and files are only written if their contents have changed."""
+    def __init__(self, output_tracker=None):
+        self.output_tracker = output_tracker
+
+    def open_read(self, path):
+        return file(path, 'rb')
+
+    def open_write(self, path):
+        return scummpacker_io.open_output_file(path, self.output_tracker)
+
+    def open_update(self, path):
+        return file(path, 'r+b')
+
+    def open_buffer(self, path, crypt_value=None):
+        return scummpacker_io.ResourceBuffer(path, crypt_value) # memory-mapped
+
+    def makedir(self, path):
+        scummpacker_io.make_output_dir(path, self.output_tracker)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def isfile(self, path):
+        return os.path.isfile(path)
+
+    def getsize(self, path):
+        return os.path.getsize(path)
+
+class _ReadFile(object):
+    """ Read-only file-like view of a file's data, held in memory."""
+    def __init__(self, data, name):
+        self.name = name
+        self._file = cStringIO.StringIO(data)
+
+    closed = property(lambda self: self._file.closed)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+class _ZipMemberFile(object):
+    """ Buffers a file being written to a ZipStorage, and adds it to the
+    archive when closed."""
+    def __init__(self, storage, member):
+        self.name = member
+        self.closed = False
+        self._storage = storage
+        self._buffer = cStringIO.StringIO()
+
+    def write(self, data):
+        self._buffer.write(data)
+
+    def tell(self):
+        return self._buffer.tell()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._storage._write_member(self.name, self._buffer.getvalue())
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+class ZipStorage(Storage):
+    """ Unpacked files in a single zip archive, instead of a directory of tens
+    of thousands of small files. The archive stands in for the directory, so
+    a path under archive_path, e.g. "MI2.zip/MONKEY2/LECF/order.xml", is the
+    archive member "MONKEY2/LECF/order.xml".
+
+    The archive is either read ("r" mode) or written from scratch ("w"
+    mode), not both. If compress is True, each file is compressed on its own,
+    so any file can still be read without reading the rest. Files can be
+    written from more than one thread."""
+    DIR_ATTRIBUTES = (040755 << 16) | 0x10 # Unix permissions, and the MS-DOS directory flag
+    FILE_ATTRIBUTES = 0644 << 16
+
+    def __init__(self, archive_path, mode='r', compress=False):
+        self.archive_path = archive_path
+        self.mode = mode
+        self._root = os.path.abspath(archive_path)
+        self._compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._lock = threading.Lock()
+        self._dirs = {"" : set()} # directory member name -> names in the directory
+        self._sizes = {} # file member name -> size
+        if mode == 'r' and not zipfile.is_zipfile(archive_path):
+            raise util.ScummPackerException("Not a zip archive: %s" % archive_path)
+        try:
+            self._zip = zipfile.ZipFile(archive_path, mode, self._compression, True)
+        except IOError, e:
+            raise util.ScummPackerException("Archive could not be opened: %s (%s)" % (archive_path, e))
+        if mode == 'r':
+            for info in self._zip.infolist():
+                if info.filename.endswith("/"):
+                    self._add_dir(info.filename.rstrip("/"))
+                else:
+                    self._add_name(info.filename)
+                    self._sizes[info.filename] = info.file_size
+
+    def _get_member(self, path):
+        """ Returns the archive member name for path, or None if path isn't in
+        the archive."""
+        path = os.path.abspath(path)
+        if path == self._root:
+            return ""
+        if not path.startswith(self._root + os.sep):
+            return None
+        return path[len(self._root) + 1:].replace(os.sep, "/")
+
+    def _get_existing_member(self, path, members):
+        member = self._get_member(path)
+        if member is None or not member in members:
+            raise IOError(errno.ENOENT, "No such file or directory in archive %s" % self.archive_path, path)
+        return member
+
+    def _add_name(self, member):
+        """ Lists member in its directory, and each directory in its parent."""
+        while member:
+            if "/" in member:
+                parent, name = member.rsplit("/", 1)
+            else:
+                parent, name = "", member
+            names = self._dirs.setdefault(parent, set())
+            if name in names:
+                break
+            names.add(name)
+            member = parent
+
+    def _add_dir(self, member):
+        self._dirs.setdefault(member, set())
+        self._add_name(member)
+
+    def _write_info(self, info, data):
+        if self.mode != 'w':
+            raise IOError("Archive was opened for reading: %s" % self.archive_path)
+        info.date_time = time.localtime(time.time())[:6]
+        self._zip.writestr(info, data)
+
+    def _write_member(self, member, data):
+        info = zipfile.ZipInfo(member)
+        info.compress_type = self._compression
+        info.external_attr = self.FILE_ATTRIBUTES
+        self._lock.acquire()
+        try:
+            self._write_info(info, data)
+            self._add_name(member)
+            self._sizes[member] = len(data)
+        finally:
+            self._lock.release()
+
+    def open_read(self, path):
+        self._lock.acquire()
+        try:
+            member = self._get_existing_member(path, self._sizes)
+            if self.mode != 'r':
+                raise IOError("Archive was opened for writing: %s" % self.archive_path)
+            return _ReadFile(self._zip.read(member), path)
+        finally:
+            self._lock.release()
+
+    def open_write(self, path):
+        member = self._get_member(path)
+        if not member:
+            raise IOError(errno.EINVAL, "Not a file path in archive %s" % self.archive_path, path)
+        return _ZipMemberFile(self, member)
+
+    def makedir(self, path):
+        member = self._get_member(path)
+        if member is None:
+            raise IOError(errno.EINVAL, "Not a path in archive %s" % self.archive_path, path)
+        self._lock.acquire()
+        try:
+            if member in self._dirs:
+                return
+            # Stored as an entry of its own, so empty directories are kept.
+            info = zipfile.ZipInfo(member + "/")
+            info.external_attr = self.DIR_ATTRIBUTES
+            self._write_info(info, "")
+            self._add_dir(member)
+        finally:
+            self._lock.release()
+
+    def listdir(self, path):
+        self._lock.acquire()
+        try:
+            return sorted(self._dirs[self._get_existing_member(path, self._dirs)])
+        finally:
+            self._lock.release()
+
+    def isdir(self, path):
+        return self._get_member(path) in self._dirs
+
+    def isfile(self, path):
+        return self._get_member(path) in self._sizes
+
+    def getsize(self, path):
+        return self._sizes[self._get_existing_member(path, self._sizes)]
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            self._zip.close()
+        finally:
+            self._lock.release()
+
+class _MemoryFile(object):
+    """ A file being written to (or updated in) a MemoryStorage, which keeps
+    its data when closed."""
+    def __init__(self, storage, path, data=""):
+        self.name = path
+        self.closed = False
+        self._storage = storage
+        self._file = cStringIO.StringIO()
+        self._file.write(data)
+        self._file.seek(0, os.SEEK_SET)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def truncate(self, size=None):
+        if size is None:
+            size = self._file.tell()
+        self._file.truncate(size)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._storage._set_data(self.name, self._file.getvalue())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+class MemoryStorage(Storage):
+    """ Files and directories held in memory, so a whole unpack and pack can
+    run without touching the disk. Paths work the same way as on disk, but
+    nothing exists until it's written, e.g.:
+
+    memory = MemoryStorage()
+    memory.makedirs("MI2")
+    memory.write_data(os.path.join("MI2", "MONKEY2.000"), index_data)
+
+    Top-level directories ("/", or "." for relative paths) always exist.
+    A file is only stored when it's closed. Files can be written from more
+    than one thread."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {} # path -> data
+        self._dirs = {} # path -> names in the directory
+
+    def _get_key(self, path):
+        return os.path.normpath(path)
+
+    def _get_dir(self, key):
+        """ Returns the names in the directory at key, or None if it doesn't
+        exist."""
+        names = self._dirs.get(key)
+        if names is None and (key == os.curdir or os.path.dirname(key) == key):
+            names = self._dirs.setdefault(key, set())
+        return names
+
+    def _get_parent(self, key, path):
+        """ Returns the names in the directory that key is in."""
+        names = self._get_dir(os.path.dirname(key) or os.curdir)
+        if names is None:
+            raise IOError(errno.ENOENT, "No such directory in memory", os.path.dirname(path))
+        return names
+
+    def _get_data(self, path):
+        self._lock.acquire()
+        try:
+            data = self._files.get(self._get_key(path))
+        finally:
+            self._lock.release()
+        if data is None:
+            raise IOError(errno.ENOENT, "No such file in memory", path)
+        return data
+
+    def _set_data(self, path, data):
+        key = self._get_key(path)
+        self._lock.acquire()
+        try:
+            if self._get_dir(key) is not None:
+                raise IOError(errno.EISDIR, "Is a directory", path)
+            self._get_parent(key, path).add(os.path.basename(key))
+            self._files[key] = data
+        finally:
+            self._lock.release()
+
+    def open_read(self, path):
+        return _ReadFile(self._get_data(path), path)
+
+    def open_write(self, path):
+        key = self._get_key(path)
+        self._lock.acquire()
+        try:
+            self._get_parent(key, path) # fail now, not when the file is closed
+        finally:
+            self._lock.release()
+        return _MemoryFile(self, path)
+
+    def open_update(self, path):
+        return _MemoryFile(self, path, self._get_data(path))
+
+    def read_data(self, path):
+        return self._get_data(path)
+
+    def write_data(self, path, data):
+        self._set_data(path, data)
+
+    def makedir(self, path):
+        key = self._get_key(path)
+        self._lock.acquire()
+        try:
+            if self._get_dir(key) is not None:
+                return
+            if key in self._files:
+                raise IOError(errno.EEXIST, "A file already exists", path)
+            self._get_parent(key, path).add(os.path.basename(key))
+            self._dirs[key] = set()
+        finally:
+            self._lock.release()
+
+    def listdir(self, path):
+        self._lock.acquire()
+        try:
+            names = self._get_dir(self._get_key(path))
+            if names is None:
+                raise IOError(errno.ENOENT, "No such directory in memory", path)
+            return sorted(names)
+        finally:
+            self._lock.release()
+
+    def isdir(self, path):
+        self._lock.acquire()
+        try:
+            return self._get_dir(self._get_key(path)) is not None
+        finally:
+            self._lock.release()
+
+    def isfile(self, path):
+        return self._get_key(path) in self._files
+
+    def getsize(self, path):
+        return len(self._get_data(path))
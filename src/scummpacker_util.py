@@ -1,34 +1,146 @@
 import array
-import copy
-import functools
+import logging
+import operator
 import string
+import struct
 import xml.etree.ElementTree as et
 
 
 __valid_file_chars = frozenset("-_.() %s%s" % (string.ascii_letters, string.digits)) # for filenames
 __valid_text_chars = frozenset("!?@#$%s&*+\"';:,-_.() %s%s" % ("%", string.ascii_letters, string.digits)) # for XML files
+
+# bytearray and memoryview don't exist in older versions of Python.
+try:
+    _bytearray_type = bytearray
+except NameError:
+    _bytearray_type = None
+try:
+    _memoryview_type = memoryview
+except NameError:
+    _memoryview_type = None
     
+# XOR translation tables, built on demand and shared by every caller.
+__crypt_tables = {}
+
+def get_crypt_table(crypt_val):
+    """ Returns a 256-byte translation table that XORs every byte with crypt_val."""
+    try:
+        return __crypt_tables[crypt_val]
+    except KeyError:
+        table = ''.join([chr(i ^ crypt_val) for i in xrange(256)])
+        __crypt_tables[crypt_val] = table
+        return table
+
 def crypt(in_val, crypt_val):
+    """ XORs every byte of in_val with crypt_val, using a precomputed table so
+    the whole value is translated in one call.
+
+    Accepts str, array('B'), bytearray, memoryview and buffer objects. The
+    result has the same type as the input, except for memoryview and buffer
+    objects, which come back as a str."""
     if crypt_val is None:
         return in_val
-    if type(in_val) is str:
-        out_string = ''
-        for c in in_val:
-            out_string += chr(ord(c) ^ crypt_val)
-        return out_string
-    elif type(in_val) is array.ArrayType:
-        out_val = copy.deepcopy(in_val)
-        for i, byte in enumerate(out_val):
-            out_val[i] = byte ^ crypt_val
-        return out_val
+    table = get_crypt_table(crypt_val)
+    in_type = type(in_val)
+    if in_type is str:
+        return in_val.translate(table)
+    elif in_type is array.ArrayType:
+        if in_val.typecode == 'B':
+            return array.array('B', in_val.tostring().translate(table))
+        # Wider item types don't map onto a byte table, so do it the slow way.
+        return array.array(in_val.typecode, [v ^ crypt_val for v in in_val])
+    elif in_type is _bytearray_type:
+        return in_val.translate(table)
+    elif in_type is _memoryview_type:
+        return in_val.tobytes().translate(table)
+    elif in_type is buffer:
+        return str(in_val).translate(table)
     raise ScummPackerException("Could not encrypt values of type: " + str(type(in_val)))
 
 LE = False
 BE = True
+
+# Struct objects compiled once and shared by every caller, keyed by format.
+__structs = {}
+
+# struct format codes for unsigned integers of each supported width.
+INT_FORMATS = {
+    1 : 'B',
+    2 : 'H',
+    4 : 'I'
+}
+
+def get_struct(fmt):
+    """ Returns a cached struct.Struct for the given format string."""
+    try:
+        return __structs[fmt]
+    except KeyError:
+        compiled = struct.Struct(fmt)
+        __structs[fmt] = compiled
+        return compiled
+
+def get_table_struct(record_fmt, num_records, is_BE=False):
+    """ Returns a cached struct.Struct describing "num_records" consecutive
+    records, where each record has the given format (e.g. "B", "I" or "BI").
+    Sizes are standard and there is no padding between fields."""
+    if len(record_fmt) == 1:
+        fmt = "%d%s" % (num_records, record_fmt)
+    else:
+        fmt = record_fmt * num_records
+    return get_struct((is_BE and '>' or '<') + fmt)
+
+def str2ints(in_val, record_fmt, num_records, is_BE=False, crypt_val=None):
+    """ Decodes a whole table of integers in one call. Returns a flat tuple
+    of values, with the fields of each record in order."""
+    if crypt_val != None:
+        in_val = crypt(in_val, crypt_val)
+    return get_table_struct(record_fmt, num_records, is_BE).unpack(in_val)
+
+def ints2str(values, record_fmt, is_BE=False, crypt_val=None):
+    """ Encodes a flat sequence of integers as a table of records in one call.
+    The inverse of str2ints."""
+    num_records = len(values) // len(record_fmt)
+    out_val = get_table_struct(record_fmt, num_records, is_BE).pack(*values)
+    if crypt_val != None:
+        out_val = crypt(out_val, crypt_val)
+    return out_val
+
+class StructCodec(object):
+    """ Reads and writes a fixed group of attributes with a single
+    precompiled struct.
+
+    Built from a "struct_data" declaration: a dict with the keys "size",
+    "format" and "attributes". Provides:
+        unpack_into(obj, data) - unpacks the data into obj's attributes.
+        pack_from(obj) - packs the values of obj's attributes."""
+
+    def __init__(self, struct_data):
+        self.struct_data = struct_data
+        self.size = struct_data['size']
+        self.struct = get_struct(struct_data['format'])
+        if self.struct.size != self.size:
+            raise ScummPackerException("Struct format \"%s\" is %d bytes long, but the declared size is %d." %
+                                       (struct_data['format'], self.struct.size, self.size))
+        self.attributes = attributes = tuple(struct_data['attributes'])
+        # Bind everything up front, so each call is as cheap as possible.
+        pack = self.struct.pack
+        unpack = self.struct.unpack
+        get_values = operator.attrgetter(*attributes)
+        if len(attributes) == 1:
+            self.pack_from = lambda obj: pack(get_values(obj))
+        else:
+            self.pack_from = lambda obj: pack(*get_values(obj))
+        def unpack_into(obj, data):
+            obj.__dict__.update(zip(attributes, unpack(data)))
+        self.unpack_into = unpack_into
+
 def str2int(in_val, is_BE=False, crypt_val=None):
-    out_val = 0
     if crypt_val != None:
         in_val = crypt(in_val, crypt_val)
+    num_bytes = len(in_val)
+    if num_bytes in INT_FORMATS:
+        return get_struct((is_BE and '>' or '<') + INT_FORMATS[num_bytes]).unpack(in_val)[0]
+    out_val = 0
     if is_BE:
         in_val = reversed(in_val)
     for i, c in enumerate(in_val):
@@ -36,6 +148,13 @@ def str2int(in_val, is_BE=False, crypt_val=None):
     return out_val
 
 def int2str(in_val, num_bytes=4, is_BE=False, crypt_val=None):
+    if num_bytes in INT_FORMATS:
+        # Mask the value so out of range numbers wrap, like the loop below.
+        out_val = get_struct((is_BE and '>' or '<') + INT_FORMATS[num_bytes]).pack(
+            in_val & ((1 << (num_bytes * 8)) - 1))
+        if crypt_val != None:
+            out_val = crypt(out_val, crypt_val)
+        return out_val
     out_val = array.array('B')
     i = 0
     while i < num_bytes:
@@ -111,71 +230,178 @@ def indent_elementtree(elem, level=0):
         if level and (not elem.tail or not elem.tail.strip()):
             elem.tail = i
 
+def build_position_map(in_list):
+    """ Returns a dict mapping each value in the list to the position of its
+    first occurrence (the same as in_list.index(value))."""
+    positions = {}
+    for i in xrange(len(in_list) - 1, -1, -1):
+        positions[in_list[i]] = i
+    return positions
+
 def ordered_sort(in_list, order):
-    """ Takes a list of values and a list containing the order of those values. Wait,
-    this is retarded. Don't use it."""
-    # This is a bit silly; could probably just use keys from "order" instead of
-    #  sorting at all.
+    """ Takes a list of values and a list containing the order of those values,
+    and returns the values sorted by that order. Values not in the order list
+    keep their relative order."""
+    positions = build_position_map(order)
     INFINITY = len(in_list) # append unrecognised values to end
-    deco = [ ((order.index(v) if v in order else INFINITY), i, v) for i, v in enumerate(in_list) ]
+    deco = [ (positions.get(v, INFINITY), i, v) for i, v in enumerate(in_list) ]
     deco.sort()
     return [ v for _, _, v in deco ]
 
-class XMLHelper(object):
-    READ = 'r'
-    WRITE = 'w'
+# How values are converted when reading from, or writing to, XML nodes.
+XML_READ_MARSHALLERS = {
+    'i' : xml2int, # int
+    'h' : xml2int, # hex
+    's' : escape_invalid_chars # string
+}
+XML_WRITE_MARSHALLERS = {
+    'i' : int2xml, # int
+    'h' : hex2xml, # hex
+    's' : unescape_invalid_chars # string
+}
 
-    def __init__(self):
-        self.read_actions = {
-            'i' : functools.partial(self._read_value_from_xml_node, marshaller=xml2int), # int
-            'h' : functools.partial(self._read_value_from_xml_node, marshaller=xml2int), # hex
-            's' : functools.partial(self._read_value_from_xml_node, marshaller=escape_invalid_chars), # string
-            'n' : self.read, # node
-            'c' : self._do_callback # callback on another object, for complex actions
-        }
-        self.write_actions = {
-            'i' : functools.partial(self._write_value_to_xml_node, marshaller=int2xml), # int
-            'h' : functools.partial(self._write_value_to_xml_node, marshaller=hex2xml), # hex
-            's' : functools.partial(self._write_value_to_xml_node, marshaller=unescape_invalid_chars), # string
-            'n' : self.write, # node
-            'c' : self._do_callback # callback on another object, for complex actions
-        }
+class CompiledXMLStructure(object):
+    """ Reader and writer functions built from an XML structure declaration.
 
-    def read(self, destination, parent_node, structure):
+    A structure is a sequence of (node name, marshaller, attribute) tuples.
+    The marshaller is one of:
+        'i' - int
+        'h' - hex
+        's' - string
+        'n' - node; the "attribute" is a nested structure
+        'c' - callback on another object, for complex actions; the "attribute"
+              is the method name, which gets called with the node and a mode
+              of XMLHelper.READ or XMLHelper.WRITE.
+    Attributes may be nested, e.g. "header.width".
+
+    The structure is only walked once, when compiling. Reading and writing
+    just call a list of functions."""
+
+    def __init__(self, structure):
+        self.structure = structure
+        readers = []
+        writers = []
         for name, marshaller, attr in structure:
-            node = parent_node.find(name)
-            if marshaller == 'c':
-                self._do_callback(destination, attr, node, XMLHelper.READ)
+            if marshaller == 'n':
+                nested = compile_xml_structure(attr)
+                readers.append(self._compile_node_reader(name, nested))
+                writers.append(self._compile_node_writer(name, nested))
+            elif marshaller == 'c':
+                readers.append(self._compile_callback_reader(name, attr))
+                writers.append(self._compile_callback_writer(name, attr))
+            elif marshaller in XML_READ_MARSHALLERS:
+                readers.append(self._compile_value_reader(name, XML_READ_MARSHALLERS[marshaller], attr))
+                writers.append(self._compile_value_writer(name, XML_WRITE_MARSHALLERS[marshaller], attr))
             else:
-                self.read_actions[marshaller](destination, node, attr)
+                raise ScummPackerException("Unknown XML marshaller \"%s\" for node \"%s\"." % (marshaller, name))
+        self._readers = tuple(readers)
+        self._writers = tuple(writers)
+
+    def read(self, destination, parent_node):
+        # Index the child nodes once, rather than searching for each one.
+        #  Like Element.find, the first node with a given name wins.
+        nodes = {}
+        for node in reversed(parent_node):
+            nodes[node.tag] = node
+        for reader in self._readers:
+            reader(destination, nodes)
+
+    def write(self, caller, parent_node):
+        for writer in self._writers:
+            writer(caller, parent_node)
 
-    def _read_value_from_xml_node(self, destination, node, attr, marshaller):
-        value = marshaller(node.text) # doesn't support "attributes" of nodes, just values
-        # Get nested attributes
+    def _compile_value_reader(self, name, marshaller, attr):
         attr_split = attr.split(".")
-        destination = reduce(lambda a1, a2: getattr(a1, a2), attr_split[:-1], destination)
-        attr = attr_split[-1]
-        setattr(destination, attr, value)
+        if len(attr_split) == 1:
+            def read_value(destination, nodes):
+                # doesn't support "attributes" of nodes, just values
+                setattr(destination, attr, marshaller(nodes.get(name).text))
+        else:
+            path, attr = attr_split[:-1], attr_split[-1]
+            def read_value(destination, nodes):
+                value = marshaller(nodes.get(name).text)
+                for a in path:
+                    destination = getattr(destination, a)
+                setattr(destination, attr, value)
+        return read_value
 
-    def _write_value_to_xml_node(self, caller, node, attr, marshaller):
-        # Get nested attributes
-        attr = reduce(lambda a1, a2: getattr(a1, a2), attr.split("."), caller)
-        node.text = marshaller(attr)
+    def _compile_value_writer(self, name, marshaller, attr):
+        attr_split = attr.split(".")
+        if len(attr_split) == 1:
+            get_value = operator.attrgetter(attr)
+        else:
+            def get_value(caller):
+                for a in attr_split:
+                    caller = getattr(caller, a)
+                return caller
+        SubElement = et.SubElement
+        def write_value(caller, parent_node):
+            SubElement(parent_node, name).text = marshaller(get_value(caller))
+        return write_value
 
-    def write(self, caller, parent_node, structure):
-        for name, marshaller, attr in structure:
-            node = et.SubElement(parent_node, name)
-            if marshaller == 'c':
-                self._do_callback(caller, attr, node, XMLHelper.WRITE)
-            else:
-                self.write_actions[marshaller](caller, node, attr)
+    def _compile_node_reader(self, name, nested):
+        nested_read = nested.read
+        def read_node(destination, nodes):
+            nested_read(destination, nodes.get(name))
+        return read_node
+
+    def _compile_node_writer(self, name, nested):
+        nested_write = nested.write
+        SubElement = et.SubElement
+        def write_node(caller, parent_node):
+            nested_write(caller, SubElement(parent_node, name))
+        return write_node
+
+    def _compile_callback_reader(self, name, callback_name):
+        def read_callback(destination, nodes):
+            getattr(destination, callback_name)(nodes.get(name), XMLHelper.READ)
+        return read_callback
 
-    def _do_callback(self, destination, callback_name, node, mode):
-        callback_func = getattr(destination, callback_name)
-        callback_func(node, mode)
+    def _compile_callback_writer(self, name, callback_name):
+        SubElement = et.SubElement
+        def write_callback(caller, parent_node):
+            getattr(caller, callback_name)(SubElement(parent_node, name), XMLHelper.WRITE)
+        return write_callback
+
+# Compiled XML structures, keyed by the structure declaration itself.
+__xml_structures = {}
+
+def compile_xml_structure(structure):
+    """ Returns a (cached) CompiledXMLStructure for the given declaration."""
+    try:
+        return __xml_structures[structure]
+    except KeyError:
+        compiled = CompiledXMLStructure(structure)
+        __xml_structures[structure] = compiled
+        return compiled
+    except TypeError:
+        # Unhashable (e.g. built from lists), so it can't be cached.
+        return CompiledXMLStructure(structure)
+
+class XMLHelper(object):
+    READ = 'r'
+    WRITE = 'w'
+
+    def read(self, destination, parent_node, structure):
+        compile_xml_structure(structure).read(destination, parent_node)
+
+    def write(self, caller, parent_node, structure):
+        compile_xml_structure(structure).write(caller, parent_node)
             
 xml_helper = XMLHelper()
 
+def add_normal_logging_level():
+    """ Adds the "normal" level used for progress messages, without setting up
+    any handlers (e.g. when ScummPacker is used as a library)."""
+    logging.NORMAL = 15
+    logging.normal = lambda x: logging.log(logging.NORMAL, x)
+
+def setup_logging():
+    """ Sets up logging, including the "normal" level used for progress messages."""
+    logging.basicConfig(format="", level=logging.DEBUG)
+    add_normal_logging_level()
+    logging.level = logging.NORMAL
+
 class ScummPackerException(Exception):
     pass
 
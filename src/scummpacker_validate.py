@@ -0,0 +1,123 @@
+#! /usr/bin/python
+# Checks an unpacked game can be packed before anything is written, so every
+#  problem is found at once instead of partway through writing a resource file.
+import os
+import Queue
+import sys
+import threading
+import scummpacker_util as util
+from blocks.common import BlockContainer, BlockGloballyIndexed, BlockLucasartsEntertainmentContainer, \
+    ObjectBlockContainer, ScriptBlockContainer
+
+VALIDATE_THREADS = 8
+
+def _get_limits(index_block):
+    """ Returns a map of lookup name -> (most resources allowed, name of the
+    index block that sets the limit), from the MAXS block and the index
+    directories."""
+    limits = {}
+    for block in index_block.children:
+        get_limits = getattr(block, "get_limits", None)
+        if get_limits is None:
+            continue
+        for lookup_name, limit in get_limits().items():
+            if not lookup_name in limits or limit < limits[lookup_name][0]:
+                limits[lookup_name] = (limit, block.name)
+    return limits
+
+def _find_rooms(context, resource_paths):
+    """ Returns the path of each room (LFLF/LF directory) in the resource
+    file directories, or the directories themselves if they aren't split into
+    rooms."""
+    rooms = []
+    for res_path in resource_paths:
+        root_block = context.file_dispatcher.dispatch_root_block()
+        if isinstance(root_block, BlockLucasartsEntertainmentContainer):
+            rooms.extend(root_block.find_rooms_in_files(res_path))
+        else:
+            rooms.append(res_path)
+    return rooms
+
+def _validate_path(context, path, max_objects, problems, resources):
+    """ Checks a file or directory, and anything in it, adding any problems
+    found, and the (lookup name, index, path) of each globally indexed
+    resource."""
+    dispatcher = context.file_dispatcher
+    block_type = dispatcher.get_block_type(os.path.basename(path))
+    if block_type is None:
+        return # logged when it's ignored while packing
+    if issubclass(block_type, ScriptBlockContainer):
+        block = block_type(dispatcher.BLOCK_NAME_LENGTH, dispatcher.CRYPT_VALUE, context)
+        problems.extend(block.validate_files(path))
+        return
+    if issubclass(block_type, ObjectBlockContainer):
+        block = block_type(dispatcher.BLOCK_NAME_LENGTH, dispatcher.CRYPT_VALUE, context)
+        problems.extend(block.validate_files(path, max_objects))
+        return
+    if issubclass(block_type, BlockGloballyIndexed):
+        block = block_type(dispatcher.BLOCK_NAME_LENGTH, dispatcher.CRYPT_VALUE, context)
+        try:
+            block.load_name_from_file(path)
+            resources.append((block.lookup_name, block.index, path))
+        except util.ScummPackerException, e:
+            problems.append(str(e))
+    if issubclass(block_type, BlockContainer) and context.storage.isdir(path):
+        for f in context.storage.listdir(path):
+            _validate_path(context, os.path.join(path, f), max_objects, problems, resources)
+
+def _validate_room(context, path, max_objects):
+    problems = []
+    resources = []
+    _validate_path(context, path, max_objects, problems, resources)
+    return problems, resources
+
+def _map_in_threads(func, items, threads):
+    """ Returns [func(item) for item in items], running func on up to
+    "threads" threads at once. If func raises an exception, the first one is
+    raised again here."""
+    results = [None] * len(items)
+    errors = []
+    pending = Queue.Queue()
+    for i, item in enumerate(items):
+        pending.put((i, item))
+    def run():
+        while not errors:
+            try:
+                i, item = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[i] = func(item)
+            except Exception:
+                errors.append(sys.exc_info())
+    workers = [threading.Thread(target=run, name="Validator") for i in xrange(min(threads, len(items)))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        exc_type, exc_value, tb = errors[0]
+        raise exc_type, exc_value, tb
+    return results
+
+def validate_unpacked_game(context, index_block, resource_paths, threads=VALIDATE_THREADS):
+    """ Checks the unpacked rooms in resource_paths (the directories for each
+    resource file) have what's needed to pack them, reading just directory
+    listings and XML headers, not the block data. index_block is the loaded
+    index, whose MAXS block and directories limit the resource numbers.
+
+    Rooms are checked on separate threads. Returns a list of problems, in the
+    order the rooms would be packed."""
+    limits = _get_limits(index_block)
+    max_objects = limits.pop("objects", (None, None))[0]
+    rooms = _find_rooms(context, resource_paths)
+    results = _map_in_threads(lambda path: _validate_room(context, path, max_objects), rooms, threads)
+    problems = []
+    for room_problems, resources in results:
+        problems.extend(room_problems)
+    for room_problems, resources in results:
+        for lookup_name, index, path in resources:
+            if lookup_name in limits and index >= limits[lookup_name][0]:
+                limit, limit_name = limits[lookup_name]
+                problems.append("%s: resource number %d is out of range (%s has %d entries)" % (path, index, limit_name, limit))
+    return problems
@@ -0,0 +1,199 @@
+#! /usr/bin/python
+# Compares game resource files block by block, to find where a repacked game
+#  differs from the original.
+import hashlib
+import os
+import scummpacker_skeleton as skeleton
+from blocks.common import BlockContainer, BlockLucasartsEntertainmentContainer
+
+HASH_CHUNK_SIZE = 64 * 1024
+MISSING_BLOCK = "block is missing, or its header can't be read"
+
+class BlockHash(object):
+    """ A block in a resource file (or just its header), where it is, and a
+    hash of its bytes."""
+    def __init__(self, path, block, location, data_location, size, digest):
+        self.path = path # e.g. "LECF[1]/LFLF[3]"
+        self.block = block
+        self.location = location
+        self.data_location = data_location # just after the header
+        self.size = size
+        self.digest = digest
+
+    end = property(lambda self: self.location + self.size)
+
+    def matches(self, other):
+        return (self.block.name, self.size, self.digest) == (other.block.name, other.size, other.digest)
+
+class Difference(object):
+    """ The first difference found between two resource files. offset is the
+    first byte that differs, and path the innermost block containing it (or
+    None if it's past the last block of one of the files)."""
+    def __init__(self, file_name, path, offset, reason):
+        self.file_name = file_name
+        self.path = path
+        self.offset = offset
+        self.reason = reason
+
+    def __str__(self):
+        where = ""
+        if self.path is not None:
+            where = " in " + self.path
+        return "%s differs at offset %d (0x%X)%s: %s" % (self.file_name, self.offset, self.offset, where, self.reason)
+
+def _hash_range(resource, start, end):
+    digest = hashlib.md5()
+    resource.seek(start, os.SEEK_SET)
+    remaining = end - start
+    while remaining > 0:
+        data = resource.read(min(HASH_CHUNK_SIZE, remaining))
+        if not data:
+            break
+        digest.update(data)
+        remaining -= len(data)
+    return digest.digest()
+
+def _get_end(resource):
+    resource.seek(0, os.SEEK_END)
+    return resource.tell()
+
+def _iter_blocks(dispatcher, resource, start, end, parent_path):
+    """ Yields (path, block, location, data location) for each block from
+    start to end, reading just the headers. Stops at a block that doesn't
+    fit before end."""
+    counts = {}
+    for block, location, data_location in skeleton.iter_block_headers(dispatcher, resource, start, end):
+        counts[block.name] = counts.get(block.name, 0) + 1
+        path = "%s[%d]" % (block.name, counts[block.name])
+        if parent_path is not None:
+            path = parent_path + "/" + path
+        yield path, block, location, data_location
+
+def iter_block_hashes(dispatcher, resource, start, end, parent_path=None):
+    """ Yields a BlockHash for each block from start to end, one at a time."""
+    for path, block, location, data_location in _iter_blocks(dispatcher, resource, start, end, parent_path):
+        yield BlockHash(path, block, location, data_location, block.size,
+                        _hash_range(resource, location, location + block.size))
+
+def iter_file_hashes(dispatcher, resource):
+    """ Yields a BlockHash for each top-level block in a resource file, e.g.
+    each block of an index file. The LECF/LE block is split into its header
+    and its children (the room offsets, and each room), so each room gets a
+    hash of its own."""
+    for path, block, location, data_location in _iter_blocks(dispatcher, resource, 0, _get_end(resource), None):
+        if isinstance(block, BlockLucasartsEntertainmentContainer):
+            yield BlockHash(path + "/header", block, location, data_location, data_location - location,
+                            _hash_range(resource, location, data_location))
+            for child_hash in iter_block_hashes(dispatcher, resource, data_location, location + block.size, path):
+                yield child_hash
+        else:
+            yield BlockHash(path, block, location, data_location, block.size,
+                            _hash_range(resource, location, location + block.size))
+
+def _describe_sizes(original_size, repacked_size):
+    if original_size == repacked_size:
+        return ""
+    return " (block size is %d, expected %d)" % (repacked_size, original_size)
+
+def _first_different_byte(original, repacked, start, end):
+    """ Returns the first location from start to end where the files differ,
+    or None."""
+    location = start
+    while location < end:
+        size = min(HASH_CHUNK_SIZE, end - location)
+        original.seek(location, os.SEEK_SET)
+        original_data = original.read(size)
+        repacked.seek(location, os.SEEK_SET)
+        repacked_data = repacked.read(size)
+        if original_data != repacked_data:
+            for i in xrange(min(len(original_data), len(repacked_data))):
+                if original_data[i] != repacked_data[i]:
+                    return location + i
+            return location + min(len(original_data), len(repacked_data))
+        location += size
+    return None
+
+def _find_children(dispatcher, resource, block_hash):
+    """ Returns the BlockHashes of a container's children, or None if they
+    can't be found from the header alone (e.g. v4 LF blocks, which have the
+    room number between the header and the children)."""
+    if not isinstance(block_hash.block, BlockContainer):
+        return None
+    children = list(iter_block_hashes(dispatcher, resource, block_hash.data_location, block_hash.end, block_hash.path))
+    children_end = block_hash.data_location
+    if children:
+        children_end = children[-1].end
+    if children_end != block_hash.end:
+        return None
+    return children
+
+def _find_difference(dispatcher, original, repacked, file_name, original_hash, repacked_hash):
+    """ Narrows down two blocks at the same location that don't match, to the
+    innermost block that differs, and the first byte that differs."""
+    location = original_hash.location
+    if original_hash.block.name != repacked_hash.block.name:
+        return Difference(file_name, original_hash.path, location,
+                          "expected a %s block, found %s" % (original_hash.block.name, repacked_hash.block.name))
+    offset = _first_different_byte(original, repacked, location,
+                                   max(original_hash.data_location, repacked_hash.data_location))
+    if offset is not None:
+        return Difference(file_name, original_hash.path, offset,
+                          "header differs" + _describe_sizes(original_hash.block.size, repacked_hash.block.size))
+    if original_hash.size == original_hash.block.size:
+        original_children = _find_children(dispatcher, original, original_hash)
+        repacked_children = _find_children(dispatcher, repacked, repacked_hash)
+        if original_children is not None and repacked_children is not None:
+            for original_child, repacked_child in zip(original_children, repacked_children):
+                if not original_child.matches(repacked_child):
+                    return _find_difference(dispatcher, original, repacked, file_name, original_child, repacked_child)
+            if len(original_children) > len(repacked_children):
+                missing_child = original_children[len(repacked_children)]
+                return Difference(file_name, missing_child.path, missing_child.location, MISSING_BLOCK)
+            if len(repacked_children) > len(original_children):
+                extra_child = repacked_children[len(original_children)]
+                return Difference(file_name, extra_child.path, extra_child.location, "extra block")
+    end = min(original_hash.end, repacked_hash.end)
+    offset = _first_different_byte(original, repacked, location, end)
+    if offset is None:
+        offset = end
+    return Difference(file_name, original_hash.path, offset,
+                      "data differs" + _describe_sizes(original_hash.size, repacked_hash.size))
+
+def _next(iterator):
+    try:
+        return iterator.next()
+    except StopIteration:
+        return None
+
+def compare_resource_files(dispatcher, original, repacked, file_name):
+    """ Compares two resource files (decrypted file-like objects), one
+    BlockHash at a time, so neither file has to be held in memory. Returns the
+    first Difference, or None if the files are the same, and the number of
+    block hashes compared."""
+    original_hashes = iter_file_hashes(dispatcher, original)
+    repacked_hashes = iter_file_hashes(dispatcher, repacked)
+    compared = 0
+    checked_end = 0
+    while True:
+        original_hash = _next(original_hashes)
+        repacked_hash = _next(repacked_hashes)
+        if original_hash is None and repacked_hash is None:
+            break
+        compared += 1
+        if original_hash is None:
+            return Difference(file_name, repacked_hash.path, repacked_hash.location, "extra block"), compared
+        if repacked_hash is None:
+            return Difference(file_name, original_hash.path, original_hash.location, MISSING_BLOCK), compared
+        if not original_hash.matches(repacked_hash):
+            return _find_difference(dispatcher, original, repacked, file_name, original_hash, repacked_hash), compared
+        checked_end = original_hash.end
+    # Anything after the last block that could be read, e.g. padding.
+    original_end = _get_end(original)
+    repacked_end = _get_end(repacked)
+    offset = _first_different_byte(original, repacked, checked_end, min(original_end, repacked_end))
+    if offset is not None:
+        return Difference(file_name, None, offset, "data after the last block differs"), compared
+    if original_end != repacked_end:
+        return Difference(file_name, None, min(original_end, repacked_end),
+                          "file size is %d, expected %d" % (repacked_end, original_end)), compared
+    return None, compared
@@ -1,2 +1,13 @@
 #from src import *
 from blocks import *
+from dispatchers import *
+from scummpacker_util_tests import *
+from scummpacker_io_tests import *
+from scummpacker_control_tests import *
+from scummpacker_manifest_tests import *
+from scummpacker_index_cache_tests import *
+from scummpacker_storage_tests import *
+from scummpacker_verify_tests import *
+from scummpacker_validate_tests import *
+from scummpacker_skeleton_tests import *
+from scummpacker_res_handler_tests import *
@@ -1,3 +1,4 @@
+from common import *
 from v4_resource import *
 from v5_resource import *
 from v6_index import *
\ No newline at end of file
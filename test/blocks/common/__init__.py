@@ -0,0 +1,2 @@
+from blockcontainer import *
+from blocklucasartsentertainmentcontainer import *
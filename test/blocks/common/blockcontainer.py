@@ -0,0 +1,137 @@
+import array
+import cStringIO
+import random
+import unittest
+import scummpacker_util as util
+from blocks.common import BlockContainer
+from blocks.v5_base import BlockContainerV5, BlockDefaultV5
+
+class _Block(object):
+    def __init__(self, name, index=None):
+        self.name = name
+        self.index = index
+
+    def __repr__(self):
+        return "%s_%s" % (self.name, self.index)
+
+class _Container(BlockContainer):
+    name = "TEST"
+    block_ordering = ["AA", "IM", "BB", "IM", "CC"]
+
+def _reference_append(container, block):
+    """ The original linear-scan insertion, kept to check the order matches."""
+    rank_lookup_name = container._find_block_rank_lookup_name(block)
+    block_rank = container.block_ordering.index(rank_lookup_name)
+    for i, c in enumerate(container.children):
+        c_rank = container.block_ordering.index(container._find_block_rank_lookup_name(c))
+        if c_rank == block_rank:
+            if not rank_lookup_name in container.order_map:
+                continue
+            order_list = container.order_map[rank_lookup_name]
+            if not block.index in order_list:
+                continue
+            if not c.index in order_list:
+                container.children.insert(i, block)
+                return
+            if order_list.index(c.index) > order_list.index(block.index):
+                container.children.insert(i, block)
+                return
+        elif c_rank > block_rank:
+            container.children.insert(i, block)
+            return
+    container.children.append(block)
+
+class BlockContainerOrderingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.container = _Container(4, None)
+
+    def test_ranked(self):
+        for name in ("CC", "IM01", "AA", "BB", "IM02"):
+            self.container.append(_Block(name))
+        self.assertEqual([c.name for c in self.container.children], ["AA", "IM01", "IM02", "BB", "CC"])
+
+    def test_order_map(self):
+        self.container.order_map = {"BB" : [3, 1, 2]}
+        for index in (1, 4, 2, 3, 5):
+            self.container.append(_Block("BB", index))
+        self.assertEqual([c.index for c in self.container.children], [3, 1, 2, 4, 5])
+
+    def test_unknown_block_type(self):
+        self.assertRaises(util.ScummPackerException, self.container.append, _Block("ZZ"))
+
+    def test_matches_linear_insertion(self):
+        rng = random.Random(1234)
+        names = ["AA", "BB", "CC", "IM01", "IM02"]
+        for _ in xrange(50):
+            order_map = {}
+            for name in rng.sample(["AA", "BB", "IM"], 2):
+                order_map[name] = [rng.randint(0, 9) for _ in xrange(6)] # may contain duplicates
+            blocks = [_Block(rng.choice(names), rng.randint(0, 12)) for _ in xrange(30)]
+            expected = _Container(4, None)
+            expected.order_map = order_map
+            self.container = _Container(4, None)
+            self.container.order_map = order_map
+            for b in blocks:
+                _reference_append(expected, b)
+                self.container.append(b)
+            self.assertEqual(self.container.children, expected.children)
+
+    def test_children_replaced(self):
+        self.container.append(_Block("BB"))
+        self.container.children = []
+        self.container.append(_Block("CC"))
+        self.container.append(_Block("AA"))
+        self.assertEqual([c.name for c in self.container.children], ["AA", "CC"])
+
+class _UnseekableFile(object):
+    """ Like a pipe: can only be written in order."""
+    def __init__(self):
+        self.data = cStringIO.StringIO()
+
+    def write(self, data):
+        self.data.write(data)
+
+    def tell(self):
+        return self.data.tell()
+
+    def seek(self, offset, whence=0):
+        raise IOError("Illegal seek")
+
+def _leaf(name, data):
+    block = BlockDefaultV5(4, None)
+    block.name = name
+    block.data = array.array('B', data)
+    block.size = 8 + len(data)
+    return block
+
+def _container(name, children):
+    block = BlockContainerV5(4, None)
+    block.name = name
+    block.children = children
+    return block
+
+class BlockContainerSaveTestCase(unittest.TestCase):
+    def test_compute_size(self):
+        inner = _container("INNR", [_leaf("AAAA", "abc")])
+        outer = _container("OUTR", [inner, _leaf("BBBB", "")])
+        self.assertEqual(outer.compute_size(), 8 + (8 + 11) + 8)
+        self.assertEqual(inner.size, 19)
+
+    def test_save_without_seeking(self):
+        outer = _container("OUTR", [_container("INNR", [_leaf("AAAA", "abc")]), _leaf("BBBB", "")])
+        outfile = _UnseekableFile()
+        outer.save_to_resource(outfile)
+        self.assertEqual(outfile.data.getvalue(),
+                         "OUTR\x00\x00\x00\x23INNR\x00\x00\x00\x13AAAA\x00\x00\x00\x0BabcBBBB\x00\x00\x00\x08")
+
+    def test_wrong_planned_size_is_corrected(self):
+        leaf = _leaf("AAAA", "abc")
+        leaf.size = 10 # one byte short, but the leaf still writes all its data
+        outer = _container("OUTR", [leaf])
+        outfile = cStringIO.StringIO()
+        outer.save_to_resource(outfile)
+        self.assertEqual(outfile.getvalue()[:8], "OUTR\x00\x00\x00\x13")
+        self.assertRaises(util.ScummPackerException, outer.save_to_resource, _UnseekableFile())
+
+if __name__ == '__main__':
+    unittest.main()
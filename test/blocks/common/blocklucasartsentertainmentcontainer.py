@@ -0,0 +1,84 @@
+import cStringIO
+import struct
+import unittest
+import scummpacker_control as control
+import dispatchers
+from blocks.common import PackedBlockPlaceholder
+
+class _Block(object):
+    name = "LFLF"
+    index = 7
+
+    def __init__(self, context):
+        self.context = context
+
+class _OffsetBlock(object):
+    LFLF_NAME = "LFLF"
+    ROOM_OFFSET_NAME = "ROOM"
+
+class PackedBlockPlaceholderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = control.PackContext()
+        self.context.global_index_map = control.IndexMappingContainer("LFLF", "ROOM", "Disk", "SCRP")
+
+    def test_rebases_room_offsets(self):
+        index_entries = [("LFLF", (1, 0), 7),
+                         ("ROOM", 7, 8),
+                         ("Disk", 7, 1),
+                         ("SCRP", (7, 100), 12)]
+        packed_rooms = iter([("room data", index_entries)])
+        placeholder = PackedBlockPlaceholder(_Block(self.context), packed_rooms, _OffsetBlock)
+        resource = cStringIO.StringIO()
+        resource.write("header")
+        placeholder.save_to_resource(resource)
+        self.assertEqual(resource.getvalue(), "headerroom data")
+        self.assertEqual(self.context.global_index_map.get_index("LFLF", (1, 6)), 7)
+        self.assertEqual(self.context.global_index_map.get_index("ROOM", 7), 14)
+        self.assertEqual(self.context.global_index_map.get_index("Disk", 7), 1)
+        self.assertEqual(self.context.global_index_map.get_index("SCRP", (7, 100)), 12)
+
+class ReadRoomOffsetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = control.PackContext()
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory("5"))
+        self.context.block_dispatcher.use_external_crypt()
+        self.context.disk_spanning_counter = 1
+
+    def test_maps_rooms(self):
+        loff = "LOFF" + struct.pack(">I", 19) + struct.pack("<BBIBI", 2, 1, 35, 2, 1000)
+        resource = cStringIO.StringIO("LECF" + struct.pack(">I", 2000) + loff + "LFLF")
+        root_block = self.context.block_dispatcher.dispatch_root_block()
+        root_block.read_room_offsets(resource)
+        self.assertEqual(resource.tell(), 8 + len(loff))
+        self.assertEqual(self.context.global_index_map.get_index("LFLF", (1, 27)), 1)
+        self.assertEqual(self.context.global_index_map.get_index("ROOM", 1), 35)
+        self.assertEqual(self.context.global_index_map.get_index("ROOM", 2), 1000)
+
+class ShiftOffsetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = control.PackContext()
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory("5"))
+        self.context.block_dispatcher.use_external_crypt()
+        self.context.index_dispatcher.use_external_crypt()
+
+    def _create_resource(self, data):
+        resource = cStringIO.StringIO()
+        resource.write(data)
+        resource.seek(0)
+        return resource
+
+    def test_shift_room_offsets(self):
+        resource = self._create_resource("LOFF" + struct.pack(">I", 19) + struct.pack("<BBIBI", 2, 1, 35, 2, 1000))
+        block = self.context.block_dispatcher.dispatch_next_block(resource)
+        block.shift_offsets_in_resource(resource, 500, 16)
+        self.assertEqual(resource.getvalue()[8:], struct.pack("<BBIBI", 2, 1, 35, 2, 1016))
+
+    def test_shift_directory(self):
+        table = struct.pack("<BBBIII", 1, 1, 2, 100, 300, 300)
+        resource = self._create_resource("DSCR" + struct.pack(">I", 25) + struct.pack("<H", 3) + table)
+        block = self.context.index_dispatcher.dispatch_next_block(resource)
+        block.shift_offsets_in_resource(resource, 1, 200, -8)
+        self.assertEqual(resource.getvalue()[10:], struct.pack("<BBBIII", 1, 1, 2, 100, 292, 300))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,11 +4,12 @@ import os
 import cStringIO as StringIO
 import array
 
+import scummpacker_control as control
 from blocks.v4_resource import *
 
 class BlockOCV4TestCase(unittest.TestCase):
     def setUp(self):
-        self.block = BlockOCV4(2, 0x69)
+        self.block = BlockOCV4(2, 0x69, control.PackContext())
 
     def populate_block(self):
         self.block.obj_id = 1001
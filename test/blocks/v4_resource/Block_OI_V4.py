@@ -3,11 +3,12 @@ import unittest
 import os
 import cStringIO as StringIO
 
+import scummpacker_control as control
 from blocks.v4_resource import *
 
 class BlockOIV4TestCase(unittest.TestCase):
     def setUp(self):
-        self.block = BlockOIV4(2, 0x69)
+        self.block = BlockOIV4(2, 0x69, control.PackContext())
 
     def populate_block(self):
         pass
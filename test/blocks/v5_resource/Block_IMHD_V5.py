@@ -2,11 +2,12 @@ import cStringIO as StringIO
 import os
 import unittest
 import xml.etree.ElementTree as et
+import scummpacker_control as control
 from blocks.v5_resource import *
 
 class BlockIMHDV5TestCase(unittest.TestCase):
     def setUp(self):
-        self.block = BlockIMHDV5(4, 0x69)
+        self.block = BlockIMHDV5(4, 0x69, control.PackContext())
 
     def populate_block(self):
         self.block.obj_id = 1001
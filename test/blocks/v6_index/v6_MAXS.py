@@ -2,11 +2,12 @@ import cStringIO as StringIO
 import xml.etree.ElementTree as et
 import unittest
 import os
+import scummpacker_control as control
 from blocks.v6_index import *
 
 class BlockMAXSV6TestCase(unittest.TestCase):
     def setUp(self):
-        self.block = BlockMAXSV6(4, 0x69)
+        self.block = BlockMAXSV6(4, 0x69, control.PackContext())
 
     def populate_block(self):
         self.block.num_vars = 1
@@ -0,0 +1,64 @@
+import cStringIO
+import logging
+import unittest
+import blocks
+import scummpacker_util as util
+from dispatchers import BlockDispatcherV5, FileDispatcherV5, FileDispatcherV3FMTowns
+
+class FileDispatcherCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = FileDispatcherV5()
+
+    def test_block_map(self):
+        block = self.dispatcher.dispatch_next_block("RMHD.xml")
+        self.assert_(type(block) is blocks.BlockRMHDV5)
+        block = self.dispatcher.dispatch_next_block("RMHD.xml")
+        self.assert_(type(block) is blocks.BlockRMHDV5)
+        self.assertEqual((self.dispatcher.cache_hits, self.dispatcher.cache_misses), (1, 1))
+
+    def test_regex_blocks(self):
+        self.assert_(type(self.dispatcher.dispatch_next_block("LFLF_001_ROOM")) is blocks.BlockLFLFV5)
+        self.assert_(type(self.dispatcher.dispatch_next_block("IM0A")) is blocks.BlockContainerV5)
+        self.assert_(type(self.dispatcher.dispatch_next_block("ZP01.dmp")) is blocks.BlockDefaultV5)
+        self.assert_(type(self.dispatcher.dispatch_next_block("LSCR_200.dmp")) is blocks.BlockLSCRV5)
+
+    def test_regex_order(self):
+        # The FM Towns dispatcher replaces one of the inherited patterns.
+        dispatcher = FileDispatcherV3FMTowns()
+        self.assert_(type(dispatcher.dispatch_next_block("SO_001")) is blocks.BlockGloballyIndexedV4)
+
+    def test_ignored_and_unknown(self):
+        warnings = []
+        original_warning = logging.warning
+        logging.warning = warnings.append
+        try:
+            for _ in xrange(2):
+                self.assert_(self.dispatcher.dispatch_next_block("order.xml") is None)
+                self.assert_(self.dispatcher.dispatch_next_block("notes.txt") is None)
+        finally:
+            logging.warning = original_warning
+        # Unknown files are still reported every time, even when cached.
+        self.assertEqual(len(warnings), 2)
+        self.assertEqual((self.dispatcher.cache_hits, self.dispatcher.cache_misses), (2, 2))
+
+class BlockDispatcherCacheTestCase(unittest.TestCase):
+    def test_encrypted_names(self):
+        dispatcher = BlockDispatcherV5()
+        resource = cStringIO.StringIO(util.crypt("RMHD\x00\x00\x00\x0e", 0x69))
+        for _ in xrange(2):
+            block = dispatcher.dispatch_next_block(resource)
+            self.assert_(type(block) is blocks.BlockRMHDV5)
+            self.assertEqual(resource.tell(), 0)
+        self.assertEqual((dispatcher.cache_hits, dispatcher.cache_misses), (1, 1))
+
+    def test_external_crypt_clears_cache(self):
+        dispatcher = BlockDispatcherV5()
+        resource = cStringIO.StringIO(util.crypt("RMHD", 0x69))
+        dispatcher.dispatch_next_block(resource)
+        self.assertEqual(dispatcher.use_external_crypt(), 0x69)
+        block = dispatcher.dispatch_next_block(cStringIO.StringIO("RMHD"))
+        self.assert_(type(block) is blocks.BlockRMHDV5)
+        self.assertEqual(dispatcher.cache_misses, 2)
+
+if __name__ == '__main__':
+    unittest.main()
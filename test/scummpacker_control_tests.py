@@ -0,0 +1,170 @@
+from __future__ import absolute_import # "dispatchers" is also a test package
+import os
+import unittest
+import scummpacker_control as control
+import scummpacker_storage as storage
+import scummpacker_util as util
+import dispatchers
+
+class IndexCounterTestCase(unittest.TestCase):
+    def test_add_counts(self):
+        counter = control.IndexCounter("SOUN", "COST")
+        counter.get_next_index("SOUN")
+        worker_counter = control.IndexCounter("SOUN", "COST")
+        worker_counter.get_next_index("SOUN")
+        worker_counter.get_next_index("COST")
+        counter.add_counts(worker_counter.index_map)
+        self.assertEqual(counter.get_next_index("SOUN"), 3)
+        self.assertEqual(counter.get_next_index("COST"), 2)
+
+    def test_add_unknown_counts(self):
+        counter = control.IndexCounter("SOUN")
+        self.assertRaises(util.ScummPackerException, counter.add_counts, {"COST" : 1})
+
+class IndexTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.table = control.IndexTable()
+        self.table[(2, 300)] = 5
+        self.table[(1, 400)] = 7
+        self.table[(1, 100)] = 6
+
+    def test_lookup(self):
+        self.assertEqual(self.table[(1, 400)], 7)
+        self.assertEqual(self.table.get((1, 100)), 6)
+        self.assertEqual(self.table.get((1, 300)), None)
+        self.assertEqual(self.table.get(2), None)
+        self.assertRaises(KeyError, self.table.__getitem__, (3, 300))
+        self.assertTrue((2, 300) in self.table)
+        self.assertFalse((2, 301) in self.table)
+
+    def test_sorted_items(self):
+        self.assertEqual(self.table.items(), [((1, 100), 6), ((1, 400), 7), ((2, 300), 5)])
+
+    def test_replace(self):
+        self.table[(1, 400)] = 8
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table[(1, 400)], 8)
+
+    def test_reverse_map(self):
+        self.assertEqual(self.table.reverse_map(), {5 : (2, 300), 6 : (1, 100), 7 : (1, 400)})
+        self.table[(3, 0)] = 9
+        self.assertEqual(self.table.reverse_map()[9], (3, 0))
+
+    def test_copy(self):
+        table = self.table.copy()
+        table[(1, 400)] = 8
+        self.assertEqual(self.table[(1, 400)], 7)
+
+    def test_other_values(self):
+        table = control.IndexTable()
+        table[1] = 10
+        table[3] = "room_3"
+        self.assertEqual(table.items(), [(1, 10), (3, "room_3")])
+
+    def test_invalid_key(self):
+        self.assertRaises(util.ScummPackerException, self.table.__setitem__, 4, 1)
+        self.assertRaises(util.ScummPackerException, self.table.__setitem__, (1, -1), 1)
+
+class IndexMappingContainerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index_map = control.IndexMappingContainer("LFLF", "ROOM", "SCRP")
+        self.index_map.map_index("LFLF", (1, 8), 3)
+        self.index_map.map_index("ROOM", 3, 16)
+        self.index_map.map_index("SCRP", (3, 100), 12)
+
+    def test_find_block_index(self):
+        self.assertEqual(self.index_map.find_block_index("LFLF", "ROOM", "SCRP", 1, 8, 116), 12)
+        self.assertEqual(self.index_map.find_block_index("LFLF", "ROOM", "SCRP", 1, 8, 117), None)
+
+    def test_unknown_index(self):
+        self.assertEqual(self.index_map.find_index("SCRP", (3, 101)), None)
+        self.assertRaises(util.ScummPackerUnrecognisedIndexException, self.index_map.get_index, "SCRP", (3, 101))
+        self.assertRaises(util.ScummPackerException, self.index_map.find_index, "SOUN", (3, 100))
+
+    def test_get_room_after_remap(self):
+        self.assertEqual(self.index_map.get_room("LFLF", "ROOM", 1, 8), (3, 16))
+        self.index_map.map_index("ROOM", 3, 20)
+        self.assertEqual(self.index_map.get_room("LFLF", "ROOM", 1, 8), (3, 20))
+        self.index_map.index_map = {"LFLF" : control.IndexTable(), "ROOM" : control.IndexTable()}
+        self.assertRaises(util.ScummPackerUnrecognisedIndexException, self.index_map.get_room, "LFLF", "ROOM", 1, 8)
+
+class GlobalArgumentsTestCase(unittest.TestCase):
+    def test_jobs(self):
+        args = control.GlobalArguments()
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name=".", unpack=True, pack=False)
+        self.assertEqual(args.jobs, 1)
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name=".", unpack=True, pack=False, jobs=4)
+        self.assertEqual(args.jobs, 4)
+
+    def test_extract(self):
+        args = control.GlobalArguments()
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name=".", unpack=False, pack=False)
+        self.assertNotEqual(args.validate_args(), None)
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name=".", unpack=False, pack=False, extract=["COST_139"])
+        self.assertEqual(args.validate_args(), None)
+
+    def test_patch(self):
+        args = control.GlobalArguments()
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name=".", unpack=False, pack=False, patch=True)
+        self.assertEqual(args.validate_args(), None)
+
+    def test_verify(self):
+        args = control.GlobalArguments()
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name=None, unpack=False, pack=False, verify=True)
+        self.assertEqual(args.validate_args(), None)
+
+    def test_archive_paths(self):
+        args = control.GlobalArguments()
+        missing_archive = os.path.join("missing", "MI2.zip")
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name="MI2.zip", unpack=True, pack=False)
+        self.assertEqual(args.validate_args(), None)
+        args.set_args(scumm_version="5", game="MI2", input_file_name=".",
+                      output_file_name=missing_archive, unpack=True, pack=False)
+        self.assertNotEqual(args.validate_args(), None)
+        args.set_args(scumm_version="5", game="MI2", input_file_name=missing_archive,
+                      output_file_name=".", unpack=False, pack=True)
+        self.assertNotEqual(args.validate_args(), None)
+
+    def test_backend_paths(self):
+        backend = storage.MemoryStorage()
+        backend.makedir("MI2")
+        args = control.GlobalArguments()
+        args.set_args(scumm_version="5", game="MI2", input_file_name="MI2",
+                      output_file_name="unpacked", unpack=True, pack=False)
+        self.assertEqual(args.validate_args(backend), None)
+        self.assertTrue(backend.isdir("unpacked"))
+        args.set_args(scumm_version="5", game="MI2", input_file_name="DOTT",
+                      output_file_name="unpacked", unpack=True, pack=False)
+        self.assertNotEqual(args.validate_args(backend), None)
+        args.set_args(scumm_version="5", game="MI2", input_file_name="MI2",
+                      output_file_name="unpacked", unpack=True, pack=False, incremental=True)
+        self.assertNotEqual(args.validate_args(backend), None)
+
+class PackContextTestCase(unittest.TestCase):
+    def test_assign_dispatchers(self):
+        context = control.PackContext()
+        context.assign_dispatchers(*dispatchers.DispatcherFactory("5"))
+        self.assertTrue(context.block_dispatcher.context is context)
+        self.assertTrue(context.file_dispatcher.context is context)
+        block = context.file_dispatcher.dispatch_root_block()
+        self.assertTrue(block.context is context)
+
+    def test_contexts_are_separate(self):
+        context = control.PackContext()
+        context.assign_dispatchers(*dispatchers.DispatcherFactory("5"))
+        other_context = control.PackContext()
+        other_context.assign_dispatchers(*dispatchers.DispatcherFactory("5"))
+        context.global_index_map.map_index("ROOM", 1, 8)
+        context.unknown_blocks_counter.get_next_index("SOUN")
+        self.assertEqual(other_context.global_index_map.find_index("ROOM", 1), None)
+        self.assertEqual(other_context.unknown_blocks_counter.get_next_index("SOUN"), 1)
+
+if __name__ == '__main__':
+    unittest.main()
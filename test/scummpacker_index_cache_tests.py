@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+import scummpacker_index_cache as index_cache
+
+class IndexCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.path, "MONKEY2.000")
+        self._write_index("RNAM")
+        self.cache = index_cache.IndexCache(os.path.join(self.path, "cache"))
+        self.index_map = {"ROOM" : {1 : 8}, "SCRP" : {(1, 50) : 4}}
+        self.cache.save(self.index_path, "MI2", ["index block"], self.index_map, {"SCRP" : 2})
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write_index(self, data):
+        index_file = file(self.index_path, 'wb')
+        index_file.write(data)
+        index_file.close()
+
+    def test_load(self):
+        self.assertEqual(self.cache.load(self.index_path, "MI2"),
+                         (["index block"], self.index_map, {"SCRP" : 2}))
+
+    def test_other_game(self):
+        self.assertEqual(self.cache.load(self.index_path, "DOTT"), None)
+
+    def test_changed_index_file(self):
+        stat = os.stat(self.index_path)
+        self._write_index("MAXS")
+        os.utime(self.index_path, (stat.st_atime, stat.st_mtime)) # same size and time
+        self.assertEqual(self.cache.load(self.index_path, "MI2"), None)
+
+    def test_broken_cache_file(self):
+        cache_path = self.cache._get_cache_path(self.index_path, "MI2")
+        cache_file = file(cache_path, 'wb')
+        cache_file.write("not a pickle")
+        cache_file.close()
+        self.assertEqual(self.cache.load(self.index_path, "MI2"), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,273 @@
+from __future__ import with_statement
+import array
+import cStringIO
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as et
+import scummpacker_io as res_io
+import scummpacker_util as util
+
+class ResourceBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.plain = "LECF\x00\x00\x00\x10LOFF\x00\x00\x00\x08"
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, util.crypt(self.plain, 0x69))
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_read_decrypts(self):
+        with res_io.ResourceBuffer(self.path, 0x69) as resource:
+            self.assertEqual(resource.read(4), "LECF")
+            self.assertEqual(resource.tell(), 4)
+            self.assertEqual(resource.read(), self.plain[4:])
+            self.assertEqual(resource.read(4), "")
+
+    def test_read_without_crypt(self):
+        with res_io.ResourceBuffer(self.path) as resource:
+            self.assertEqual(resource.read(), util.crypt(self.plain, 0x69))
+
+    def test_read_from_data(self):
+        with res_io.ResourceBuffer("missing.001", 0x69, util.crypt(self.plain, 0x69)) as resource:
+            resource.seek(8)
+            self.assertEqual(resource.read(4), "LOFF")
+            self.assertEqual(resource.read(), self.plain[12:])
+
+    def test_read_ahead(self):
+        with res_io.ResourceBuffer(self.path, 0x69) as resource:
+            resource.seek(8)
+            self.assertEqual(resource.read_ahead(4), "LOFF")
+            self.assertEqual(resource.read_ahead(2, 6), "\x00\x08")
+            self.assertEqual(resource.tell(), 8)
+
+    def test_seek(self):
+        with res_io.ResourceBuffer(self.path, 0x69) as resource:
+            resource.seek(-4, os.SEEK_END)
+            self.assertEqual(resource.read(), "\x00\x00\x00\x08")
+            resource.seek(-8, os.SEEK_CUR)
+            self.assertEqual(resource.read(4), "LOFF")
+            self.assertRaises(IOError, resource.seek, -1)
+
+    def test_read_view(self):
+        with res_io.ResourceBuffer(self.path, 0x69) as resource:
+            resource.seek(4)
+            self.assertEqual(str(resource.read_view(4)), "\x00\x00\x00\x10")
+            self.assertEqual(resource.tell(), 8)
+
+class GroupLocationsTestCase(unittest.TestCase):
+    def test_groups_nearby_locations(self):
+        self.assertEqual(res_io.group_locations([300, 0, 100, 5000, 100], 1000),
+                         [[0, 100, 300], [5000]])
+
+    def test_empty(self):
+        self.assertEqual(res_io.group_locations([]), [])
+
+class ResourceSpanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.plain = "LECF\x00\x00\x00\x10LOFF\x00\x00\x00\x08"
+        self.resource = cStringIO.StringIO(util.crypt(self.plain, 0x69))
+
+    def test_read_uses_file_offsets(self):
+        span = res_io.ResourceSpan(self.resource, 8, 4, 0x69)
+        self.assertEqual(span.tell(), 8)
+        self.assertEqual(span.read(4), "LOFF")
+        self.assertEqual(span.tell(), 12)
+        self.assertEqual(span.end, 12)
+        span.seek(8)
+        self.assertEqual(span.read_ahead(4), "LOFF")
+        self.assertRaises(IOError, span.seek, -1)
+
+    def test_extend_to(self):
+        span = res_io.ResourceSpan(self.resource, 8, 4, 0x69)
+        span.extend_to(10)
+        self.assertEqual(span.reads, 1)
+        span.extend_to(16)
+        self.assertEqual(span.reads, 2)
+        span.seek(8)
+        self.assertEqual(span.read(), "LOFF\x00\x00\x00\x08")
+
+    def test_read_before_start(self):
+        span = res_io.ResourceSpan(self.resource, 8, 4)
+        span.seek(4)
+        self.assertRaises(IOError, span.read, 4)
+
+class RebasedBufferTestCase(unittest.TestCase):
+    def test_uses_resource_offsets(self):
+        buf = res_io.RebasedBuffer(100)
+        self.assertEqual(buf.tell(), 100)
+        buf.write("SCRP\x00\x00\x00\x08")
+        self.assertEqual(buf.tell(), 108)
+        buf.seek(104)
+        buf.write("\x00\x00\x00\x09")
+        self.assertEqual(buf.getvalue(), "SCRP\x00\x00\x00\x09")
+        self.assertRaises(IOError, buf.seek, 99)
+
+class MoveFileDataTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resource = cStringIO.StringIO()
+        self.resource.write("0123456789")
+
+    def test_move_forwards(self):
+        res_io.move_file_data(self.resource, 4, 3, chunk_size=2)
+        self.assertEqual(self.resource.getvalue(), "0123456456789")
+
+    def test_move_backwards(self):
+        res_io.move_file_data(self.resource, 4, -3, chunk_size=2)
+        self.assertEqual(self.resource.getvalue(), "0456789")
+
+    def test_no_move(self):
+        res_io.move_file_data(self.resource, 4, 0)
+        self.assertEqual(self.resource.getvalue(), "0123456789")
+
+class XorFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.plain = "LECF\x00\x00\x00\x10LOFF\x00\x00\x00\x08"
+        self.outfile = cStringIO.StringIO()
+
+    def test_write_encrypts(self):
+        xor_file = res_io.XorFile(self.outfile, 0x69)
+        xor_file.write(self.plain[:8])
+        xor_file.write(array.array('B', self.plain[8:]))
+        self.assertEqual(xor_file.tell(), 16)
+        xor_file.flush()
+        self.assertEqual(self.outfile.getvalue(), util.crypt(self.plain, 0x69))
+
+    def test_seek_back_and_overwrite(self):
+        xor_file = res_io.XorFile(self.outfile, 0x69)
+        xor_file.write("LECF\x00\x00\x00\x00")
+        xor_file.write(self.plain[8:])
+        xor_file.seek(4)
+        xor_file.write("\x00\x00\x00\x10")
+        xor_file.seek(0, os.SEEK_END)
+        self.assertEqual(xor_file.tell(), 16)
+        xor_file.flush()
+        self.assertEqual(self.outfile.getvalue(), util.crypt(self.plain, 0x69))
+
+    def test_read_decrypts(self):
+        self.outfile.write(util.crypt(self.plain, 0x69))
+        self.outfile.seek(0)
+        xor_file = res_io.XorFile(self.outfile, 0x69, buffer_size=4)
+        self.assertEqual(xor_file.read_ahead(4, 8), "LOFF")
+        self.assertEqual(xor_file.read(4), "LECF")
+        xor_file.seek(4, os.SEEK_CUR)
+        self.assertEqual(xor_file.read(), self.plain[8:])
+
+    def test_without_crypt(self):
+        xor_file = res_io.XorFile(self.outfile)
+        xor_file.write(self.plain)
+        xor_file.flush()
+        self.assertEqual(self.outfile.getvalue(), self.plain)
+
+    def test_seek_within_read_buffer(self):
+        self.outfile.write(util.crypt(self.plain, 0x69))
+        self.outfile.seek(0)
+        xor_file = res_io.XorFile(self.outfile, 0x69)
+        self.assertEqual(xor_file.read(8), "LECF\x00\x00\x00\x10")
+        xor_file.seek(-8, os.SEEK_CUR)
+        self.assertEqual(xor_file.read(4), "LECF")
+        xor_file.seek(8)
+        self.assertEqual(xor_file.read(4), "LOFF")
+        xor_file.write("\x00\x00\x00\x09")
+        xor_file.flush()
+        self.assertEqual(util.crypt(self.outfile.getvalue(), 0x69), self.plain[:-1] + "\x09")
+
+    def test_seekable(self):
+        self.assertTrue(res_io.XorFile(self.outfile).seekable())
+        self.assertTrue(res_io.is_seekable(self.outfile))
+        pipe_read, pipe_write = os.pipe()
+        os.close(pipe_read)
+        pipe = os.fdopen(pipe_write, 'wb')
+        try:
+            self.assertFalse(res_io.XorFile(pipe).seekable())
+            self.assertFalse(res_io.is_seekable(pipe))
+        finally:
+            pipe.close()
+
+class SavedBlock(object):
+    def __init__(self, name, saved):
+        self.name = name
+        self.saved = saved
+
+    def save_to_file(self, path):
+        if self.name == "fail":
+            raise IOError("Could not save " + path)
+        self.saved.append((self.name, path))
+
+class BlockWriterTestCase(unittest.TestCase):
+    def test_saves_in_order(self):
+        saved = []
+        with res_io.BlockWriter(max_pending=1) as block_writer:
+            for name in ("LOFF", "LFLF", "LFLF", "LECF"):
+                block_writer.save(SavedBlock(name, saved), "DISK01")
+        self.assertEqual(saved, [("LOFF", "DISK01"), ("LFLF", "DISK01"),
+                                 ("LFLF", "DISK01"), ("LECF", "DISK01")])
+
+    def test_error_is_raised_on_close(self):
+        saved = []
+        block_writer = res_io.BlockWriter()
+        block_writer.save(SavedBlock("fail", saved), "DISK01")
+        self.assertRaises(IOError, block_writer.close)
+        self.assertRaises(IOError, block_writer.save, SavedBlock("LFLF", saved), "DISK01")
+        self.assertEqual(saved, [])
+
+    def test_save_after_close(self):
+        block_writer = res_io.BlockWriter()
+        block_writer.close()
+        block_writer.close()
+        self.assertRaises(util.ScummPackerException, block_writer.save, SavedBlock("LFLF", []), "DISK01")
+
+class IncrementalOutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.path, "SCRP_001.dmp")
+        self.output_tracker = res_io.OutputTracker()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write(self, path, data):
+        with res_io.open_output_file(path, self.output_tracker) as outfile:
+            outfile.write(data)
+
+    def _read(self, path):
+        with file(path, 'rb') as infile:
+            return infile.read()
+
+    def test_writes_new_and_changed_files(self):
+        self._write(self.file_path, "script")
+        self.assertEqual(self._read(self.file_path), "script")
+        self._write(self.file_path, "scripts")
+        self.assertEqual(self._read(self.file_path), "scripts")
+        self.assertEqual(self.output_tracker.files_changed, 2)
+
+    def test_skips_unchanged_files(self):
+        self._write(self.file_path, "script")
+        os.utime(self.file_path, (1000000000, 1000000000))
+        self._write(self.file_path, "script")
+        self.assertEqual(os.path.getmtime(self.file_path), 1000000000)
+        self.assertEqual(self.output_tracker.files_unchanged, 1)
+
+    def test_removes_stale_paths(self):
+        room_path = os.path.join(self.path, "LFLF_001")
+        stale_path = os.path.join(self.path, "LFLF_002")
+        os.mkdir(stale_path)
+        self._write(os.path.join(self.path, "stale.dmp"), "old")
+        self.output_tracker = res_io.OutputTracker()
+        res_io.make_output_dir(self.path, self.output_tracker)
+        res_io.make_output_dir(room_path, self.output_tracker)
+        self._write(os.path.join(room_path, "SCRP_001.dmp"), "script")
+        res_io.write_xml_file(et.Element("order"), os.path.join(self.path, "order.xml"), self.output_tracker)
+        self.assertEqual(self.output_tracker.remove_stale_paths(), 2)
+        self.assertEqual(sorted(os.listdir(self.path)), ["LFLF_001", "order.xml"])
+        self.assertEqual(os.listdir(room_path), ["SCRP_001.dmp"])
+
+    def test_not_incremental(self):
+        self.output_tracker = None
+        self._write(self.file_path, "script")
+        self.assertEqual(self._read(self.file_path), "script")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+import scummpacker_manifest as manifest
+
+def _write_file(path, data):
+    out_file = file(path, 'wb')
+    out_file.write(data)
+    out_file.close()
+
+class HashDirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.path, "ROOM"))
+        _write_file(os.path.join(self.path, "SCRP_001.dmp"), "script")
+        _write_file(os.path.join(self.path, "ROOM", "RMHD.xml"), "<header />")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_unchanged(self):
+        self.assertEqual(manifest.hash_directory(self.path), manifest.hash_directory(self.path))
+
+    def test_changed_contents(self):
+        old_hash = manifest.hash_directory(self.path)
+        _write_file(os.path.join(self.path, "ROOM", "RMHD.xml"), "<header/>")
+        self.assertNotEqual(manifest.hash_directory(self.path), old_hash)
+
+    def test_renamed_file(self):
+        old_hash = manifest.hash_directory(self.path)
+        os.rename(os.path.join(self.path, "SCRP_001.dmp"), os.path.join(self.path, "SCRP_002.dmp"))
+        self.assertNotEqual(manifest.hash_directory(self.path), old_hash)
+
+class PackManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.resource_path = os.path.join(self.path, "MONKEY2.001")
+        self.manifest_path = os.path.join(self.path, manifest.MANIFEST_FILE_NAME)
+        _write_file(self.resource_path, "LECF")
+        pack_manifest = manifest.PackManifest("MI2")
+        pack_manifest.set_rooms(self.resource_path,
+                                [manifest.PackedRoom("LFLF_001", "abc", 32, 100,
+                                                     [("LFLF", (1, 0), 1), ("ROOM", 1, 8), ("SCRP", (1, 50), 4)])])
+        pack_manifest.save_to_file(self.manifest_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_save_and_load(self):
+        pack_manifest = manifest.PackManifest("MI2")
+        pack_manifest.load_from_file(self.manifest_path)
+        rooms = pack_manifest.get_rooms(self.resource_path)
+        self.assertEqual(rooms.keys(), ["LFLF_001"])
+        room = rooms["LFLF_001"]
+        self.assertEqual((room.content_hash, room.location, room.size), ("abc", 32, 100))
+        self.assertEqual(room.index_entries, [("LFLF", (1, 0), 1), ("ROOM", 1, 8), ("SCRP", (1, 50), 4)])
+
+    def test_other_game(self):
+        pack_manifest = manifest.PackManifest("DOTT")
+        pack_manifest.load_from_file(self.manifest_path)
+        self.assertEqual(pack_manifest.get_rooms(self.resource_path), {})
+
+    def test_changed_resource_file(self):
+        _write_file(self.resource_path, "LECF and then some")
+        pack_manifest = manifest.PackManifest("MI2")
+        pack_manifest.load_from_file(self.manifest_path)
+        self.assertEqual(pack_manifest.get_rooms(self.resource_path), {})
+
+    def test_missing_manifest(self):
+        pack_manifest = manifest.PackManifest("MI2")
+        pack_manifest.load_from_file(os.path.join(self.path, "missing.xml"))
+        self.assertEqual(pack_manifest.get_rooms(self.resource_path), {})
+
+if __name__ == '__main__':
+    unittest.main()
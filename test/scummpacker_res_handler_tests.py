@@ -0,0 +1,149 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import scummpacker_manifest as manifest
+import scummpacker_res_handler as res_handler
+import scummpacker_storage as storage
+import scummpacker_util as util
+import synthetic_game
+
+class MessageRecorder(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class RoundTripTests(object):
+    """ Packs and unpacks a synthetic game (see synthetic_game) through the
+    library functions. Mixed into a TestCase for each game."""
+    game = None
+    grown_file = None # (path in the unpacked game, block name) of a resource to make bigger
+    shrunk_file = None # and one to make smaller, in another room
+    reused_messages = None # logged by an incremental pack after grown_file's room is edited
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.unpacked_path = os.path.join(self.path, "unpacked")
+        synthetic_game.write_game(self.game, self.unpacked_path)
+        self.packed_path = self._pack(self.unpacked_path, "packed")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _pack(self, input_path, output_name, **options):
+        output_path = os.path.join(self.path, output_name)
+        res_handler.pack(input_path, output_path, game=self.game, **options)
+        return output_path
+
+    def _unpack(self, input_path, output_name, **options):
+        output_path = os.path.join(self.path, output_name)
+        res_handler.unpack(input_path, output_path, game=self.game, **options)
+        return output_path
+
+    def _edit(self, edited_file, size):
+        """ Replaces a resource in the unpacked game with a block of a new
+        size. Returns the path of its file."""
+        path, name = edited_file
+        path = os.path.join(self.unpacked_path, path)
+        out_file = file(path, 'wb')
+        out_file.write(synthetic_game.BLOCK_FUNCTIONS[self.game](name, "z" * size))
+        out_file.close()
+        return path
+
+    def _pack_and_record_messages(self, input_path, output_name, **options):
+        util.add_normal_logging_level()
+        recorder = MessageRecorder()
+        logger = logging.getLogger()
+        old_handlers, old_level = logger.handlers, logger.level
+        logger.handlers = [recorder]
+        logger.setLevel(logging.NORMAL)
+        try:
+            self._pack(input_path, output_name, **options)
+        finally:
+            logger.handlers = old_handlers
+            logger.setLevel(old_level)
+        return recorder.messages
+
+    def test_round_trip(self):
+        unpacked_path = self._unpack(self.packed_path, "unpacked_again")
+        repacked_path = self._pack(unpacked_path, "repacked")
+        self.assertEqual(synthetic_game.read_files(repacked_path), synthetic_game.read_files(self.packed_path))
+
+    def test_parallel_pack(self):
+        packed_path = self._pack(self.unpacked_path, "packed_in_parallel", jobs=4)
+        self.assertEqual(synthetic_game.read_files(packed_path), synthetic_game.read_files(self.packed_path))
+
+    def test_parallel_unpack(self):
+        unpacked_path = self._unpack(self.packed_path, "unpacked_serially")
+        parallel_unpacked_path = self._unpack(self.packed_path, "unpacked_in_parallel", jobs=4)
+        self.assertEqual(synthetic_game.read_files(parallel_unpacked_path), synthetic_game.read_files(unpacked_path))
+
+    def test_memory_round_trip(self):
+        memory = storage.MemoryStorage()
+        memory.makedir("game")
+        original_files = synthetic_game.read_files(self.packed_path)
+        for name, data in original_files.items():
+            memory.write_data(os.path.join("game", name), data)
+        res_handler.unpack("game", "unpacked", game=self.game, backend=memory)
+        res_handler.pack("unpacked", "repacked", game=self.game, backend=memory)
+        self.assertEqual(sorted(memory.listdir("repacked")), sorted(original_files))
+        for name, data in original_files.items():
+            self.assertEqual(memory.read_data(os.path.join("repacked", name)), data)
+
+    def test_patch(self):
+        patches_path = os.path.join(self.path, "patches")
+        os.mkdir(patches_path)
+        shutil.copy(self._edit(self.grown_file, 100), patches_path)
+        shutil.copy(self._edit(self.shrunk_file, 2), patches_path)
+        patched_path = os.path.join(self.path, "patched")
+        shutil.copytree(self.packed_path, patched_path)
+        self.assertEqual(len(res_handler.patch(patches_path, patched_path, game=self.game)), 2)
+        repacked_path = self._pack(self.unpacked_path, "repacked")
+        self.assertEqual(synthetic_game.read_files(patched_path), synthetic_game.read_files(repacked_path))
+
+    def test_incremental_pack(self):
+        self._pack(self.unpacked_path, "incremental", incremental=True)
+        self._edit(self.grown_file, 50)
+        messages = self._pack_and_record_messages(self.unpacked_path, "incremental", incremental=True)
+        self.assertEqual([message for message in messages if message.startswith("Reusing")], self.reused_messages)
+        incremental_files = synthetic_game.read_files(os.path.join(self.path, "incremental"))
+        del incremental_files[manifest.MANIFEST_FILE_NAME]
+        repacked_path = self._pack(self.unpacked_path, "repacked")
+        self.assertEqual(incremental_files, synthetic_game.read_files(repacked_path))
+
+class UnpackIndexOnlyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_parallel_unpack(self):
+        """ With no resource files, there are no rooms to unpack in parallel."""
+        unpacked_path = os.path.join(self.path, "unpacked")
+        packed_path = os.path.join(self.path, "packed")
+        synthetic_game.write_game("MI2", unpacked_path)
+        res_handler.pack(unpacked_path, packed_path, game="MI2")
+        os.remove(os.path.join(packed_path, "MONKEY2.001"))
+        output_path = os.path.join(self.path, "unpacked_again")
+        res_handler.unpack(packed_path, output_path, game="MI2", jobs=2)
+        self.assertEqual(sorted(os.listdir(output_path)), ["dobj.xml", "maxs.xml", "roomnames.xml"])
+
+class MI2RoundTripTestCase(RoundTripTests, unittest.TestCase):
+    game = "MI2" # one resource file, so rooms are unpacked in parallel
+    grown_file = (os.path.join("MONKEY2", "LECF", "LFLF_002", "SCRP_003.dmp"), "SCRP")
+    shrunk_file = (os.path.join("MONKEY2", "LECF", "LFLF_001", "COST_001.dmp"), "COST")
+    reused_messages = ["Reusing 2 of 3 rooms from the last pack."]
+
+class LoomCDRoundTripTestCase(RoundTripTests, unittest.TestCase):
+    game = "LOOMCD" # two resource files, unpacked in parallel
+    grown_file = (os.path.join("DISK01", "LE", "LF_011", "SC_011.dmp"), "SC")
+    shrunk_file = (os.path.join("DISK02", "LE", "LF_020", "CO_020.dmp"), "CO")
+    reused_messages = ["Reusing 2 of 3 rooms from the last pack.", "Reusing 3 of 3 rooms from the last pack."]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+from __future__ import absolute_import # "dispatchers" is also a test package
+import cStringIO
+import struct
+import unittest
+try:
+    import json
+except ImportError:
+    json = None # Python 2.5
+import scummpacker_control as control
+import scummpacker_skeleton as skeleton
+import dispatchers
+
+def _block(name, data):
+    return name + struct.pack(">I", len(data) + 8) + data
+
+def _sound_block(name, data):
+    """ Sound blocks' sizes don't include their headers."""
+    return name + struct.pack(">I", len(data)) + data
+
+def _resource_file():
+    """ A v5 resource file with one room (number 7), holding a script and a
+    sound."""
+    room = _block("ROOM", _block("RMHD", "\x00" * 6))
+    sound = _block("SOUN", _sound_block("SOU ", _sound_block("ADL ", "abcd" * 5)))
+    room_start = 8 + 8 + 6 # LECF header, LOFF block
+    room_offset = room_start + 8 # the ROOM block, just after the LFLF header
+    offsets = _block("LOFF", "\x01" + struct.pack("<BI", 7, room_offset))
+    return _block("LECF", offsets + _block("LFLF", room + _block("SCRP", "abcd") + sound))
+
+class IterSkeletonTestCase(unittest.TestCase):
+    def setUp(self):
+        global_args = control.GlobalArguments()
+        global_args.set_args(scumm_version="5", game="MI2", input_file_name="MI2", output_file_name=None,
+                             unpack=False, pack=False, list=True)
+        self.context = control.PackContext(global_args)
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory("5"))
+        self.context.block_dispatcher.use_external_crypt()
+        self.context.disk_spanning_counter = 1
+        self.resource = cStringIO.StringIO(_resource_file())
+        self.context.block_dispatcher.dispatch_root_block().read_room_offsets(self.resource)
+        self.room_offset = 30
+        self.script_location = self.room_offset + 22
+        self.context.global_index_map.map_index("SCRP", (7, self.script_location - self.room_offset), 12)
+
+    def _list(self):
+        return list(skeleton.iter_skeleton(self.context, self.context.block_dispatcher, self.resource, "MONKEY2.001"))
+
+    def test_paths(self):
+        self.assertEqual([entry.path for entry in self._list()],
+                         ["LECF", "LECF/LOFF", "LECF/LFLF_007", "LECF/LFLF_007/ROOM", "LECF/LFLF_007/ROOM/RMHD",
+                          "LECF/LFLF_007/SCRP_012", "LECF/LFLF_007/SOUN", "LECF/LFLF_007/SOUN/SOU",
+                          "LECF/LFLF_007/SOUN/SOU/ADL"])
+
+    def test_entries(self):
+        entries = self._list()
+        self.assertEqual([entry.is_container for entry in entries],
+                         [True, False, True, True, False, False, True, True, False])
+        script = entries[5]
+        self.assertEqual((script.name, script.index, script.room, script.location, script.size),
+                         ("SCRP", 12, 7, self.script_location, 12))
+        self.assertEqual(entries[0].size, len(self.resource.getvalue()))
+
+    def test_text_listing(self):
+        out = cStringIO.StringIO()
+        writer = skeleton.TextListingWriter(out)
+        for entry in self._list():
+            writer.write(entry)
+        writer.close()
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ["0", str(len(self.resource.getvalue())), "MONKEY2.001/LECF/"])
+        self.assertEqual(lines[5].split(), [str(self.script_location), "12", "MONKEY2.001/LECF/LFLF_007/SCRP_012"])
+        self.assertEqual(lines[-1].split(), ["SOUN", "1", "blocks", "44", "bytes"])
+        self.assertEqual(writer.totals["SCRP"], [1, 12])
+
+    def test_json_listing(self):
+        if json is None:
+            return
+        out = cStringIO.StringIO()
+        writer = skeleton.JsonListingWriter(out)
+        for entry in self._list():
+            writer.write(entry)
+        writer.close()
+        listing = json.loads(out.getvalue())
+        self.assertEqual(len(listing["blocks"]), 9)
+        self.assertEqual(listing["blocks"][5]["index"], 12)
+        self.assertEqual(listing["totals"]["ADL"], {"count" : 1, "size" : 28})
+
+class IterBlockHeadersTestCase(unittest.TestCase):
+    def test_stops_at_overrun(self):
+        index_dispatcher, dispatcher, file_dispatcher, indexed_blocks = dispatchers.DispatcherFactory("5")
+        dispatcher.use_external_crypt()
+        data = _block("RNAM", "\x00") + "MAXS" + struct.pack(">I", 100) + "\x00\x00"
+        blocks = list(skeleton.iter_block_headers(dispatcher, cStringIO.StringIO(data), 0, len(data)))
+        self.assertEqual([(block.name, location) for block, location, data_location in blocks], [("RNAM", 0)])
+
+    def test_stops_at_short_header(self):
+        index_dispatcher, dispatcher, file_dispatcher, indexed_blocks = dispatchers.DispatcherFactory("5")
+        dispatcher.use_external_crypt()
+        data = _block("RNAM", "\x00") + "ADL " + struct.pack(">I", 4) + "abcd" # no room for ADL's MDHD header
+        blocks = list(skeleton.iter_block_headers(dispatcher, cStringIO.StringIO(data), 0, len(data)))
+        self.assertEqual([block.name for block, location, data_location in blocks], ["RNAM"])
+
+if __name__ == '__main__':
+    unittest.main()
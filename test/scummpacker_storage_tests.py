@@ -0,0 +1,160 @@
+from __future__ import with_statement
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import xml.etree.ElementTree as et
+import scummpacker_io as res_io
+import scummpacker_manifest as manifest
+import scummpacker_storage as storage
+import scummpacker_util as util
+
+class IsArchivePathTestCase(unittest.TestCase):
+    def test_is_archive_path(self):
+        self.assertTrue(storage.is_archive_path(os.path.join("temp", "MI2.zip")))
+        self.assertTrue(storage.is_archive_path("MI2.ZIP"))
+        self.assertFalse(storage.is_archive_path(os.path.join("temp", "MI2")))
+        self.assertFalse(storage.is_archive_path(None))
+
+class ZipStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.archive_path = os.path.join(self.path, "MI2.zip")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write_archive(self, compress=False):
+        out_storage = storage.ZipStorage(self.archive_path, 'w', compress)
+        room_path = os.path.join(self.archive_path, "LECF", "LFLF_001")
+        out_storage.makedir(os.path.join(self.archive_path, "LECF"))
+        out_storage.makedir(room_path)
+        out_storage.makedir(os.path.join(room_path, "ROOM"))
+        out_file = out_storage.open_write(os.path.join(room_path, "SCRP_001.dmp"))
+        out_file.write("SCRP")
+        out_file.write("\x00\x00\x00\x0C" + "data")
+        out_file.close()
+        out_storage.write_xml(et.Element("order"), os.path.join(self.archive_path, "LECF", "order.xml"))
+        out_storage.close()
+
+    def test_write_and_read(self):
+        self._write_archive()
+        in_storage = storage.ZipStorage(self.archive_path)
+        room_path = os.path.join(self.archive_path, "LECF", "LFLF_001")
+        self.assertEqual(in_storage.listdir(self.archive_path), ["LECF"])
+        self.assertEqual(in_storage.listdir(os.path.join(self.archive_path, "LECF")), ["LFLF_001", "order.xml"])
+        self.assertEqual(in_storage.listdir(room_path), ["ROOM", "SCRP_001.dmp"])
+        self.assertEqual(in_storage.listdir(os.path.join(room_path, "ROOM")), [])
+        self.assertTrue(in_storage.isdir(self.archive_path))
+        self.assertTrue(in_storage.isdir(room_path))
+        self.assertFalse(in_storage.isfile(room_path))
+        script_path = os.path.join(room_path, "SCRP_001.dmp")
+        self.assertTrue(in_storage.isfile(script_path))
+        self.assertFalse(in_storage.isdir(script_path))
+        self.assertEqual(in_storage.getsize(script_path), 12)
+        in_file = in_storage.open_read(script_path)
+        in_file.seek(4)
+        self.assertEqual(in_file.read(4), "\x00\x00\x00\x0C")
+        self.assertEqual(in_file.tell(), 8)
+        in_file.close()
+        tree = in_storage.parse_xml(os.path.join(self.archive_path, "LECF", "order.xml"))
+        self.assertEqual(tree.getroot().tag, "order")
+        in_storage.close()
+
+    def test_compress(self):
+        self._write_archive(True)
+        archive = zipfile.ZipFile(self.archive_path)
+        info = archive.getinfo("LECF/LFLF_001/SCRP_001.dmp")
+        archive.close()
+        self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+        in_storage = storage.ZipStorage(self.archive_path)
+        in_file = in_storage.open_read(os.path.join(self.archive_path, "LECF", "LFLF_001", "SCRP_001.dmp"))
+        self.assertEqual(in_file.read(), "SCRP\x00\x00\x00\x0Cdata")
+        in_file.close()
+        in_storage.close()
+
+    def test_missing_member(self):
+        self._write_archive()
+        in_storage = storage.ZipStorage(self.archive_path)
+        self.assertRaises(IOError, in_storage.open_read, os.path.join(self.archive_path, "LECF", "missing.dmp"))
+        self.assertRaises(IOError, in_storage.listdir, os.path.join(self.archive_path, "missing"))
+        self.assertFalse(in_storage.isdir(self.path))
+        in_storage.close()
+
+    def test_not_an_archive(self):
+        out_file = file(self.archive_path, 'wb')
+        out_file.write("not a zip archive")
+        out_file.close()
+        self.assertRaises(util.ScummPackerException, storage.ZipStorage, self.archive_path)
+
+    def test_hash_directory(self):
+        """ Directories hash the same in an archive as on disk."""
+        self._write_archive()
+        archive = zipfile.ZipFile(self.archive_path)
+        archive.extractall(self.path)
+        archive.close()
+        in_storage = storage.ZipStorage(self.archive_path)
+        room_path = os.path.join("LECF", "LFLF_001")
+        self.assertEqual(manifest.hash_directory(os.path.join(self.archive_path, room_path), in_storage),
+                         manifest.hash_directory(os.path.join(self.path, room_path)))
+        in_storage.close()
+
+class MemoryStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = storage.MemoryStorage()
+        self.room_path = os.path.join("MI2", "LECF", "LFLF_001")
+        self.storage.makedirs(self.room_path)
+
+    def test_directories(self):
+        self.assertTrue(self.storage.isdir("MI2"))
+        self.assertTrue(self.storage.isdir(os.path.join("MI2", "LECF", "..", "LECF")))
+        self.assertTrue(self.storage.isdir(os.curdir))
+        self.assertEqual(self.storage.listdir(os.curdir), ["MI2"])
+        self.assertEqual(self.storage.listdir(os.path.join("MI2", "LECF")), ["LFLF_001"])
+        self.assertFalse(self.storage.isdir("DOTT"))
+        self.assertRaises(IOError, self.storage.listdir, "DOTT")
+        self.assertRaises(IOError, self.storage.makedir, os.path.join("DOTT", "LECF"))
+
+    def test_write_and_read(self):
+        script_path = os.path.join(self.room_path, "SCRP_001.dmp")
+        out_file = self.storage.open_write(script_path)
+        out_file.write("SCRP\x00\x00\x00\x0C")
+        self.assertFalse(self.storage.isfile(script_path)) # not until it's closed
+        out_file.write("data")
+        out_file.close()
+        self.assertTrue(self.storage.isfile(script_path))
+        self.assertFalse(self.storage.isdir(script_path))
+        self.assertEqual(self.storage.getsize(script_path), 12)
+        self.assertEqual(self.storage.listdir(self.room_path), ["SCRP_001.dmp"])
+        in_file = self.storage.open_read(script_path)
+        in_file.seek(8)
+        self.assertEqual(in_file.read(), "data")
+        in_file.close()
+        self.assertRaises(IOError, self.storage.open_read, os.path.join(self.room_path, "SCRP_002.dmp"))
+        self.assertRaises(IOError, self.storage.open_write, os.path.join("DOTT", "SCRP_001.dmp"))
+        self.assertRaises(IOError, self.storage.makedir, script_path)
+
+    def test_update(self):
+        path = os.path.join("MI2", "MONKEY2.001")
+        self.storage.write_data(path, "LECF\x00\x00\x00\x10LOFF\x00\x00\x00\x08")
+        update_file = self.storage.open_update(path)
+        res_io.move_file_data(update_file, 8, -8)
+        update_file.seek(0)
+        update_file.write("LE")
+        update_file.close()
+        self.assertEqual(self.storage.read_data(path), "LEFF\x00\x00\x00\x08")
+
+    def test_xml(self):
+        path = os.path.join("MI2", "LECF", "order.xml")
+        self.storage.write_xml(et.Element("order"), path)
+        self.assertEqual(self.storage.parse_xml(path).getroot().tag, "order")
+
+    def test_buffer(self):
+        path = os.path.join("MI2", "MONKEY2.000")
+        self.storage.write_data(path, util.crypt("RNAM\x00\x00\x00\x09\x00", 0x69))
+        with self.storage.open_buffer(path, 0x69) as index_file:
+            self.assertEqual(index_file.read(4), "RNAM")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import array
+import unittest
+import xml.etree.ElementTree as et
+import scummpacker_util as util
+
+class CryptTestCase(unittest.TestCase):
+    def setUp(self):
+        self.plain = "LFLF\x00\x00\x01\x00\xff"
+        self.crypted = ''.join([chr(ord(c) ^ 0x69) for c in self.plain])
+
+    def test_crypt_str(self):
+        self.assertEqual(util.crypt(self.plain, 0x69), self.crypted)
+        self.assertEqual(util.crypt(self.crypted, 0x69), self.plain)
+
+    def test_crypt_array(self):
+        plain = array.array('B', self.plain)
+        result = util.crypt(plain, 0x69)
+        self.assert_(type(result) is array.ArrayType)
+        self.assertEqual(result.tostring(), self.crypted)
+        # The input must not be modified.
+        self.assertEqual(plain.tostring(), self.plain)
+
+    def test_crypt_bytearray(self):
+        result = util.crypt(bytearray(self.plain), 0x69)
+        self.assert_(type(result) is bytearray)
+        self.assertEqual(str(result), self.crypted)
+
+    def test_crypt_memoryview(self):
+        result = util.crypt(memoryview(self.plain), 0x69)
+        self.assertEqual(result, self.crypted)
+
+    def test_crypt_none(self):
+        data = array.array('B', self.plain)
+        self.assert_(util.crypt(data, None) is data)
+
+    def test_crypt_unsupported_type(self):
+        self.assertRaises(util.ScummPackerException, util.crypt, 1234, 0x69)
+
+class IntCodecTestCase(unittest.TestCase):
+    def test_int2str(self):
+        self.assertEqual(util.int2str(0x12345678), "\x78\x56\x34\x12")
+        self.assertEqual(util.int2str(0x1234, 2, util.BE), "\x12\x34")
+        self.assertEqual(util.int2str(0x123456, 3), "\x56\x34\x12")
+        # Out of range values wrap around
+        self.assertEqual(util.int2str(-1, 2), "\xff\xff")
+        self.assertEqual(util.int2str(0x1FF, 1), "\xff")
+        self.assertEqual(util.int2str(1, 1, crypt_val=0x69), "\x68")
+
+    def test_str2int(self):
+        self.assertEqual(util.str2int("\x78\x56\x34\x12"), 0x12345678)
+        self.assertEqual(util.str2int("\x12\x34", util.BE), 0x1234)
+        self.assertEqual(util.str2int("\x56\x34\x12"), 0x123456)
+        self.assertEqual(util.str2int("\x68", crypt_val=0x69), 1)
+
+    def test_str2ints(self):
+        data = "\x01\x10\x00\x00\x00\x02\x20\x00\x00\x00"
+        self.assertEqual(util.str2ints(data, 'BI', 2), (1, 0x10, 2, 0x20))
+        self.assertEqual(util.str2ints(data[:2], 'B', 2), (1, 0x10))
+        self.assertEqual(util.str2ints(util.crypt(data, 0x69), 'BI', 2, crypt_val=0x69), (1, 0x10, 2, 0x20))
+        self.assertEqual(util.str2ints("", 'I', 0), ())
+
+    def test_ints2str(self):
+        values = [1, 0x10, 2, 0x20]
+        data = util.ints2str(values, 'BI')
+        self.assertEqual(data, "\x01\x10\x00\x00\x00\x02\x20\x00\x00\x00")
+        self.assertEqual(util.ints2str(values, 'BI', util.BE, 0x69), util.crypt("\x01\x00\x00\x00\x10\x02\x00\x00\x00\x20", 0x69))
+        self.assertEqual(util.ints2str(values, 'H'), "\x01\x00\x10\x00\x02\x00\x20\x00")
+
+class _Record(object):
+    pass
+
+class StructCodecTestCase(unittest.TestCase):
+    def setUp(self):
+        self.codec = util.StructCodec({
+            'size' : 5,
+            'format' : "<HBh",
+            'attributes' : ('obj_id', 'flags', 'x')
+        })
+
+    def test_round_trip(self):
+        record = _Record()
+        self.codec.unpack_into(record, "\x01\x02\x03\xff\xff")
+        self.assertEqual((record.obj_id, record.flags, record.x), (0x201, 3, -1))
+        self.assertEqual(self.codec.pack_from(record), "\x01\x02\x03\xff\xff")
+
+    def test_wrong_size(self):
+        self.assertRaises(util.ScummPackerException, util.StructCodec,
+                          {'size' : 4, 'format' : "<HBh", 'attributes' : ('a', 'b', 'c')})
+
+class CompiledXMLStructureTestCase(unittest.TestCase):
+    structure = (
+        ("id", 'i', 'obj_id'),
+        ("image", 'n', (
+            ("flags", 'h', 'flags'),
+            ("width", 'i', 'header.width'),
+            ("extra", 'c', 'extra_callback')
+            )
+        ),
+    )
+
+    def setUp(self):
+        self.record = _Record()
+        self.record.header = _Record()
+        self.record.callbacks = []
+        self.record.extra_callback = lambda node, mode: self.record.callbacks.append((node.tag, mode))
+
+    def test_round_trip(self):
+        self.record.obj_id = 12
+        self.record.flags = 255
+        self.record.header.width = 320
+        root = et.Element("root")
+        util.compile_xml_structure(self.structure).write(self.record, root)
+        self.assertEqual(root.find("image/flags").text, "0xff")
+        self.assertEqual(root.find("image/width").text, "320")
+
+        result = _Record()
+        result.header = _Record()
+        result.extra_callback = self.record.extra_callback
+        util.xml_helper.read(result, root, self.structure)
+        self.assertEqual((result.obj_id, result.flags, result.header.width), (12, 255, 320))
+        self.assertEqual(self.record.callbacks, [("extra", util.XMLHelper.WRITE), ("extra", util.XMLHelper.READ)])
+
+    def test_compiled_once(self):
+        self.assert_(util.compile_xml_structure(self.structure) is util.compile_xml_structure(self.structure))
+
+    def test_unknown_marshaller(self):
+        self.assertRaises(util.ScummPackerException, util.compile_xml_structure, (("id", 'x', 'obj_id'),))
+
+class OrderedSortTestCase(unittest.TestCase):
+    def test_ordered_sort(self):
+        m = [101, 102, 103, 104, 107, 106, 105] # values
+        o = [105, 104, 101, 102, 103] # sorted order
+        self.assertEqual(util.ordered_sort(m, o), [105, 104, 101, 102, 103, 107, 106])
+
+    def test_build_position_map(self):
+        self.assertEqual(util.build_position_map(["a", "b", "a", "c"]), {"a" : 0, "b" : 1, "c" : 3})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+from __future__ import absolute_import # "dispatchers" is also a test package
+import os
+import unittest
+import scummpacker_control as control
+import scummpacker_storage as storage
+import scummpacker_validate as validator
+import dispatchers
+import blocks
+
+OBJECT_HEADER = """<object>
+  <name>obj100</name>
+  <id>%d</id>
+  <image><num_images>%d</num_images></image>
+  <code><x>1</x></code>
+</object>"""
+
+class ValidateUnpackedGameTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = storage.MemoryStorage()
+        global_args = control.GlobalArguments()
+        global_args.set_args(scumm_version="5", game="MI2", input_file_name="MI2", output_file_name="packed",
+                             unpack=False, pack=True)
+        self.context = control.PackContext(global_args, self.memory)
+        self.context.assign_dispatchers(*dispatchers.DispatcherFactory("5"))
+        self.res_path = os.path.join("MI2", "MONKEY2")
+        self.room_path = os.path.join(self.res_path, "LECF", "LFLF_001")
+        self.memory.makedirs(os.path.join(self.room_path, "ROOM", "objects"))
+        self.memory.makedir(os.path.join(self.room_path, "ROOM", "scripts"))
+        self._write_file(os.path.join("ROOM", "scripts", "ENCD.dmp"))
+        self._write_file(os.path.join("ROOM", "scripts", "EXCD.dmp"))
+        self._write_file("SCRP_001.dmp")
+        self._write_object("0100_obj100", 100)
+
+        maxs = blocks.BlockMAXSV5(4, None, self.context)
+        maxs.char_sets = 5
+        maxs.local_objects = 2
+        dscr = blocks.BlockIndexDirectoryV5(4, None, self.context)
+        dscr.name = "DSCR"
+        self.index_block = self.context.index_dispatcher
+        self.index_block.children = [maxs, dscr]
+
+    def _write_file(self, name):
+        self.memory.write_data(os.path.join(self.room_path, name), "")
+
+    def _write_object(self, dir_name, obj_id, num_images=1, verb=True):
+        path = os.path.join(self.room_path, "ROOM", "objects", dir_name)
+        self.memory.makedir(path)
+        self.memory.write_data(os.path.join(path, "OBHD.xml"), OBJECT_HEADER % (obj_id, num_images))
+        self.memory.makedir(os.path.join(path, "IM01"))
+        if verb:
+            self.memory.write_data(os.path.join(path, "VERB.dmp"), "")
+
+    def _validate(self):
+        return validator.validate_unpacked_game(self.context, self.index_block, [self.res_path])
+
+    def test_valid(self):
+        self.assertEqual(self._validate(), [])
+
+    def test_missing_script(self):
+        self.room_path = os.path.join(self.res_path, "LECF", "LFLF_002")
+        self.memory.makedirs(os.path.join(self.room_path, "ROOM", "scripts"))
+        self._write_file(os.path.join("ROOM", "scripts", "ENCD.dmp"))
+        problems = self._validate()
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith(os.path.join(self.room_path, "ROOM", "scripts")))
+        self.assertTrue("EXCD" in problems[0])
+
+    def test_object_problems(self):
+        self._write_object("0101_obj101", 101, num_images=2, verb=False)
+        self._write_object("0102_obj102", 100)
+        problems = self._validate()
+        self.assertEqual(len(problems), 4)
+        self.assertTrue("3 objects" in problems[0]) # more than MAXS allows
+        self.assertTrue(problems[1].endswith("(2) does not match the number of image directories (1)"))
+        self.assertTrue("VERB.dmp" in problems[2])
+        self.assertTrue(problems[3].endswith("object 100 is also in 0100_obj100"))
+
+    def test_resource_numbers(self):
+        self._write_file("SCRP_199.dmp")
+        self._write_file("CHAR_005.dmp")
+        self._write_file("CHAR_004.dmp")
+        problems = self._validate()
+        self.assertEqual(len(problems), 2)
+        self.assertTrue(problems[0].endswith("CHAR_005.dmp: resource number 5 is out of range (MAXS has 5 entries)"))
+        self.assertTrue(problems[1].endswith("SCRP_199.dmp: resource number 199 is out of range (DSCR has 199 entries)"))
+
+class MapInThreadsTestCase(unittest.TestCase):
+    def test_map(self):
+        self.assertEqual(validator._map_in_threads(lambda i: i * 2, range(20), 4), range(0, 40, 2))
+
+    def test_error(self):
+        def fail(i):
+            if i == 5:
+                raise ValueError(i)
+            return i
+        self.assertRaises(ValueError, validator._map_in_threads, fail, range(10), 3)
+
+if __name__ == '__main__':
+    unittest.main()
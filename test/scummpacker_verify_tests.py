@@ -0,0 +1,55 @@
+from __future__ import absolute_import # "dispatchers" is also a test package
+import cStringIO
+import struct
+import unittest
+import scummpacker_verify as verifier
+import dispatchers
+
+def _block(name, data):
+    return name + struct.pack(">I", len(data) + 8) + data
+
+def _resource_file(scripts):
+    """ A v5 resource file with a room for each script."""
+    rooms = "".join([_block("LFLF", _block("SCRP", script)) for script in scripts])
+    return _block("LECF", _block("LOFF", "\x00") + rooms)
+
+class CompareResourceFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        index_dispatcher, self.dispatcher, file_dispatcher, indexed_blocks = dispatchers.DispatcherFactory("5")
+        self.dispatcher.use_external_crypt()
+        self.original = _resource_file(["abcd", "efgh"])
+
+    def _compare(self, repacked):
+        return verifier.compare_resource_files(self.dispatcher, cStringIO.StringIO(self.original),
+                                               cStringIO.StringIO(repacked), "MONKEY2.001")
+
+    def test_same(self):
+        difference, compared = self._compare(self.original)
+        self.assertEqual(difference, None)
+        self.assertEqual(compared, 4) # LECF header, LOFF, and two rooms
+
+    def test_changed_data(self):
+        difference, compared = self._compare(_resource_file(["abcd", "efXh"]))
+        self.assertEqual(difference.path, "LECF[1]/LFLF[2]/SCRP[1]")
+        self.assertEqual(difference.offset, self.original.index("efgh") + 2)
+        self.assertEqual(compared, 4)
+
+    def test_changed_size(self):
+        difference, compared = self._compare(_resource_file(["abcde", "efgh"]))
+        self.assertEqual(difference.path, "LECF[1]/header")
+        self.assertEqual(difference.offset, 7) # the last byte of the LECF size
+
+    def test_missing_block(self):
+        self.original = _block("RNAM", "\x00") + _block("MAXS", "\x01\x00")
+        difference, compared = self._compare(_block("RNAM", "\x00"))
+        self.assertEqual(difference.path, "MAXS[1]")
+        self.assertEqual(difference.offset, 9)
+        self.assertEqual(difference.reason, verifier.MISSING_BLOCK)
+
+    def test_extra_data(self):
+        difference, compared = self._compare(self.original + "\x00")
+        self.assertEqual(difference.path, None)
+        self.assertEqual(difference.offset, len(self.original))
+
+if __name__ == '__main__':
+    unittest.main()
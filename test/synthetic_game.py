@@ -0,0 +1,132 @@
+""" Writes small unpacked games, as saved by unpack, for tests that pack and
+unpack a whole game. Every block is made up; the games only have to pack and
+unpack to the same bytes, not run."""
+import os
+import struct
+
+def _write(path, data):
+    dir_name = os.path.dirname(path)
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+    out_file = file(path, 'wb')
+    out_file.write(data)
+    out_file.close()
+
+def block_v5(name, data):
+    return name + struct.pack(">I", len(data) + 8) + data
+
+def block_v4(name, data):
+    return struct.pack("<I", len(data) + 6) + name + data
+
+OBJECT_ENTRY = "<object-entry><id>%d</id><owner>%d</owner><state>%d</state><class-data>0x%x</class-data></object-entry>"
+
+V5_MAXS = ["variables", "unknown_1", "bit_variables", "local_objects", "unknown_2", "character_sets",
+           "unknown_3", "unknown_4", "inventory_objects"]
+
+V5_OBHD = """<object><name>obj%d</name><id>%d</id>
+<image><x>1</x><y>2</y><width>8</width><height>8</height><flags>0x0</flags><unknown>0x0</unknown><num_images>1</num_images><num_zplanes>0</num_zplanes></image>
+<code><x>1</x><y>2</y><width>8</width><height>8</height><flags>0x0</flags><parent>0</parent><walk_x>3</walk_x><walk_y>4</walk_y><actor_dir>1</actor_dir></code>
+</object>"""
+
+V4_OBHD = """<object><name>thing</name><id>%d</id>
+<code><x>1</x><y>2</y><width>3</width><height>8</height><unknown>0x0</unknown><parent_state>0x0</parent_state><parent>0x0</parent><walk_x>3</walk_x><walk_y>4</walk_y><actor_dir>1</actor_dir></code>
+</object>"""
+
+def write_mi2(path, num_rooms=3):
+    """ A SCUMM v5 game (MI2): one resource file (MONKEY2.001), with
+    num_rooms rooms, each with two scripts, a costume and a sound."""
+    _write(os.path.join(path, "roomnames.xml"), "<room_names>" +
+           "".join(["<room><id>%d</id><name>room%d</name></room>" % (i, i) for i in xrange(1, num_rooms + 1)]) +
+           "</room_names>")
+    _write(os.path.join(path, "maxs.xml"), "<maximums>" +
+           "".join(["<%s>%d</%s>" % (name, i, name) for i, name in enumerate(V5_MAXS)]) + "</maximums>")
+    _write(os.path.join(path, "dobj.xml"), "<object-directory>" +
+           "".join([OBJECT_ENTRY % (i, i % 16, (i * 3) % 16, i * 1234567) for i in xrange(1, 40)]) +
+           "</object-directory>")
+    script_num = 1
+    for room_num in xrange(1, num_rooms + 1):
+        room_path = os.path.join(path, "MONKEY2", "LECF", "LFLF_%03d" % room_num)
+        room_block_path = os.path.join(room_path, "ROOM")
+        _write(os.path.join(room_block_path, "RMHD.xml"),
+               "<room><width>320</width><height>200</height><num_objects>2</num_objects></room>")
+        _write(os.path.join(room_block_path, "CYCL.dmp"), block_v5("CYCL", "\x00" * 9))
+        _write(os.path.join(room_block_path, "TRNS.dmp"), block_v5("TRNS", "\x00\x05"))
+        _write(os.path.join(room_block_path, "CLUT.dmp"), block_v5("CLUT", "c" * 48))
+        _write(os.path.join(room_block_path, "BOXD.dmp"), block_v5("BOXD", "b" * (10 + room_num)))
+        _write(os.path.join(room_block_path, "BOXM.dmp"), block_v5("BOXM", "m" * 7))
+        _write(os.path.join(room_block_path, "SCAL.dmp"), block_v5("SCAL", "s" * 16))
+        _write(os.path.join(room_block_path, "RMIM", "RMIH.xml"), "<room_image><num_zbuffers>1</num_zbuffers></room_image>")
+        _write(os.path.join(room_block_path, "RMIM", "IM00", "SMAP.dmp"), block_v5("SMAP", "S" * (50 + room_num)))
+        _write(os.path.join(room_block_path, "RMIM", "IM00", "ZP01.dmp"), block_v5("ZP01", "Z" * 20))
+        for object_num in xrange(2):
+            object_id = 100 * room_num + object_num
+            object_path = os.path.join(room_block_path, "objects", "%04d_obj%d" % (object_id, object_id))
+            _write(os.path.join(object_path, "OBHD.xml"), V5_OBHD % (object_id, object_id))
+            _write(os.path.join(object_path, "VERB.dmp"), block_v5("VERB", "\x01\x02\x03\x00" + "v" * 5))
+            _write(os.path.join(object_path, "IM01", "SMAP.dmp"), block_v5("SMAP", "o" * 12))
+        scripts_path = os.path.join(room_block_path, "scripts")
+        _write(os.path.join(scripts_path, "ENCD.dmp"), block_v5("ENCD", "e" * 5))
+        _write(os.path.join(scripts_path, "EXCD.dmp"), block_v5("EXCD", "x" * 5))
+        for local_script_num in (200, 201):
+            _write(os.path.join(scripts_path, "LSCR_%03d.dmp" % local_script_num),
+                   block_v5("LSCR", chr(local_script_num) + "l" * 9))
+        for i in xrange(2):
+            _write(os.path.join(room_path, "SCRP_%03d.dmp" % script_num), block_v5("SCRP", "g" * (20 + script_num)))
+            script_num += 1
+        _write(os.path.join(room_path, "COST_%03d.dmp" % room_num), block_v5("COST", "k" * 33))
+        _write(os.path.join(room_path, "SOUN_%03d" % room_num, "SOU", "ADL.mid"), "MThd" + "a" * 20)
+
+def write_loomcd(path, num_rooms=3):
+    """ A SCUMM v4 game (Loom CD): two resource files (DISK01.LEC and
+    DISK02.LEC), with num_rooms rooms each, each room with a script, a costume
+    and a sound."""
+    _write(os.path.join(path, "dobj.xml"), "<object-directory>" +
+           "".join([OBJECT_ENTRY % (i, i % 16, (i * 3) % 16, i * 1234) for i in xrange(1, 20)]) +
+           "</object-directory>")
+    for disk_num in (1, 2):
+        for room_num in xrange(disk_num * 10, disk_num * 10 + num_rooms):
+            room_path = os.path.join(path, "DISK%02d" % disk_num, "LE", "LF_%03d" % room_num)
+            room_block_path = os.path.join(room_path, "RO")
+            _write(os.path.join(room_block_path, "HD.xml"),
+                   "<room><width>320</width><height>144</height><num_objects>1</num_objects></room>")
+            _write(os.path.join(room_block_path, "BX.dmp"), block_v4("BX", "b" * 9))
+            _write(os.path.join(room_block_path, "PA.dmp"), block_v4("PA", "p" * 12))
+            _write(os.path.join(room_block_path, "BM.dmp"), block_v4("BM", "B" * (40 + room_num)))
+            object_id = 10 * room_num
+            object_path = os.path.join(room_block_path, "objects", "%04d_thing" % object_id)
+            _write(os.path.join(object_path, "OBHD.xml"), V4_OBHD % object_id)
+            _write(os.path.join(object_path, "OI.dmp"), block_v4("OI", struct.pack("<H", object_id) + "i" * 10))
+            _write(os.path.join(object_path, "OC.dmp"), block_v4("OC", struct.pack("<H", object_id) + "\x00" * 10 +
+                                                                chr(20) + "\x0e" + "thing\x00" + "scr"))
+            scripts_path = os.path.join(room_block_path, "scripts")
+            _write(os.path.join(scripts_path, "EN.dmp"), block_v4("EN", "e" * 4))
+            _write(os.path.join(scripts_path, "EX.dmp"), block_v4("EX", "x" * 4))
+            _write(os.path.join(scripts_path, "LS_%03d.dmp" % (200 + room_num)),
+                   block_v4("LS", chr(200 + room_num) + "l" * 6))
+            _write(os.path.join(room_path, "SC_%03d.dmp" % room_num), block_v4("SC", "s" * (room_num + 3)))
+            _write(os.path.join(room_path, "CO_%03d.dmp" % room_num), block_v4("CO", "c" * 11))
+            _write(os.path.join(room_path, "SO_%03d" % room_num, "AD.dmp"), block_v4("AD", "a" * 12))
+
+GAMES = {
+    "MI2" : write_mi2,
+    "LOOMCD" : write_loomcd
+}
+
+BLOCK_FUNCTIONS = {
+    "MI2" : block_v5,
+    "LOOMCD" : block_v4
+}
+
+def write_game(game, path):
+    GAMES[game](path)
+
+def read_files(path):
+    """ Returns a map of relative path -> contents for every file under path."""
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            full_path = os.path.join(dir_path, file_name)
+            in_file = file(full_path, 'rb')
+            files[full_path[len(path) + 1:]] = in_file.read()
+            in_file.close()
+    return files